@@ -3,3 +3,6 @@ from . import data
 data = data.Data() #Global object data instantiated on import required for access by GeneQuery Objects
 
 from .candi import (Gene, CellLine, Organelle, Cancer, CellLineCluster, GeneCluster)
+from ..structures.telemetry import (stats, profile, enable, disable, reset, to_chrome_trace, to_openmetrics)
+from ..structures.cache import slice_cache
+from ..pipelines.parallel import map_genes, map_lines, MapError
@@ -6,6 +6,8 @@ import pandas as pd
 import numpy as np
 from . import data, grabber
 from ..structures import entity
+from ..structures.telemetry import instrument
+from ..structures.memo import memo
 
 class SubsetHandler(object):
 
@@ -15,6 +17,7 @@ class SubsetHandler(object):
     Automates finding what type of argument the user provided.
     """
 
+    @instrument("SubsetHandler.__call__")
     def __call__(self, arg, dat):
 
         if arg is None:
@@ -119,6 +122,20 @@ class Gene(entity.Entity):
     def get_name(self):
         return self.symbol
 
+    def pan_cancer_summary(self, by="primary_disease"):
+        """Returns summary statistics of the gene in every group of cell lines.
+
+        Args:
+            by: str, optional
+                column of data.cell_lines defining the groups, "primary_disease" or "lineage_subtype"
+        Returns:
+            pandas.core.frame.DataFrame
+                one row per group with mean, median, sd and n of every dataset, the fraction of essential,
+                dependent and expressed lines and the mutation frequency
+        """
+        from ..pipelines.summary import gene_summary
+        return gene_summary(self.symbol, by)
+
     def _get_mut_subset(self, mut_dat, subset):
 
         cases = {str: lambda x: Cancer(x).depmap_ids,
@@ -208,6 +225,28 @@ class CellLine(entity.Entity):
     def get_name(self):
         return self.depmap_id
 
+    def similar(self, k=10, by="expression", within=None, n_components=50, metric="cosine"):
+        """Returns the cell lines most similar to this one.
+        Lines are compared on a PCA embedding of a dataset that is built once and memoized, see CanDI.pipelines.similarity.
+
+        Args:
+            k: int, optional
+                number of cell lines returned
+            by: str, optional
+                "expression", "gene_effect", "gene_dependency" or any gene by cell line dataset, or "mutations"
+            within: list, Cancer or CellLineCluster, optional
+                only search these cell lines
+            n_components: int, optional
+                dimensions of the embedding
+            metric: str, optional
+                "cosine" or "euclidean"
+        Returns:
+            pandas.core.series.Series
+                similarities (cosine) or distances (euclidean) indexed by DepMap_ID, most similar first
+        """
+        from ..pipelines.similarity import similar
+        return similar(self.depmap_id, k, by, within, n_components, metric)
+
     def _get_mut_subset(self, mut_dat, subset):
 
         if type(subset) is str and subset in data.locations.location.unique():
@@ -243,6 +282,13 @@ class Cancer(entity.Entity):
         if source:
             info = info.loc[info.source == source]
 
+        if gender or source or all_except:
+            self._summary_group = None #not a group of the summary cube
+        elif subtype is None:
+            self._summary_group = ("primary_disease", disease)
+        else:
+            self._summary_group = ("lineage_subtype", subtype)
+
         self.disease = disease
         self.depmap_ids = list(info.index)
         self.names = list(info.cell_line_name)
@@ -259,6 +305,32 @@ class Cancer(entity.Entity):
     def get_name(self):
         return self.disease
 
+    def summary(self, items=None):
+        """Returns summary statistics of every gene across the cell lines of the cancer.
+        Diseases and subtypes are served from the precomputed summary cube, filtered cohorts are aggregated on demand.
+
+        Args:
+            items: str or list, optional
+                only return these genes
+        Returns:
+            pandas.core.frame.DataFrame
+                one row per gene with mean, median, sd and n of every dataset, the fraction of essential,
+                dependent and expressed lines and the mutation frequency
+        """
+        from ..pipelines.summary import group_summary, cohort_summary
+
+        if self._summary_group is None:
+            df = cohort_summary(self.depmap_ids)
+        else:
+            df = group_summary(*self._summary_group)
+
+        if items is None:
+            return df
+        return df.reindex([items] if isinstance(items, str) else list(items))
+
+    amutation_matrix = entity.awaitable("mutation_matrix", ("mutations",))
+
+    @memo.memoize(uses=("mutations",))
     def mutation_matrix(self, subset=None):
         """Returns binary n by m dataframe with DepMap_IDs as rows and gene symbols as columns.
 
@@ -331,6 +403,9 @@ class CellLineCluster(entity.Entity):
         self._grabber = grabber.Grabber("canc", self.depmap_ids, self._axis)
         self._subset_handler = SubsetHandler()
 
+    amutation_matrix = entity.awaitable("mutation_matrix", ("mutations",))
+
+    @memo.memoize(uses=("mutations",))
     def mutation_matrix(self, subset=None):
         """Returns binary n by m dataframe with DepMap_IDs as rows and gene symbols as columns.
 
@@ -9,6 +9,9 @@ import pandas as pd
 import numpy as np
 import sys
 import subprocess
+from ..structures.telemetry import instrument
+from ..structures.cache import slice_cache
+from ..structures import aio, export
 
 
 class Data(object):
@@ -16,7 +19,18 @@ class Data(object):
     can be tuned to load specific datasets upon import by editing config.ini
     can call Data.load() to load any specific dataset
     """
-    def __init__(self, config_path='auto', verbose=False):
+    def __init__(self, config_path='auto', verbose=False, release=None):
+
+        if release is not None: #open a release kept in the multi-release store
+            from ..setup.store import ReleaseStore
+            config_path = ReleaseStore().config_path(release)
+            if not os.path.exists(config_path):
+                raise FileNotFoundError("Release {} is not in the data store".format(release))
+
+        elif config_path == 'auto' and os.environ.get("CANDI_CONFIG"): #points candi at an install outside the package
+            config_path = os.environ["CANDI_CONFIG"]
+
+        self.release = release
 
         if config_path == 'auto':
             self._file_path = Path(os.path.dirname(os.path.realpath(__file__))).parent.absolute() / 'setup'
@@ -30,8 +44,10 @@ class Data(object):
         elif os.path.exists(config_path) == False:
             raise FileNotFoundError("Config file not found at {}".format(config_path))
         elif os.path.exists(config_path) == True:
+            self._file_path = Path(config_path).parent.parent.absolute() #data paths are relative to the manager directory
             if verbose: print("Using config file at {}".format(config_path))
 
+        self.config_path = config_path
         parser = configparser.ConfigParser() #parses config for data sources
         parser.read(config_path)
 
@@ -101,6 +117,10 @@ class Data(object):
                              dtype={"ENTREZ ID":str},
                              index_col = "Approved symbol")
 
+        elif method == "cell_lines" and Path(path).suffix == ".parquet":
+
+            df = pd.read_parquet(path).set_index("DepMap_ID")
+
         elif method == "cell_lines":
 
             df = pd.read_csv(path,
@@ -117,6 +137,7 @@ class Data(object):
         return df
 
 
+    @instrument("Data.load", label=lambda args: args[1])
     def load(self, key):
         """This function loads a dataset into memory as a pandas DataFrame.
         
@@ -139,18 +160,45 @@ class Data(object):
             except AttributeError:
                 raise RuntimeError("CanDI is not compatible with python2. Please ensure you're using Python3.")
 
-            df = pd.read_csv(new_path,
-                             memory_map = True,
-                             low_memory = False,
-                             index_col = index)
+            if Path(new_path).suffix == ".parquet": #written by the streaming installer
+                df = pd.read_parquet(new_path)
+                if index is not None:
+                    df.set_index(index, inplace=True)
+            else:
+                df = pd.read_csv(new_path,
+                                 memory_map = True,
+                                 low_memory = False,
+                                 index_col = index)
 
             setattr(self, key, df)
+            slice_cache.invalidate(key) #slices of a previous load are stale
             return getattr(self, key)
 
         else:
             raise KeyError("{0} cannot find file {1}".format(self, key))
 
 
+    async def aload(self, key):
+        """Awaitable version of :func:`load` that reads the dataset on the CanDI thread pool.
+        Concurrent calls for the same dataset share one read, a dataset that is already loaded is returned as is.
+
+        Args:
+            key: str
+               name of dataset to load into memory
+        Returns:
+            pandas.core.frame.DataFrame
+        """
+        if isinstance(getattr(self, key, None), pd.DataFrame):
+            return getattr(self, key)
+
+        return await aio.coalesce(("load", id(self), key), self._load_once, key)
+
+    def _load_once(self, key): #a coalesced load may start after another one finished
+
+        dataset = getattr(self, key, None)
+        return dataset if isinstance(dataset, pd.DataFrame) else self.load(key)
+
+
     def unload(self, key):
         """This function removes a dataset from memory
         
@@ -168,7 +216,200 @@ class Data(object):
             raise RuntimeError("{} is not currently loaded into memory".format(key))
             
         
-        new_path = self._depmap_path / self._parser.get("depmap_files", key)
+        new_path = self.path(key)
         assert os.path.exists(new_path)
         setattr(self, key, new_path)
-        
+        slice_cache.invalidate(key)
+
+
+    def path(self, key):
+        """Returns the path of the file a dataset is loaded from.
+
+        Args:
+            key: str
+                name of the dataset
+        Returns:
+            pathlib.Path
+        """
+        return self._depmap_path / self._parser.get("depmap_files", key)
+
+
+    def iter_chunks(self, key, chunk_size=1000, columns=None):
+        """This function iterates over a dataset in blocks of rows without loading the whole file.
+
+        Args:
+            key: str
+                name of dataset to iterate over
+            chunk_size: int, optional
+                number of rows per block
+            columns: list, optional
+                only keep these columns (eg. DepMap_IDs of a gene by cell line dataset)
+        Returns:
+            generator
+                yields pandas DataFrames. Slices of the DataFrame if the dataset is loaded, otherwise blocks read from file.
+        """
+        dataset = getattr(self, key, None)
+        if dataset is None:
+            raise KeyError("{0} cannot find file {1}".format(self, key))
+
+        if isinstance(dataset, pd.DataFrame):
+            if columns is not None:
+                dataset = dataset.reindex(columns=[i for i in columns if i in dataset.columns])
+            for start in range(0, dataset.shape[0], chunk_size):
+                yield dataset.iloc[start:start + chunk_size]
+            return
+
+        index = self._parser.get("index", key, fallback=None)
+
+        if Path(dataset).suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            parquet = pq.ParquetFile(dataset)
+            if columns is not None:
+                columns = set(columns)
+                columns = [i for i in parquet.schema_arrow.names if i == index or i in columns]
+
+            for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+                chunk = batch.to_pandas()
+                yield chunk.set_index(index) if index is not None else chunk
+            return
+
+        usecols = None
+        if columns is not None:
+            columns = set(columns)
+            usecols = lambda x: x == index or x in columns
+
+        for chunk in pd.read_csv(dataset, chunksize=chunk_size, low_memory=False,
+                                 index_col=index, usecols=usecols):
+            yield chunk
+
+
+    def _axes(self, key, columns=None):
+        """Returns the row index and the columns iter_chunks yields for a dataset.
+        Only the index column of a file is read, the values are not parsed.
+        """
+        dataset = getattr(self, key, None)
+        index = self._parser.get("index", key, fallback=None)
+        if isinstance(dataset, pd.DataFrame):
+            names = list(dataset.columns) if columns is None else [i for i in columns if i in dataset.columns]
+            return list(dataset.index), names
+
+        if index is None: #rows are numbered while they are read
+            rows, names = [], []
+            for chunk in self.iter_chunks(key, 10000, columns):
+                rows.extend(chunk.index)
+                names = list(chunk.columns)
+            return rows, names
+
+        if Path(dataset).suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            names = pq.ParquetFile(dataset).schema_arrow.names
+            rows = pq.read_table(dataset, columns=[index]).column(index).to_pylist()
+        else:
+            names = list(pd.read_csv(dataset, nrows=0).columns)
+            rows = list(pd.read_csv(dataset, usecols=[index], low_memory=False)[index])
+
+        keep = None if columns is None else set(columns)
+        return rows, [i for i in names if i != index and (keep is None or i in keep)]
+
+
+    def export(self, key, path, file_format="parquet", columns=None, compression="zstd", chunk_size=1000):
+        """This function streams a dataset to a Parquet or Arrow IPC file one block of rows at a time.
+        Column types are those of the whole dataset, csv files are scanned once for them before they are written.
+
+        Args:
+            key: str
+                name of the dataset to export
+            path: str
+                output file
+            file_format: str, optional
+                "parquet" or "arrow"
+            columns: list, optional
+                only export these columns (eg. DepMap_IDs of a gene by cell line dataset)
+            compression: str, optional
+                "zstd", "snappy", "lz4" or None
+            chunk_size: int, optional
+                number of rows per row group
+        Returns:
+            int
+                number of rows written
+        """
+        metadata = export.describe(self, dataset=key, columns=columns)
+        schema = export.dataset_schema(self, key)
+        return export.write(self.iter_chunks(key, chunk_size, columns), path, file_format, compression, metadata, schema)
+
+
+    def to_anndata(self, key, path=None, cohort=None, file_format="h5ad", chunk_size=1000, dtype="float32"):
+        """This function writes a gene by cell line dataset to an on disk AnnData store.
+        The matrix is streamed from the dataset in blocks of genes, so it never has to fit in memory.
+        Requires the anndata extra, pip install PyCanDI[anndata].
+
+        Args:
+            key: str
+                name of the dataset to export (eg. "rnaseq_reads", "expression")
+            path: str, optional
+                output path. Defaults to <key>.<file_format> in the depmap data directory.
+            cohort: list, Cancer or CellLineCluster, optional
+                only export these cell lines
+            file_format: str, optional
+                "h5ad" or "zarr"
+            chunk_size: int, optional
+                number of genes streamed per block, also the chunk size of the stored matrix
+            dtype: str, optional
+                dtype of the stored matrix
+        Returns:
+            anndata.AnnData
+                opened in backed mode for "h5ad" stores
+            str
+                path of "zarr" stores, which can be opened with anndata.read_zarr or dask
+        """
+        import anndata as ad
+
+        assert file_format in ["h5ad", "zarr"], "file_format must be 'h5ad' or 'zarr'"
+
+        if path is None:
+            path = self._depmap_path / "{0}.{1}".format(key, file_format)
+        path = str(path)
+
+        if cohort is not None:
+            cohort = list(getattr(cohort, "depmap_ids", cohort))
+
+        #var and obs come from the index column alone, the matrix is then written block by block
+        genes, lines = self._axes(key, cohort)
+
+        obs = self.cell_lines.reindex(lines)
+        obs.index = obs.index.astype(str)
+        var = self.genes.reindex(genes)
+        var.index = pd.Index(genes, dtype=str)
+
+        skeleton = ad.AnnData(obs=obs, var=var)
+        if file_format == "h5ad":
+            import h5py
+            skeleton.write_h5ad(path)
+            store = h5py.File(path, "a")
+            matrix = store.create_dataset("X", shape=(len(lines), len(genes)), dtype=dtype,
+                                          chunks=(min(len(lines), chunk_size), min(len(genes), chunk_size)))
+        else:
+            import zarr
+            skeleton.write_zarr(path)
+            store = zarr.open_group(path, mode="a")
+            create = getattr(store, "create_array", None) or store.create_dataset
+            matrix = create("X", shape=(len(lines), len(genes)), dtype=dtype,
+                            chunks=(min(len(lines), chunk_size), min(len(genes), chunk_size)))
+
+        matrix.attrs["encoding-type"] = "array"
+        matrix.attrs["encoding-version"] = "0.2.0"
+
+        start = 0
+        for chunk in self.iter_chunks(key, chunk_size, cohort):
+            matrix[:, start:start + chunk.shape[0]] = chunk.reindex(columns=lines).to_numpy(dtype=dtype).T
+            start += chunk.shape[0]
+
+        if file_format == "h5ad":
+            store.close()
+            return ad.read_h5ad(path, backed="r")
+
+        zarr.consolidate_metadata(path) #anndata reads the consolidated metadata, which does not list X yet
+        return path
+
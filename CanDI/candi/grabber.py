@@ -1,6 +1,9 @@
 import numpy as np
+import pandas as pd
 from pathlib import Path
 from . import data
+from ..structures.telemetry import instrument
+from ..structures.cache import slice_cache, MISSING
 
 class Grabber:
     """"Grabber class handles all bulk data retrival from the CanDI Classes.
@@ -10,27 +13,107 @@ class Grabber:
     def __init__(self, grabber_type, key, axis):
 
         self.key = key
+        self.grabber_type = grabber_type
         self.gtype = getattr(self, grabber_type) #dict of with data as key and retrieval function as value
         self._isin_col = self.isin_dict[axis] #isin is a special type of subseting fuction
         self.axis = axis #different classes are indexed on different axes
+        self._cache_key = tuple(key) if isinstance(key, (list, np.ndarray)) else key
 
+    @instrument("Grabber.__call__", label=lambda args: args[1])
     def __call__(self, item):
         """Core Grabber function, uses gtype dict to gather data.
+        Slices are shared between all objects through the slice cache and are read only,
+        copy a slice before modifying it.
         """
-        if item not in dir(data):
+        if item not in self.gtype or getattr(data, item, None) is None:
             raise AttributeError("data has no attribute {}".format(item))
 
+        key = (item, self.grabber_type, self._cache_key)
+        values = slice_cache.get(key)
+        if values is not MISSING:
+            return values
+
+        generation = slice_cache.generation(item)
         dataset = getattr(data, item)
         if isinstance(dataset, Path):
 
             to_load = input("{} has not been loaded. Do you want to load, y/n?> ".format(item))
             if to_load == ("y" or "Y" or "Yes"):
                 dataset = data.load(item)
+                generation = slice_cache.generation(item)
                 print("Load Complete")
             else:
                 return
 
-        return self.gtype[item](dataset)
+        values = self.gtype[item](dataset)
+        return slice_cache.put(key, values, generation)
+
+    def iter_blocks(self, item, block_size=2000, axis=0):
+        """Yields the grabber's slice of a gene by cell line dataset in blocks.
+        Blocks of a loaded dataset are taken directly from it, datasets on disk are streamed,
+        so the whole slice is never materialized.
+
+        Args:
+            item: str
+                name of a gene by cell line dataset
+            block_size: int, optional
+                number of genes (axis=0) or cell lines (axis=1) per block
+            axis: int, optional
+                0 yields blocks of genes with all of the slice's cell lines, 1 blocks of cell lines
+        Returns:
+            generator
+                yields pandas DataFrames with genes as rows and cell lines as columns
+        """
+        if self.gtype.get(item) not in (self.get_one, self.get_several):
+            raise ValueError("{} is not a gene by cell line dataset".format(item))
+        if getattr(data, item, None) is None:
+            raise AttributeError("data has no attribute {}".format(item))
+
+        key = [self.key] if isinstance(self.key, str) else list(self.key)
+        genes, lines = (key, None) if self.grabber_type in ("gene", "org") else (None, key)
+        dataset = getattr(data, item)
+
+        if isinstance(dataset, Path):
+            yield from self._iter_file_blocks(item, genes, lines, block_size, axis)
+            return
+
+        rows = np.arange(dataset.shape[0]) if genes is None else _positions(dataset.index, genes)
+        cols = slice(None) if lines is None else _positions(dataset.columns, lines)
+
+        if axis == 0:
+            for start in range(0, len(rows), block_size):
+                block = rows[start:start + block_size]
+                if genes is None: #consecutive rows, a view of the dataset when all columns are kept
+                    block = slice(block[0], block[-1] + 1)
+                yield dataset.iloc[block, cols]
+        else:
+            cols = np.arange(dataset.shape[1]) if lines is None else cols
+            for start in range(0, len(cols), block_size):
+                yield dataset.iloc[rows, cols[start:start + block_size]]
+
+    @staticmethod
+    def _iter_file_blocks(item, genes, lines, block_size, axis):
+
+        if axis == 0:
+            wanted = None if genes is None else set(genes)
+            pending = []
+            for chunk in data.iter_chunks(item, block_size, lines):
+                if wanted is not None:
+                    chunk = chunk.loc[chunk.index.isin(wanted)]
+                pending.append(chunk)
+                if sum(len(i) for i in pending) >= block_size:
+                    block = pd.concat(pending)
+                    pending = [block.iloc[block_size:]]
+                    yield block.iloc[:block_size]
+            block = pd.concat(pending) if pending else None
+            if block is not None and len(block):
+                yield block
+        else:
+            if lines is None:
+                lines = list(next(data.iter_chunks(item, 1)).columns)
+            for start in range(0, len(lines), block_size):
+                block = pd.concat(data.iter_chunks(item, 10000, lines[start:start + block_size]))
+                yield block if genes is None else block.reindex([i for i in genes if i in block.index])
 
     # """The following functions are the methods used for data retrival.
     # All datasets are loaded as pandas dataframes. These functions apply
@@ -46,7 +129,7 @@ class Grabber:
         except KeyError:
             return
 
-        return series
+        return series.copy() #a row or column can be a view of the dataset, the cached slice must not be
 
     def get_several(self, dataset): #Get several elements from user defined dataset
 
@@ -151,3 +234,9 @@ class Grabber:
                 #"complexes": self.get_several,
                 #"translocations": self.merge_two,
                 #"interactions": self.merge_two}
+
+
+def _positions(index, keys):
+    """Positions of the keys found in index, in the order of keys."""
+    positions = index.get_indexer(keys)
+    return positions[positions >= 0]
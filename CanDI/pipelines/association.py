@@ -0,0 +1,148 @@
+"""Batched mutation by dependency (or expression, copy number) association scans.
+The mutant/wild-type design for every recurrently mutated gene is built once
+from the mutations table and all tests are computed with matrix products
+on the response matrix, one block of mutated genes at a time.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .utils import get_dataset, cohort_ids
+from .differential import _scan, _rank
+
+
+def mutation_design(lines, mutations="mutations", min_mutants=1, variant=None, item=None):
+    """Builds a sparse binary cell line by gene mutation matrix.
+
+    Note:
+        Like :func:`mutated <candi.Entity.mutated>`, silent mutations are dropped unless variant and item are given.
+    Args:
+        lines: list
+            DepMap_IDs that define the rows of the matrix
+        mutations: str or pandas.core.frame.DataFrame, optional
+            mutation table with gene and DepMap_ID columns
+        min_mutants: int, optional
+            minimum number of mutant lines for a gene to be kept
+        variant: str, optional
+            column in mutations data set for specific filtering
+        item: str or list, optional
+            value(s) in variant column for filtering
+    Returns:
+        scipy.sparse.csc_matrix
+            lines by genes matrix, 1 where the gene is mutated in the line
+        pandas.core.indexes.base.Index
+            gene symbols of the columns
+    """
+    mut_dat = get_dataset(mutations)
+
+    if variant and item:
+        item = [item] if isinstance(item, str) else list(item)
+        mut_dat = mut_dat.loc[mut_dat[variant].isin(item)]
+    elif "Variant_Classification" in mut_dat.columns:
+        mut_dat = mut_dat.loc[mut_dat["Variant_Classification"] != "Silent"]
+
+    lines = pd.Index(lines)
+    rows = lines.get_indexer(mut_dat["DepMap_ID"])
+    keep = rows >= 0
+    genes, cols = np.unique(mut_dat["gene"].to_numpy()[keep].astype(str), return_inverse=True)
+
+    design = sparse.csc_matrix((np.ones(keep.sum()), (rows[keep], cols)), shape=(len(lines), len(genes)))
+    design.data[:] = 1 #a line with several mutations in the same gene counts once
+
+    recurrent = np.asarray(design.sum(axis=0)).ravel() >= min_mutants
+
+    return design[:, recurrent], pd.Index(genes[recurrent], name="mutation")
+
+
+def mutation_scan(response="gene_effect", mutations="mutations", cohort=None, min_mutants=5,
+                  max_fdr=0.05, test="t", variant=None, item=None, block_size=256):
+    """Tests every recurrently mutated gene against every gene of a response dataset.
+
+    For each mutated gene the cell lines are split into mutant and wild type and every row
+    of the response is compared between them with a Welch t-test and a Mann-Whitney U test.
+
+    Args:
+        response: str or pandas.core.frame.DataFrame, optional
+            gene by cell line dataset, eg. "gene_effect", "expression" or "gene_cn"
+        mutations: str or pandas.core.frame.DataFrame, optional
+            mutation table with gene and DepMap_ID columns
+        cohort: list, Cancer or CellLineCluster, optional
+            restrict the scan to these cell lines
+        min_mutants: int, optional
+            minimum number of mutant and of wild type lines with a response value
+        max_fdr: float, optional
+            only associations with BH-FDR at or below this value are returned. Use 1.0 to return every test.
+        test: str, optional
+            "t" or "u", test whose p-values are used for the FDR and ranking
+        variant: str, optional
+            column in mutations data set for specific filtering
+        item: str or list, optional
+            value(s) in variant column for filtering
+        block_size: int, optional
+            number of mutated genes tested per matrix product, bounds peak memory
+    Returns:
+        pandas.core.frame.DataFrame
+            one row per significant (mutation, gene) pair ranked by p-value. diff is mean(mutant) - mean(wild type),
+            so negative diffs on gene_effect mean mutant lines are more dependent.
+    """
+    assert test in ["t", "u"], "test must be 't' or 'u'"
+
+    df = get_dataset(response)
+    lines = df.columns
+    if cohort is not None:
+        lines = lines[lines.isin(cohort_ids(cohort))]
+
+    design, muts = mutation_design(lines, mutations, min_mutants, variant, item)
+    if design.shape[1] == 0:
+        raise ValueError("no gene is mutated in at least {} cell lines".format(min_mutants))
+
+    values = df[lines].to_numpy(dtype=float)
+    ranks = _rank(values)
+    pkey = test + "_pvalue"
+
+    pvalues = []
+    hits = []
+    for start in range(0, design.shape[1], block_size):
+        block = design[:, start:start + block_size].toarray().astype(bool)
+        out = _scan(values, block, min_mutants, ranks)
+        pvalues.append(out[pkey].ravel())
+
+        #BH adjusted p-values are never below the raw p-value, so this keeps every possible hit
+        gene_idx, mut_idx = np.nonzero(out[pkey] <= max_fdr)
+        hits.append(pd.DataFrame({"mutation": muts[start + mut_idx],
+                                  "gene": df.index[gene_idx],
+                                  "n_mutant": out["n_1"][gene_idx, mut_idx].astype(int),
+                                  "n_wildtype": out["n_2"][gene_idx, mut_idx].astype(int),
+                                  "mean_mutant": out["mean_1"][gene_idx, mut_idx],
+                                  "mean_wildtype": out["mean_2"][gene_idx, mut_idx],
+                                  "diff": out["diff"][gene_idx, mut_idx],
+                                  "cohens_d": out["cohens_d"][gene_idx, mut_idx],
+                                  "t_stat": out["t_stat"][gene_idx, mut_idx],
+                                  "t_pvalue": out["t_pvalue"][gene_idx, mut_idx],
+                                  "auc": out["auc"][gene_idx, mut_idx],
+                                  "u_pvalue": out["u_pvalue"][gene_idx, mut_idx]}))
+
+    #FDR over the full family of tests, sorted p-values are enough to place each hit
+    pvalues = np.concatenate(pvalues)
+    pvalues = np.sort(pvalues[~np.isnan(pvalues)])
+    res = pd.concat(hits, ignore_index=True)
+    res["fdr"] = _fdr_of(res[pkey].to_numpy(), pvalues)
+
+    res = res.loc[res.fdr <= max_fdr].sort_values(pkey, kind="mergesort").reset_index(drop=True)
+    res.attrs["n_tests"] = len(pvalues)
+
+    return res
+
+
+def _fdr_of(pvals, family):
+    """BH-FDR of a subset of p-values within a larger sorted family of p-values.
+    """
+    n = len(family)
+    if n == 0 or len(pvals) == 0:
+        return np.full(len(pvals), np.nan)
+
+    adjusted = np.minimum.accumulate((family * n / np.arange(1, n + 1))[::-1])[::-1]
+    adjusted = np.minimum(adjusted, 1.0)
+    pos = np.searchsorted(family, pvals, side="right") - 1
+
+    return adjusted[pos]
@@ -0,0 +1,173 @@
+"""Vectorized differential dependency and expression between cohorts of cell lines.
+Every gene is tested at once: group sums come from an indicator matrix product
+and ranks are computed once per gene for all comparisons.
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .utils import get_dataset, cohort_ids, bh_fdr
+
+
+def differential(group1, group2, dataset, min_lines=3):
+    """Compares two cohorts of cell lines on every gene of a matrix dataset.
+
+    Args:
+        group1: list, Cancer or CellLineCluster
+            cell lines of the tested cohort
+        group2: list, Cancer or CellLineCluster
+            cell lines of the reference cohort
+        dataset: str or pandas.core.frame.DataFrame
+            gene by cell line dataset (eg. "gene_effect", "expression")
+        min_lines: int, optional
+            minimum number of non missing values required in each cohort for a gene to be tested
+    Returns:
+        pandas.core.frame.DataFrame
+            one row per gene with cohort means, effect sizes, Welch t and Mann-Whitney U statistics,
+            p-values and BH-FDR.
+    """
+    df = get_dataset(dataset)
+    ids1 = [i for i in cohort_ids(group1) if i in df.columns]
+    ids2 = [i for i in cohort_ids(group2) if i in df.columns]
+
+    if not ids1 or not ids2:
+        raise ValueError("both cohorts need at least one cell line in the dataset")
+
+    values = np.hstack([df[ids1].to_numpy(dtype=float), df[ids2].to_numpy(dtype=float)])
+    design = np.zeros((values.shape[1], 1), dtype=bool)
+    design[:len(ids1), 0] = True
+
+    out = _scan(values, design, min_lines)
+    return _format(out, df.index, 0)
+
+
+def lineage_scan(dataset, by="primary_disease", groups=None, min_lines=3):
+    """Compares every cohort against the rest of the cell lines in one call.
+
+    Args:
+        dataset: str or pandas.core.frame.DataFrame
+            gene by cell line dataset (eg. "gene_effect", "expression")
+        by: str, optional
+            column of data.cell_lines used to define cohorts. Ignored if groups is given.
+        groups: dict, optional
+            mapping of cohort name to list, Cancer or CellLineCluster
+        min_lines: int, optional
+            minimum number of non missing values required in a cohort and in the rest for a gene to be tested
+    Returns:
+        pandas.core.frame.DataFrame
+            indexed by (group, gene). FDR is computed separately for every group.
+    """
+    df = get_dataset(dataset)
+
+    if groups is None:
+        labels = get_dataset("cell_lines")[by].reindex(df.columns)
+        groups = {k: list(v) for k, v in labels.groupby(labels).groups.items()}
+
+    names = []
+    columns = []
+    for name, cohort in groups.items():
+        ids = df.columns.isin(cohort_ids(cohort))
+        if ids.sum() >= min_lines:
+            names.append(name)
+            columns.append(ids)
+
+    if not names:
+        raise ValueError("no cohort has at least {} cell lines in the dataset".format(min_lines))
+
+    design = np.column_stack(columns)
+    out = _scan(df.to_numpy(dtype=float), design, min_lines)
+
+    frames = [_format(out, df.index, i) for i in range(len(names))]
+    return pd.concat(frames, keys=names, names=["group", df.index.name or "gene"])
+
+
+def _scan(values, design, min_lines, ranks=None):
+    """Computes group vs rest statistics for every row of values and every column of design.
+    values is genes by lines with NaN for missing values, design is lines by groups.
+    ranks and tie terms from _rank can be passed in when values is scanned in several blocks.
+    """
+    observed = ~np.isnan(values)
+    n_all = observed.sum(axis=1, keepdims=True).astype(float)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        #center rows so the sum of squares stays well conditioned for large values like read counts
+        center = np.where(n_all > 0, np.nansum(values, axis=1, keepdims=True) / n_all, 0.0)
+        filled = np.where(observed, values - center, 0.0)
+
+        weights = design.astype(float)
+        n1 = observed.astype(float) @ weights
+        s1 = filled @ weights
+        q1 = (filled ** 2) @ weights
+
+        n2 = n_all - n1
+        s2 = filled.sum(axis=1, keepdims=True) - s1
+        q2 = (filled ** 2).sum(axis=1, keepdims=True) - q1
+
+        m1 = s1 / n1
+        m2 = s2 / n2
+        v1 = np.maximum(q1 - n1 * m1 ** 2, 0.0) / (n1 - 1)
+        v2 = np.maximum(q2 - n2 * m2 ** 2, 0.0) / (n2 - 1)
+
+        #Welch t-test
+        se1 = v1 / n1
+        se2 = v2 / n2
+        t_stat = (m1 - m2) / np.sqrt(se1 + se2)
+        dof = (se1 + se2) ** 2 / (se1 ** 2 / (n1 - 1) + se2 ** 2 / (n2 - 1))
+        t_pval = 2 * stats.t.sf(np.abs(t_stat), dof)
+
+        pooled = np.sqrt(((n1 - 1) * v1 + (n2 - 1) * v2) / (n_all - 2))
+        cohens_d = (m1 - m2) / pooled
+
+        #Mann-Whitney U with tie correction and continuity correction
+        if ranks is None:
+            ranks = _rank(values)
+        ranks, ties = ranks
+
+        u_stat = ranks @ weights - n1 * (n1 + 1) / 2
+        mu = n1 * n2 / 2
+        sigma = np.sqrt(n1 * n2 / 12 * ((n_all + 1) - ties / (n_all * (n_all - 1))))
+        z = (np.abs(u_stat - mu) - 0.5) / sigma
+        u_pval = np.minimum(2 * stats.norm.sf(z), 1.0)
+        auc = u_stat / (n1 * n2)
+
+    untested = (n1 < min_lines) | (n2 < min_lines)
+    out = {"mean_1": m1 + center,
+           "mean_2": m2 + center,
+           "n_1": n1,
+           "n_2": n2,
+           "diff": m1 - m2,
+           "cohens_d": cohens_d,
+           "t_stat": t_stat,
+           "t_pvalue": t_pval,
+           "u_stat": u_stat,
+           "auc": auc,
+           "u_pvalue": u_pval}
+
+    for k in out:
+        if k not in ("n_1", "n_2"):
+            out[k] = np.where(untested, np.nan, out[k])
+
+    return out
+
+
+def _rank(values):
+    """Average ranks of every row ignoring NaNs (set to 0) and the per row tie term sum(t**3 - t).
+    """
+    low = stats.rankdata(values, axis=1, method="min", nan_policy="omit")
+    high = stats.rankdata(values, axis=1, method="max", nan_policy="omit")
+    ranks = np.nan_to_num((low + high) / 2)
+    ties = np.nansum((high - low + 1) ** 2 - 1, axis=1, keepdims=True)
+
+    return ranks, ties
+
+
+def _format(out, index, group):
+
+    columns = ["mean_1", "mean_2", "n_1", "n_2", "diff", "cohens_d",
+               "t_stat", "t_pvalue", "u_stat", "auc", "u_pvalue"]
+    df = pd.DataFrame({k: out[k][:, group] for k in columns}, index=index)
+    df[["n_1", "n_2"]] = df[["n_1", "n_2"]].astype(int)
+    df.insert(df.columns.get_loc("t_pvalue") + 1, "t_fdr", bh_fdr(df["t_pvalue"]))
+    df["u_fdr"] = bh_fdr(df["u_pvalue"])
+
+    return df
@@ -1,3 +1,6 @@
+import os
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
 import anndata as ad
@@ -6,6 +9,10 @@ from pydeseq2.dds import DeseqDataSet
 from pydeseq2.default_inference import DefaultInference
 from pydeseq2.ds import DeseqStats
 from adpbulk import ADPBulk
+from scipy import sparse
+
+from .utils import get_dataset, cohort_ids
+from ..structures.memo import memo
 
 
 def pseudobulk_by_group(adt, groups, method="mean"):
@@ -26,14 +33,96 @@ def pseudobulk_by_group(adt, groups, method="mean"):
     return out
 
 
-def run_deseq(adata, design, tested_level, ref_level, n_cpus=8):
+def pseudobulk(groupby, counts="rnaseq_reads", method="sum", cohort=None):
+    """Aggregates a gene by cell line dataset into groups of cell lines.
+    Groups are summed with one sparse indicator matrix product, no AnnData is built.
+
+    Args:
+        groupby: str, list or pandas.core.series.Series
+            column(s) of data.cell_lines to group by (eg. "primary_disease", ["lineage", "sex"])
+            or a Series mapping DepMap_IDs to group names. Cell lines without a group are dropped.
+        counts: str or pandas.core.frame.DataFrame, optional
+            gene by cell line dataset
+        method: str, optional
+            "sum" or "mean"
+        cohort: list, Cancer or CellLineCluster, optional
+            only aggregate these cell lines
+    Returns:
+        pandas.core.frame.DataFrame
+            group by gene aggregated values, integers for method "sum"
+        pandas.core.frame.DataFrame
+            group metadata with the grouping columns and the number of cell lines per group
+    """
+    assert method in ["sum", "mean"], "method must be 'sum' or 'mean'"
+
+    df = get_dataset(counts)
+    lines = df.columns
+    if cohort is not None:
+        lines = lines[lines.isin(cohort_ids(cohort))]
+
+    if isinstance(groupby, pd.Series):
+        labels = groupby.reindex(lines).to_frame(groupby.name or "group")
+    else:
+        groupby = [groupby] if isinstance(groupby, str) else list(groupby)
+        labels = get_dataset("cell_lines")[groupby].reindex(lines)
+
+    labels = labels.dropna()
+    codes, groups = pd.MultiIndex.from_frame(labels.astype(str)).factorize()
+
+    indicator = sparse.csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)),
+                                  shape=(len(codes), len(groups)))
+    n_lines = np.asarray(indicator.sum(axis=0)).ravel()
+
+    #the grouped lines are copied once, missing values count as 0 and are zeroed in that copy
+    values = df.iloc[:, df.columns.get_indexer(labels.index)].to_numpy()
+    values = np.nan_to_num(values, copy=not values.flags.writeable)
+    summed = np.asarray(indicator.T @ values.T)
 
+    names = ["_".join(i) for i in groups]
+    metadata = pd.DataFrame(list(groups), columns=labels.columns)
+    metadata["n_lines"] = n_lines.astype(int)
+    metadata.index = pd.Index(names, name="SampleName")
+
+    if method == "mean":
+        out = pd.DataFrame(summed / n_lines[:, None], index=metadata.index, columns=df.index)
+    else:
+        out = pd.DataFrame(summed.round().astype(int), index=metadata.index, columns=df.index)
+
+    return out, metadata
+
+
+def run_deseq(adata, design, tested_level, ref_level, n_cpus=8, metadata=None):
+    """Fits DESeq2 with the design ~design and tests tested_level against ref_level.
+
+    Args:
+        adata: anndata.AnnData or pandas.core.frame.DataFrame
+            AnnData of sample by gene counts with the design column in obs, or a sample by gene
+            counts table (eg. from pseudobulk or cohort_counts) whose metadata is passed as metadata
+        design: str
+            metadata column to compare samples on
+        tested_level: str
+            level of design tested
+        ref_level: str
+            level of design used as reference
+        n_cpus: int, optional
+            number of cpus used to fit the model
+        metadata: pandas.core.frame.DataFrame, optional
+            sample metadata with the design column, only used with a counts table
+    Returns:
+        pandas.core.frame.DataFrame
+            DESeq2 results indexed by gene
+    """
     inference = DefaultInference(n_cpus=n_cpus)
-    
+
+    if isinstance(adata, pd.DataFrame): #counts and metadata tables, eg. from pseudobulk
+        counts, metadata = adata, metadata
+    else:
+        counts, metadata = adata.to_df(), adata.obs
+
     dds = DeseqDataSet(
-        counts=adata.to_df().astype(int),
-        metadata=adata.obs,
-        design_factors=design,  # compare samples based on the "condition"
+        counts=counts.astype(int),
+        metadata=metadata,
+        design="~" + design,  # compare samples based on the "condition"
         refit_cooks=True,
         inference=inference,
     )
@@ -49,4 +138,147 @@ def run_deseq(adata, design, tested_level, ref_level, n_cpus=8):
 
     df = stat_res.results_df
 
-    return df
\ No newline at end of file
+    return df
+
+
+def cohort_counts(cohorts, counts="rnaseq_reads", factor="cohort"):
+    """Builds the counts and metadata tables DESeq2 expects from cohorts of cell lines.
+    Read counts of duplicated gene indices are summed.
+
+    Args:
+        cohorts: dict
+            mapping of cohort name to list, Cancer or CellLineCluster. A cell line can only be in one cohort.
+        counts: str or pandas.core.frame.DataFrame, optional
+            gene by cell line read count dataset
+        factor: str, optional
+            name of the metadata column holding the cohort names
+    Returns:
+        pandas.core.frame.DataFrame
+            cell line by gene integer counts
+        pandas.core.frame.DataFrame
+            cell line metadata with one column named factor
+    """
+    df = get_dataset(counts)
+
+    labels = {}
+    for name, cohort in cohorts.items():
+        for i in cohort_ids(cohort):
+            if labels.get(i, name) != name:
+                raise ValueError("{0} is in cohorts {1} and {2}".format(i, labels[i], name))
+            labels[i] = name
+
+    lines = [i for i in df.columns if i in labels]
+    if not lines:
+        raise ValueError("none of the cohort cell lines are in the counts dataset")
+
+    mat = df[lines]
+    mat = mat.groupby(mat.index).sum()
+    metadata = pd.DataFrame({factor: [labels[i] for i in lines]}, index=lines)
+
+    return mat.T.round().astype(int), metadata
+
+
+@memo.memoize(datasets=("counts",), ignore=("n_jobs", "n_cpus"), versions=("pydeseq2",),
+              when=lambda params: params["out_dir"] is None)
+def run_deseq_contrasts(cohorts, contrasts=None, counts="rnaseq_reads", out_dir=None,
+                        n_jobs=4, n_cpus=8, factor="cohort", min_counts=10):
+    """Runs several DESeq2 contrasts on one fitted model.
+
+    Size factors, dispersions and LFCs are fit once on all cohorts with the design ~factor.
+    Every contrast is then tested with its own DeseqStats in a process pool.
+    With CANDI_MEMO=1 the returned frames are memoized on disk, keyed by the read counts, the cohorts, the
+    contrasts and the pydeseq2 version. Results written to out_dir are always recomputed.
+
+    Args:
+        cohorts: dict
+            mapping of cohort name to list, Cancer or CellLineCluster
+        contrasts: list, optional
+            (tested, reference) tuples of cohort names. A reference of None compares the tested cohort
+            to the average of all other cohorts. Defaults to every cohort vs the rest.
+        counts: str or pandas.core.frame.DataFrame, optional
+            gene by cell line read count dataset
+        out_dir: str, optional
+            directory where each contrast is written as <tested>_vs_<reference>.csv as soon as it finishes.
+            If None the result frames are returned instead.
+        n_jobs: int, optional
+            number of worker processes testing contrasts
+        n_cpus: int, optional
+            number of cpus used to fit the shared model
+        factor: str, optional
+            name of the design factor
+        min_counts: int, optional
+            genes with fewer total reads are dropped before fitting
+    Returns:
+        dict
+            contrast name as keys and result file path (if out_dir) or results DataFrame as values
+    """
+    counts_df, metadata = cohort_counts(cohorts, counts, factor)
+    if min_counts:
+        counts_df = counts_df.loc[:, counts_df.sum(axis=0) >= min_counts]
+
+    dds = DeseqDataSet(
+        counts=counts_df,
+        metadata=metadata,
+        design="~" + factor,
+        refit_cooks=True,
+        inference=DefaultInference(n_cpus=n_cpus),
+        quiet=True,
+    )
+    dds.deseq2()
+
+    levels = list(metadata[factor].unique())
+    cond = lambda x: np.asarray(dds.formulaic_contrasts.cond(**{factor: x}), dtype=float)
+
+    if contrasts is None:
+        contrasts = [(name, None) for name in levels]
+
+    jobs = {}
+    for tested, ref in contrasts:
+        if ref is None:
+            others = [cond(i) for i in levels if i != tested]
+            jobs["{}_vs_rest".format(tested)] = cond(tested) - np.mean(others, axis=0)
+        else:
+            jobs["{0}_vs_{1}".format(tested, ref)] = cond(tested) - cond(ref)
+
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+
+    if n_jobs == 1: #the model is passed directly, nothing is left in the worker global
+        return dict(_run_contrast(k, v, out_dir, dds) for k, v in jobs.items())
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(dds,)) as executor:
+        futures = [executor.submit(_run_contrast, k, v, out_dir) for k, v in jobs.items()]
+        for future in as_completed(futures):
+            name, res = future.result()
+            results[name] = res
+
+    return {k: results[k] for k in jobs}
+
+
+_dds = None #fitted DeseqDataSet shared by the contrast workers
+
+
+def _init_worker(dds):
+
+    global _dds
+    _dds = dds
+
+
+def _run_contrast(name, contrast, out_dir, dds=None):
+
+    stat_res = DeseqStats(
+        _dds if dds is None else dds,
+        contrast=contrast,
+        inference=DefaultInference(n_cpus=1),
+        quiet=True
+    )
+    stat_res.summary()
+
+    df = stat_res.results_df
+    if out_dir is None:
+        return name, df
+
+    path = Path(out_dir) / "{}.csv".format(name)
+    df.to_csv(path)
+    return name, path
@@ -0,0 +1,191 @@
+"""Parallel map of a function over genes or cell lines.
+The rows or columns of the mapped genes or cell lines are copied once into shared memory, workers attach
+to them and receive each gene's row or cell line's column as a read only view, so no slice is pickled.
+
+    from CanDI import candi
+
+    def fit(gene, values):
+        return np.polyfit(values["expression"], values["gene_effect"], 1)[0]
+
+    slopes = candi.map_genes(fit, genes, datasets=["expression", "gene_effect"], n_jobs=8)
+"""
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_EXCEPTION, wait
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+from .utils import get_dataset, cohort_ids, gene_ids
+
+
+class MapError(Exception):
+    """Raised when the mapped function fails, item is the gene or cell line it failed on."""
+    def __init__(self, item, message):
+        super().__init__(item, message)
+        self.item = item
+        self.message = message
+
+    def __str__(self):
+        return "failed on {0}\n{1}".format(self.item, self.message)
+
+
+def map_genes(fn, genes, datasets, n_jobs=4, chunk_size=None):
+    """Calls fn(gene, values) for every gene, values holding the gene's row of each dataset.
+
+    Args:
+        fn: callable
+            function of a gene symbol and its values, must be importable by the workers (not a lambda)
+        genes: list, Gene, GeneCluster or Organelle
+        datasets: str or list
+            names of gene by cell line datasets on the global data object or DataFrames. With one name
+            values is a pandas Series indexed by cell line, with a list it is a dict of Series keyed by dataset.
+            Genes missing from a dataset get None.
+        n_jobs: int, optional
+            number of worker processes, 1 runs fn in this process
+        chunk_size: int, optional
+            number of genes sent to a worker at once, defaults to splitting the genes in 4 chunks per worker
+    Returns:
+        list
+            results of fn in the order of genes
+    Raises:
+        MapError: with the gene fn failed on and the worker's traceback
+    """
+    return _map(fn, gene_ids(genes), datasets, 0, n_jobs, chunk_size)
+
+
+def map_lines(fn, lines, datasets, n_jobs=4, chunk_size=None):
+    """Calls fn(line, values) for every cell line, values holding the line's column of each dataset.
+
+    Args:
+        fn: callable
+            function of a DepMap_ID and its values, must be importable by the workers (not a lambda)
+        lines: list, CellLine, Cancer or CellLineCluster
+        datasets: str or list
+            see map_genes, values are indexed by gene
+        n_jobs: int, optional
+            number of worker processes, 1 runs fn in this process
+        chunk_size: int, optional
+            number of cell lines sent to a worker at once
+    Returns:
+        list
+            results of fn in the order of lines
+    Raises:
+        MapError: with the cell line fn failed on and the worker's traceback
+    """
+    lines = [i.depmap_id if hasattr(i, "depmap_id") else i for i in cohort_ids(lines)]
+    return _map(fn, lines, datasets, 1, n_jobs, chunk_size)
+
+
+def _map(fn, items, datasets, axis, n_jobs, chunk_size):
+
+    single = isinstance(datasets, (str, pd.DataFrame))
+    datasets = [datasets] if single else list(datasets)
+    names = [name if isinstance(name, str) else i for i, name in enumerate(datasets)] #DataFrames keyed by position
+    frames = [get_dataset(i) for i in datasets]
+
+    #position of every item in every dataset, -1 if missing
+    positions = np.column_stack([(df.index if axis == 0 else df.columns).get_indexer(items) for df in frames]
+                                ) if items else np.empty((0, len(frames)), dtype=int)
+    tasks = list(zip(items, positions))
+
+    if n_jobs == 1 or len(tasks) <= 1:
+        _init_worker(fn, names, [_describe(df) for df in frames], axis, single, frames)
+        try:
+            return _run(tasks)
+        finally:
+            _worker.clear()
+
+    chunk_size = chunk_size or max(1, -(-len(tasks) // (4 * n_jobs)))
+    blocks = []
+    try:
+        layouts = []
+        for i, df in enumerate(frames):
+            if any(dtype == object for dtype in df.dtypes):
+                raise ValueError("only numeric gene by cell line datasets can be mapped over")
+            #only the rows or columns of the items are shared, tasks point into them instead of the dataset
+            needed = np.unique(positions[:, i][positions[:, i] >= 0])
+            positions[:, i] = np.where(positions[:, i] >= 0, np.searchsorted(needed, positions[:, i]), -1)
+            shape = (len(needed), df.shape[1]) if axis == 0 else (df.shape[0], len(needed))
+            dtype = np.result_type(*df.dtypes.unique())
+            block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+            blocks.append(block)
+            _share(df, needed, axis, np.ndarray(shape, dtype, buffer=block.buf))
+            layouts.append(_describe(df, block.name, dtype, shape))
+        tasks = list(zip(items, positions))
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(fn, names, layouts, axis, single)) as executor:
+            futures = [executor.submit(_run, tasks[i:i + chunk_size]) for i in range(0, len(tasks), chunk_size)]
+            _, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+
+            results = []
+            for future in futures: #the first failed chunk in the order of items is raised
+                results.extend(future.result())
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return results
+
+
+def _share(df, needed, axis, out):
+    """Copies the needed rows (axis 0) or columns (axis 1) of df into out one column at a time,
+    so no copy of the whole dataset is made on the way to shared memory."""
+    if axis == 0:
+        for j in range(df.shape[1]):
+            out[:, j] = df.iloc[:, j].to_numpy()[needed]
+    else:
+        for k, j in enumerate(needed):
+            out[:, k] = df.iloc[:, j].to_numpy()
+
+
+def _describe(df, name=None, dtype=None, shape=None):
+    """What a worker needs to rebuild a dataset over shared memory."""
+    return {"shm": name, "shape": shape or df.shape, "dtype": dtype, "index": df.index, "columns": df.columns}
+
+
+_worker = {} #state of the worker process, set by _init_worker
+
+
+def _init_worker(fn, names, layouts, axis, single, frames=None):
+
+    _worker.clear()
+    _worker.update(fn=fn, names=names, axis=axis, single=single, blocks=[])
+
+    arrays = []
+    for i, layout in enumerate(layouts):
+        if frames is not None: #same process, read the datasets directly
+            arrays.append(frames[i].to_numpy())
+            continue
+
+        block = shared_memory.SharedMemory(name=layout["shm"]) #the parent unlinks it, workers share its resource tracker
+        _worker["blocks"].append(block) #the views below are valid while the block is open
+        array = np.ndarray(layout["shape"], layout["dtype"], buffer=block.buf)
+        array.flags.writeable = False
+        arrays.append(array)
+
+    _worker["arrays"] = arrays
+    _worker["labels"] = [layout["columns"] if axis == 0 else layout["index"] for layout in layouts]
+
+
+def _run(tasks):
+
+    fn, names, axis = _worker["fn"], _worker["names"], _worker["axis"]
+    results = []
+    for item, positions in tasks:
+        values = {}
+        for name, array, labels, pos in zip(names, _worker["arrays"], _worker["labels"], positions):
+            if pos < 0:
+                values[name] = None
+            else:
+                values[name] = pd.Series(array[pos] if axis == 0 else array[:, pos], index=labels, name=item, copy=False)
+
+        try:
+            results.append(fn(item, values[names[0]] if _worker["single"] else values))
+        except Exception as e:
+            raise MapError(item, "".join(traceback.format_exception(type(e), e, e.__traceback__))) from None
+
+    return results
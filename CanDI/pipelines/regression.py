@@ -0,0 +1,170 @@
+"""Batched linear models of a response dataset on per gene covariates and lineage, fit for every gene at once.
+Each gene's model regresses its values across lines on the gene's own covariates (eg. its copy number)
+with an intercept and lineage indicators shared by all genes. Genes are grouped by the lines they have
+values for, the shared part of the design is decomposed once per group with a QR decomposition and the
+covariates are fit on the residuals of that projection (Frisch-Waugh-Lovell) with batched k by k solves.
+DepMap datasets have few distinct missing value patterns, so there are few decompositions.
+
+    from CanDI.pipelines import regression
+
+    fit = regression.regress("gene_effect", ["gene_cn"], lineage="lineage")
+    fit.table.xs("gene_cn", level="covariate")
+    cn_corrected = fit.corrected
+"""
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .utils import get_dataset, cohort_ids, gene_ids, bh_fdr
+
+
+#table: (gene, covariate) statistics, residuals and corrected: genes by cell lines
+Regression = namedtuple("Regression", ["table", "residuals", "corrected"])
+
+
+def regress(response="gene_effect", covariates=("gene_cn",), lineage=None, genes=None, lines=None,
+            min_lines=10, block_size=2000):
+    """Fits response ~ intercept + lineage + covariates for every gene.
+
+    Args:
+        response: str or pandas.core.frame.DataFrame
+            gene by cell line dataset (eg. "gene_effect")
+        covariates: list or dict
+            gene by cell line datasets whose row of a gene is a covariate of that gene (eg. "gene_cn",
+            "expression"), as names or DataFrames. A dict sets the names of the covariates in the output.
+        lineage: str or pandas.core.series.Series, optional
+            column of data.cell_lines or labels indexed by DepMap_ID, fit as indicators of every label but
+            the first one present. Lines without a label are left out.
+        genes: list, GeneCluster or Organelle, optional
+            defaults to every gene shared by the response and covariates
+        lines: list, Cancer or CellLineCluster, optional
+            defaults to every cell line shared by the response and covariates
+        min_lines: int, optional
+            minimum number of lines with values for a gene to be fit
+        block_size: int, optional
+            number of genes fit together
+    Returns:
+        Regression
+            namedtuple of
+            table: pandas DataFrame indexed by (gene, covariate) with coef, stderr, t_stat, pvalue, BH-FDR
+            computed per covariate, and n_lines.
+            residuals: genes by cell lines residuals of the models, NaN where a line was left out.
+            corrected: genes by cell lines response with the covariate effects removed around each gene's
+            mean covariates, eg. a copy number corrected gene effect.
+    """
+    y_df = get_dataset(response)
+    if not isinstance(covariates, dict):
+        covariates = [covariates] if isinstance(covariates, (str, pd.DataFrame)) else list(covariates)
+        covariates = {(i if isinstance(i, str) else "covariate{}".format(n)): i for n, i in enumerate(covariates)}
+    if not covariates:
+        raise ValueError("at least one covariate is needed")
+    frames = {k: get_dataset(v) for k, v in covariates.items()}
+
+    #genes and lines of every dataset
+    gene_index, line_index = y_df.index, y_df.columns
+    for df in frames.values():
+        gene_index = gene_index.intersection(df.index, sort=False)
+        line_index = line_index.intersection(df.columns, sort=False)
+    if genes is not None:
+        gene_index = gene_index[gene_index.isin(gene_ids(genes))]
+    if lines is not None:
+        line_index = line_index[line_index.isin(cohort_ids(lines))]
+
+    y = y_df.loc[gene_index, line_index].to_numpy(dtype=np.float64)
+    x = np.stack([df.loc[gene_index, line_index].to_numpy(dtype=np.float64) for df in frames.values()], axis=1)
+    codes = _lineage_codes(lineage, line_index)
+
+    names = list(frames)
+    k = len(names)
+    coef = np.full((len(gene_index), k), np.nan)
+    stderr = np.full((len(gene_index), k), np.nan)
+    dof = np.full(len(gene_index), np.nan)
+    residuals = np.full(y.shape, np.nan)
+    corrected = np.full(y.shape, np.nan)
+
+    mask = ~np.isnan(y) & ~np.isnan(x).any(axis=1) & (codes >= 0)
+    patterns, inverse = np.unique(mask, axis=0, return_inverse=True)
+    for p, observed in enumerate(patterns):
+        n = observed.sum()
+        rows = np.flatnonzero(inverse.ravel() == p)
+        q, _ = np.linalg.qr(_shared_design(codes[observed]))
+        if n < min_lines or n - q.shape[1] - k < 1:
+            continue
+
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            yb = y[np.ix_(block, observed)]
+            xb = x[block][:, :, observed]
+            coef[block], stderr[block], residuals[np.ix_(block, observed)] = _fit(yb, xb, q)
+            dof[block] = n - q.shape[1] - k
+
+            effect = np.einsum("gk,gkl->gl", coef[block], xb - xb.mean(axis=2, keepdims=True))
+            corrected[np.ix_(block, observed)] = yb - effect
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_stat = coef / stderr
+    pvalue = 2 * stats.t.sf(np.abs(t_stat), dof[:, None])
+    fdr = np.column_stack([bh_fdr(pvalue[:, i]) for i in range(k)])
+
+    index = pd.MultiIndex.from_product([gene_index, names], names=[gene_index.name or "gene", "covariate"])
+    table = pd.DataFrame({"coef": coef.ravel(),
+                          "stderr": stderr.ravel(),
+                          "t_stat": t_stat.ravel(),
+                          "pvalue": pvalue.ravel(),
+                          "fdr": fdr.ravel(),
+                          "n_lines": np.repeat(mask.sum(axis=1), k)}, index=index)
+
+    return Regression(table,
+                      pd.DataFrame(residuals, index=gene_index, columns=line_index),
+                      pd.DataFrame(corrected, index=gene_index, columns=line_index))
+
+
+def _lineage_codes(lineage, lines):
+    """Integer label of every line, -1 for lines without a label and 0 for all lines if lineage is None."""
+    if lineage is None:
+        return np.zeros(len(lines), dtype=np.int64)
+
+    labels = get_dataset("cell_lines")[lineage] if isinstance(lineage, str) else lineage
+    codes, _ = pd.factorize(labels.reindex(lines))
+    return codes
+
+
+def _shared_design(codes):
+    """Intercept and indicators of every label but the first one present, lines by terms."""
+    present = np.unique(codes)
+    return np.column_stack([np.ones(len(codes))] + [codes == i for i in present[1:]]).astype(np.float64)
+
+
+def _fit(y, x, q):
+    """Fits y on x after projecting out the columns of q.
+
+    Args:
+        y: numpy.ndarray
+            genes by lines
+        x: numpy.ndarray
+            genes by covariates by lines
+        q: numpy.ndarray
+            lines by terms, orthonormal basis of the shared design
+    Returns:
+        tuple
+            coefficients and standard errors (genes by covariates) and residuals (genes by lines).
+            Genes with collinear covariates get NaN.
+    """
+    y = y - (y @ q) @ q.T
+    x = x - (x @ q) @ q.T
+
+    gram = x @ x.transpose(0, 2, 1)
+    singular = np.linalg.matrix_rank(gram) < x.shape[1]
+    gram[singular] = np.eye(x.shape[1]) #solved, then discarded
+    inverse = np.linalg.inv(gram)
+
+    coef = np.einsum("gkm,gml,gl->gk", inverse, x, y)
+    residuals = y - np.einsum("gk,gkl->gl", coef, x)
+    dof = y.shape[1] - q.shape[1] - x.shape[1]
+    sigma2 = (residuals ** 2).sum(axis=1) / dof
+    stderr = np.sqrt(sigma2[:, None] * np.diagonal(inverse, axis1=1, axis2=2))
+
+    coef[singular] = stderr[singular] = np.nan
+    residuals[singular] = np.nan
+    return coef, stderr, residuals
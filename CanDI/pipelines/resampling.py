@@ -0,0 +1,203 @@
+"""Permutation tests and bootstrap confidence intervals of cohort statistics for every gene at once.
+Resamples are drawn in batches as index matrices and turned into a lines by resamples weight matrix,
+so the statistic of every gene under every resample of a batch is one matrix product. Batches are
+seeded from one SeedSequence and run on a thread pool (numpy releases the GIL in matrix products),
+results are the same for any n_jobs.
+
+    from CanDI import candi
+    from CanDI.pipelines import resampling
+
+    res = resampling.permutation_test(candi.Cancer("Glioma"), "gene_effect", statistic="fraction")
+"""
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from .utils import get_dataset, cohort_ids, bh_fdr
+
+
+STATISTICS = ["mean", "fraction"] #mean value, fraction of lines past a BinaryFilter margin
+ALTERNATIVES = ["two-sided", "less", "greater"]
+#margins and directions of the BinaryFilters of the core classes
+MARGINS = {"gene_effect": (-1.0, "under"),
+           "gene_dependency": (0.50, "over"),
+           "expression": (1.0, "over")}
+
+
+def permutation_test(cohort, dataset, statistic="mean", margin=None, direction=None, alternative="two-sided",
+                     n_resamples=1000, seed=0, n_jobs=4, batch_size=100):
+    """Tests the statistic of a cohort against random cohorts of the same size for every gene.
+
+    Args:
+        cohort: list, Cancer or CellLineCluster
+            cell lines of the tested cohort
+        dataset: str or pandas.core.frame.DataFrame
+            gene by cell line dataset (eg. "gene_effect"), random cohorts are drawn from all of its lines
+        statistic: str, optional
+            "mean" value or "fraction" of lines past margin
+        margin: float or BinaryFilter, optional
+            margin of the fraction statistic, defaults to the margin the core classes use for dataset
+        direction: str, optional
+            "under" counts values below margin, "over" values above it
+        alternative: str, optional
+            "less" tests for a smaller statistic in the cohort (eg. selectively essential by mean effect),
+            "greater" for a larger one
+        n_resamples: int, optional
+            number of random cohorts
+        seed: int, optional
+        n_jobs: int, optional
+            number of threads evaluating batches
+        batch_size: int, optional
+            number of random cohorts evaluated per matrix product
+    Returns:
+        pandas.core.frame.DataFrame
+            one row per gene with the cohort statistic, mean and standard deviation of the null,
+            empirical p-value (with the +1 correction, never 0) and BH-FDR
+    """
+    if alternative not in ALTERNATIVES:
+        raise ValueError("alternative must be one of {}".format(ALTERNATIVES))
+
+    df, scores, observed, ids = _prepare(cohort, dataset, statistic, margin, direction)
+    size = len(ids)
+    n_lines = df.shape[1]
+
+    def draw(rng, n):
+        draws = rng.permuted(np.tile(np.arange(n_lines), (n, 1)), axis=1)[:, :size]
+        return _weights(draws, n_lines)
+
+    cohort_stat = _statistic(scores, observed, _weights(df.columns.get_indexer(ids)[None, :], n_lines))[:, 0]
+
+    def reduce(null):
+        with np.errstate(invalid="ignore"):
+            return {"less": np.sum(null <= cohort_stat[:, None], axis=1),
+                    "greater": np.sum(null >= cohort_stat[:, None], axis=1),
+                    "n": np.sum(~np.isnan(null), axis=1),
+                    "sum": np.nansum(null, axis=1),
+                    "squares": np.nansum(null ** 2, axis=1)}
+
+    totals = _resample(draw, reduce, scores, observed, n_resamples, seed, n_jobs, batch_size)
+
+    n = totals["n"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        less = (totals["less"] + 1) / (n + 1)
+        greater = (totals["greater"] + 1) / (n + 1)
+        null_mean = totals["sum"] / n
+        null_std = np.sqrt(np.maximum(totals["squares"] / n - null_mean ** 2, 0.0))
+    pvalue = {"less": less, "greater": greater, "two-sided": np.minimum(2 * np.minimum(less, greater), 1.0)}[alternative]
+    pvalue = np.where(np.isnan(cohort_stat) | (n == 0), np.nan, pvalue)
+
+    out = pd.DataFrame({statistic: cohort_stat,
+                        "null_mean": null_mean,
+                        "null_std": null_std,
+                        "pvalue": pvalue}, index=df.index)
+    out["fdr"] = bh_fdr(out["pvalue"])
+    return out
+
+
+def bootstrap(cohort, dataset, statistic="mean", margin=None, direction=None, confidence=0.95,
+              n_resamples=1000, seed=0, n_jobs=4, batch_size=100):
+    """Percentile bootstrap confidence intervals of the statistic of a cohort for every gene.
+
+    Args:
+        cohort: list, Cancer or CellLineCluster
+        dataset: str or pandas.core.frame.DataFrame
+        statistic: str, optional
+            see permutation_test
+        margin: float or BinaryFilter, optional
+        direction: str, optional
+        confidence: float, optional
+            coverage of the interval
+        n_resamples: int, optional
+            number of bootstrap replicates, every replicate draws the cohort's lines with replacement
+        seed: int, optional
+        n_jobs: int, optional
+        batch_size: int, optional
+    Returns:
+        pandas.core.frame.DataFrame
+            one row per gene with the cohort statistic, standard error of the replicates and the interval
+    """
+    df, scores, observed, ids = _prepare(cohort, dataset, statistic, margin, direction)
+    positions = df.columns.get_indexer(ids)
+    n_lines = df.shape[1]
+
+    def draw(rng, n):
+        return _weights(positions[rng.integers(0, len(positions), size=(n, len(positions)))], n_lines)
+
+    replicates = _resample(draw, lambda x: {"replicates": x}, scores, observed, n_resamples, seed, n_jobs,
+                           batch_size, concat=True)["replicates"]
+
+    tail = (1 - confidence) / 2
+    with warnings.catch_warnings(): #genes without observed lines in the cohort have no interval
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high = np.nanquantile(replicates, [tail, 1 - tail], axis=1) if replicates.size else (np.nan, np.nan)
+        stderr = np.nanstd(replicates, axis=1, ddof=1)
+
+    cohort_stat = _statistic(scores, observed, _weights(positions[None, :], n_lines))[:, 0]
+    return pd.DataFrame({statistic: cohort_stat,
+                         "stderr": stderr,
+                         "ci_low": low,
+                         "ci_high": high}, index=df.index)
+
+
+def _prepare(cohort, dataset, statistic, margin, direction):
+    """The dataset, per line scores and observed masks of every gene with missing values as 0, the cohort's lines."""
+    if statistic not in STATISTICS:
+        raise ValueError("statistic must be one of {}".format(STATISTICS))
+
+    df = get_dataset(dataset)
+    ids = [i for i in cohort_ids(cohort) if i in df.columns]
+    if not ids:
+        raise ValueError("the cohort has no cell lines in the dataset")
+
+    values = df.to_numpy(dtype=np.float64)
+    observed = ~np.isnan(values)
+    if statistic == "mean":
+        return df, np.where(observed, values, 0.0), observed.astype(np.float64), ids
+
+    default = MARGINS.get(dataset if isinstance(dataset, str) else None, (None, "under"))
+    margin = default[0] if margin is None else getattr(margin, "margin", margin)
+    direction = default[1] if direction is None else direction
+    if margin is None:
+        raise ValueError("a margin is needed for the fraction statistic of this dataset")
+    if direction not in ("under", "over"):
+        raise ValueError("direction must be under or over")
+
+    with np.errstate(invalid="ignore"):
+        passed = values < margin if direction == "under" else values > margin #same comparisons as BinaryFilter
+    return df, (passed & observed).astype(np.float64), observed.astype(np.float64), ids
+
+
+def _weights(draws, n_lines):
+    """Lines by resamples matrix counting how often each line is drawn, draws is resamples by lines drawn."""
+    weights = np.zeros((n_lines, draws.shape[0]))
+    np.add.at(weights, (draws, np.arange(draws.shape[0])[:, None]), 1.0)
+    return weights
+
+
+def _statistic(scores, observed, weights):
+    """Weighted mean of the scores of every gene under every column of weights, NaN without observed lines."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (scores @ weights) / (observed @ weights)
+
+
+def _resample(draw, reduce, scores, observed, n_resamples, seed, n_jobs, batch_size, concat=False):
+    """Evaluates batches of resamples and sums (or concatenates) their reductions in the order of the batches."""
+    sizes = [min(batch_size, n_resamples - i) for i in range(0, n_resamples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes)) #one stream per batch, independent of n_jobs
+
+    def run(batch):
+        rng = np.random.default_rng(seeds[batch])
+        return reduce(_statistic(scores, observed, draw(rng, sizes[batch])))
+
+    if n_jobs == 1 or len(sizes) <= 1:
+        results = [run(i) for i in range(len(sizes))]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(run, range(len(sizes))))
+
+    if not results:
+        raise ValueError("n_resamples must be positive")
+    if concat:
+        return {k: np.concatenate([r[k] for r in results], axis=1) for k in results[0]}
+    return {k: sum(r[k] for r in results) for k in results[0]}
@@ -0,0 +1,169 @@
+"""Nearest neighbor search of cell lines on a reduced embedding of a dataset.
+Cell lines are embedded once per dataset with a PCA computed by randomized SVD. The embedding is
+written to <depmap>/derived next to the datasets and reused by every kernel until the dataset's file
+changes, so a query is one product of the query line with the embedding.
+Exact search over the embedding takes milliseconds for every DepMap release, no approximate
+index is needed at that size.
+"""
+import threading
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .utils import get_dataset, cohort_ids, read_stored, write_stored
+from ..structures.cache import slice_cache
+
+
+METRICS = ["cosine", "euclidean"]
+
+_indexes = {} #(dataset, n_components, generation, id of the dataset): SimilarityIndex
+_lock = threading.Lock()
+
+
+class SimilarityIndex(object):
+    """Exact k nearest neighbor search over an embedding of cell lines.
+
+    Args:
+        coordinates: pandas.core.frame.DataFrame
+            cell lines by components
+    """
+    def __init__(self, coordinates):
+
+        self.lines = coordinates.index
+        self.coordinates = coordinates.to_numpy(dtype=np.float64)
+        self.norms = np.linalg.norm(self.coordinates, axis=1)
+        self._positions = pd.Series(np.arange(len(self.lines)), index=self.lines)
+
+    def query(self, line, k=10, within=None, metric="cosine"):
+        """Returns the k cell lines closest to line.
+
+        Args:
+            line: str
+                DepMap_ID
+            k: int, optional
+            within: list, optional
+                only search these DepMap_IDs
+            metric: str, optional
+                "cosine" similarity or "euclidean" distance between embeddings
+        Returns:
+            pandas.core.series.Series
+                indexed by DepMap_ID, most similar first, named after the metric
+        """
+        if metric not in METRICS:
+            raise ValueError("metric must be one of {}".format(METRICS))
+        if line not in self._positions.index:
+            raise KeyError("{} is not in the embedded dataset".format(line))
+
+        candidates = np.arange(len(self.lines)) if within is None else \
+            self._positions.reindex(within).dropna().to_numpy(dtype=int)
+        query = self._positions[line]
+        candidates = candidates[candidates != query]
+
+        x = self.coordinates[query]
+        products = self.coordinates[candidates] @ x
+        if metric == "cosine":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                scores = products / (self.norms[candidates] * self.norms[query])
+            order = np.argsort(-scores, kind="stable")
+        else:
+            scores = np.sqrt(np.maximum(self.norms[candidates] ** 2 - 2 * products + self.norms[query] ** 2, 0))
+            order = np.argsort(scores, kind="stable")
+
+        order = order[:k]
+        return pd.Series(scores[order], index=self.lines[candidates[order]], name=metric)
+
+
+def similarity_index(dataset="expression", n_components=50):
+    """Returns the similarity index of a dataset, built once per load from the persisted embedding if there is one.
+
+    Args:
+        dataset: str
+            gene by cell line dataset (eg. "expression", "gene_effect") or "mutations" for the binary
+            mutation profiles of the lines (non silent variants)
+        n_components: int, optional
+            dimensions of the embedding
+    Returns:
+        SimilarityIndex
+    """
+    from ..candi import data
+
+    key = (dataset, n_components, slice_cache.generation(dataset), id(getattr(data, dataset, None)))
+    with _lock:
+        if key not in _indexes:
+            for old in [k for k in _indexes if k[:2] == key[:2]]:
+                del _indexes[old]
+            coordinates = read_stored("embedding", [dataset, n_components], [dataset])
+            if coordinates is None:
+                coordinates = embedding(dataset, n_components)
+                write_stored("embedding", [dataset, n_components], [dataset], coordinates)
+            _indexes[key] = SimilarityIndex(coordinates)
+        return _indexes[key]
+
+
+def similar(line, k=10, by="expression", within=None, n_components=50, metric="cosine"):
+    """Returns the k cell lines most similar to line, see SimilarityIndex.query.
+
+    Args:
+        line: str or CellLine
+        within: list, Cancer or CellLineCluster, optional
+            only search these cell lines
+    """
+    line = getattr(line, "depmap_id", line)
+    within = None if within is None else cohort_ids(within)
+    return similarity_index(by, n_components).query(line, k, within, metric)
+
+
+def embedding(dataset, n_components=50, seed=0):
+    """Returns the PCA coordinates of every cell line of a dataset.
+    Genes are centered, missing values take the gene's mean and genes without variance are dropped.
+
+    Returns:
+        pandas.core.frame.DataFrame
+            cell lines by components
+    """
+    if dataset == "mutations":
+        lines, values = _mutation_profiles(get_dataset(dataset))
+    else:
+        df = get_dataset(dataset)
+        lines = df.columns
+        values = df.to_numpy(dtype=np.float64).T #lines by genes
+        means = np.nanmean(values, axis=0)
+        values = np.where(np.isnan(values), means, values)
+        values = values[:, np.nanstd(values, axis=0) > 0]
+
+    centered = values - np.asarray(values.mean(axis=0)).ravel()
+    n_components = min(n_components, *centered.shape)
+    u, s, _ = randomized_svd(centered, n_components, seed=seed)
+    return pd.DataFrame(u * s, index=lines, columns=["PC{}".format(i + 1) for i in range(n_components)])
+
+
+def randomized_svd(matrix, n_components, n_oversamples=10, n_iter=4, seed=0):
+    """Truncated SVD by randomized range finding (Halko, Martinsson and Tropp 2011).
+
+    Returns:
+        tuple
+            u, s and vt of the leading n_components singular triplets
+    """
+    rng = np.random.default_rng(seed)
+    size = min(n_components + n_oversamples, min(matrix.shape))
+
+    q = matrix @ rng.standard_normal((matrix.shape[1], size))
+    for _ in range(n_iter): #power iterations separate the leading singular values
+        q, _ = np.linalg.qr(q)
+        q, _ = np.linalg.qr(matrix.T @ q)
+        q = matrix @ q
+    q, _ = np.linalg.qr(q)
+
+    u, s, vt = np.linalg.svd(np.asarray(q.T @ matrix), full_matrices=False)
+    return (q @ u)[:, :n_components], s[:n_components], vt[:n_components]
+
+
+def _mutation_profiles(mutations):
+    """Lines by genes binary matrix of non silent mutations."""
+    mutations = mutations.loc[mutations.Variant_Classification != "Silent", ["DepMap_ID", "gene"]].drop_duplicates()
+    lines = pd.Index(mutations.DepMap_ID.unique())
+    genes = pd.Index(mutations.gene.unique())
+    rows, cols = lines.get_indexer(mutations.DepMap_ID), genes.get_indexer(mutations.gene)
+    values = sparse.csr_matrix((np.ones(len(mutations), dtype=np.float32), (rows, cols)),
+                               shape=(len(lines), len(genes))).toarray()
+    return lines, values
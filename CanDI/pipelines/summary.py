@@ -0,0 +1,229 @@
+"""Pan-cancer summary cube of gene by lineage statistics.
+Every matrix dataset is aggregated in one pass over blocks of genes, group sums come from an
+indicator matrix product. The cube is written to <depmap>/derived next to the datasets and reused by every
+kernel until one of their files changes, so Gene.pan_cancer_summary and Cancer.summary are served without
+touching the datasets. With the memo on, the aggregates of every dataset are also shared between cubes.
+"""
+import operator
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .utils import get_dataset, cohort_ids, read_stored, write_stored
+from ..structures.memo import memo
+from ..structures.cache import slice_cache
+
+
+#fraction of lines passing the same margins as the Entity filters
+THRESHOLDS = {"gene_effect": ("essential", operator.lt, -1.0),
+              "gene_dependency": ("dependent", operator.gt, 0.5),
+              "expression": ("expressed", operator.gt, 1.0)}
+
+GROUPINGS = ("primary_disease", "lineage_subtype")
+
+#datasets summarized by default, if installed
+DATASETS = ("gene_effect", "gene_dependency", "expression", "gene_cn", "rnaseq_reads", "mutations")
+
+_cubes = {} #(datasets, by): (dataset generations, cube)
+_views = {} #id of a cube: (cube, cube indexed by (by, group, gene))
+
+
+def summary_cube(datasets=None, by=GROUPINGS, chunk_size=2000):
+    """Returns gene by group aggregates of every matrix dataset and the mutation frequency.
+
+    Args:
+        datasets: list, optional
+            matrix datasets to summarize, plus "mutations" for the mutation frequency.
+            Defaults to the installed ones of DATASETS.
+        by: tuple, optional
+            columns of data.cell_lines defining the groups
+        chunk_size: int, optional
+            number of genes aggregated at once
+    Returns:
+        pandas.core.frame.DataFrame
+            indexed by (gene, by, group) with <dataset>_mean, _median, _sd and _n columns, the fraction of lines
+            passing each dataset's filter (eg. fraction_essential) and mutation_frequency
+    """
+    from ..candi import data
+
+    if datasets is None:
+        datasets = [i for i in DATASETS if getattr(data, i, None) is not None]
+    if not datasets:
+        raise ValueError("none of the summarized datasets are installed")
+    key = (tuple(datasets), tuple(by))
+    generations = tuple(slice_cache.generation(i) for i in datasets)
+
+    cached = _cubes.get(key)
+    if cached is not None and cached[0] == generations:
+        return cached[1]
+
+    params, sources = [list(datasets), list(by)], list(datasets) + ["cell_lines"]
+    cube = read_stored("summary_cube", params, sources)
+    if cube is None:
+        frames = []
+        for dataset in datasets:
+            if dataset == "mutations":
+                frames.append(_mutation_summary(dataset, tuple(by)))
+            else:
+                frames.append(_dataset_summary(dataset, tuple(by), chunk_size))
+
+        cube = pd.concat(frames, axis=1).sort_index()
+        write_stored("summary_cube", params, sources, cube)
+
+    _cubes[key] = (generations, cube)
+    return cube
+
+
+def gene_summary(gene, by="primary_disease"):
+    """Returns the cube statistics of one gene in every group of a grouping, indexed by group."""
+    cube = summary_cube()
+    try:
+        return cube.loc[(gene, by)]
+    except KeyError:
+        raise KeyError("{0} has no {1} groups in the summary cube".format(gene, by)) from None
+
+
+def group_summary(by, group):
+    """Returns the cube statistics of every gene in one group, indexed by gene."""
+    cube = summary_cube()
+    view = _views.get(id(cube))
+    if view is None or view[0] is not cube:
+        _views.clear()
+        view = _views[id(cube)] = (cube, cube.reorder_levels(["by", "group", "gene"]).sort_index())
+
+    try:
+        return view[1].loc[(by, group)]
+    except KeyError:
+        raise ValueError("{0} is not a {1} of any summarized cell line".format(group, by)) from None
+
+
+def cohort_summary(lines, datasets=None, chunk_size=2000):
+    """Returns the cube statistics of every gene for one cohort of cell lines.
+
+    Args:
+        lines: list, Cancer or CellLineCluster
+        datasets: list, optional
+            see summary_cube
+    Returns:
+        pandas.core.frame.DataFrame
+            indexed by gene
+    """
+    from ..candi import data
+
+    if datasets is None:
+        datasets = [i for i in DATASETS if getattr(data, i, None) is not None]
+
+    labels = pd.Series("cohort", index=pd.Index(cohort_ids(lines)).unique())
+    frames = []
+    for dataset in datasets:
+        if dataset == "mutations":
+            frames.append(_mutation_frequency(get_dataset(dataset), {"cohort": labels}))
+        else:
+            frames.append(_aggregate(dataset, {"cohort": labels}, chunk_size, columns=list(labels.index)))
+
+    return pd.concat(frames, axis=1).xs(("cohort", "cohort"), level=("by", "group"))
+
+
+@memo.memoize(uses=("cell_lines",), ignore=("chunk_size",), datasets=("dataset",))
+def _dataset_summary(dataset, by, chunk_size=2000):
+
+    cell_lines = get_dataset("cell_lines")
+    return _aggregate(dataset, {i: cell_lines[i] for i in by}, chunk_size)
+
+
+@memo.memoize(uses=("cell_lines",), datasets=("dataset",))
+def _mutation_summary(dataset, by):
+
+    cell_lines = get_dataset("cell_lines")
+    return _mutation_frequency(get_dataset(dataset), {i: cell_lines[i] for i in by})
+
+
+def _aggregate(dataset, labels, chunk_size, columns=None):
+    """Streams a gene by line dataset once and aggregates it for every grouping in labels."""
+    from ..candi import data
+
+    name = dataset.replace("gene_", "") if isinstance(dataset, str) else "value"
+    stat, op, margin = THRESHOLDS.get(dataset, (None, None, None))
+
+    designs = {}
+    results = {k: [] for k in labels}
+    genes = []
+    for chunk in data.iter_chunks(dataset, chunk_size, columns):
+        if not designs:
+            for by, label in labels.items():
+                designs[by] = _design(chunk.columns, label)
+
+        values = chunk.to_numpy(dtype=float)
+        genes.extend(chunk.index)
+        for by, (groups, design, members) in designs.items():
+            results[by].append(_block_stats(values, design, members, op, margin))
+
+    frames = []
+    for by, (groups, _, _) in designs.items():
+        stats = {k: np.vstack([i[k] for i in results[by]]) for k in results[by][0]}
+        index = pd.MultiIndex.from_product([pd.Index(genes, name="gene"), [by], groups],
+                                           names=["gene", "by", "group"])
+        columns = {"{0}_{1}".format(name, k): v.ravel() for k, v in stats.items() if k != "fraction"}
+        if stat is not None:
+            columns["fraction_{}".format(stat)] = stats["fraction"].ravel()
+        frames.append(pd.DataFrame(columns, index=index))
+
+    return pd.concat(frames)
+
+
+def _design(lines, label):
+    """Returns group names, a lines by groups indicator matrix and the line positions of every group."""
+    label = label.reindex(lines)
+    groups = pd.Index(sorted(label.dropna().unique()), name="group")
+    codes = groups.get_indexer(label)
+    rows = np.flatnonzero(codes >= 0)
+
+    design = sparse.csc_matrix((np.ones(len(rows)), (rows, codes[rows])), shape=(len(lines), len(groups)))
+    members = [np.flatnonzero(codes == i) for i in range(len(groups))]
+    return groups, design, members
+
+
+def _block_stats(values, design, members, op, margin):
+
+    observed = ~np.isnan(values)
+    filled = np.where(observed, values, 0.0)
+
+    n = (design.T @ observed.T.astype(float)).T
+    s = (design.T @ filled.T).T
+    q = (design.T @ (filled ** 2).T).T
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s / n
+        sd = np.sqrt(np.maximum(q - n * mean ** 2, 0.0) / (n - 1))
+        out = {"mean": mean, "median": np.full(mean.shape, np.nan), "sd": sd, "n": n}
+
+        if op is not None:
+            passing = (op(filled, margin) & observed).astype(float)
+            out["fraction"] = (design.T @ passing.T).T / n
+
+        for i, cols in enumerate(members):
+            if len(cols):
+                out["median"][:, i] = np.nanmedian(values[:, cols], axis=1)
+
+    return out
+
+
+def _mutation_frequency(mutations, labels):
+    """Fraction of the mutation profiled lines of every group with a non silent mutation in each gene."""
+    mutations = mutations.loc[mutations.Variant_Classification != "Silent", ["gene", "DepMap_ID"]].drop_duplicates()
+    profiled = pd.Index(mutations.DepMap_ID.unique())
+    genes = pd.Index(mutations.gene.unique(), name="gene")
+    gene_codes = genes.get_indexer(mutations.gene)
+
+    frames = []
+    for by, label in labels.items():
+        groups, design, _ = _design(profiled, label)
+        line_codes = profiled.get_indexer(mutations.DepMap_ID)
+        hits = sparse.csr_matrix((np.ones(len(mutations)), (gene_codes, line_codes)),
+                                 shape=(len(genes), len(profiled))) @ design
+        sizes = np.asarray(design.sum(axis=0)).ravel()
+
+        index = pd.MultiIndex.from_product([genes, [by], groups], names=["gene", "by", "group"])
+        frames.append(pd.DataFrame({"mutation_frequency": (hits.toarray() / sizes).ravel()}, index=index))
+
+    return pd.concat(frames)
@@ -0,0 +1,189 @@
+"""Helpers shared by the CanDI analysis pipelines.
+Pipelines accept cohorts and datasets in the same forms the core CanDI
+classes do, these functions turn them into plain ids and DataFrames.
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+def get_dataset(dataset):
+    """Returns a dataset as a pandas DataFrame.
+
+    Args:
+        dataset: str or pandas.core.frame.DataFrame
+            name of a dataset on the global data object (eg. "gene_effect") or an already loaded DataFrame.
+            Datasets that are not loaded yet are loaded into memory.
+    Returns:
+        pandas.core.frame.DataFrame
+    """
+    if isinstance(dataset, pd.DataFrame):
+        return dataset
+
+    from ..candi import data #imported here so pipelines can be used without installed data
+
+    if not hasattr(data, dataset):
+        raise KeyError("data has no dataset {}".format(dataset))
+
+    values = getattr(data, dataset)
+    if isinstance(values, Path):
+        values = data.load(dataset)
+
+    return values
+
+
+def source_token(dataset):
+    """Returns [file name, size, modification time] of the installed file a dataset of the global data object
+    is read from, None if it is not read from a file (eg. a DataFrame assigned to data).
+    """
+    from ..candi import data
+
+    if dataset in data.depmap_files:
+        path = data.path(dataset)
+    elif data._parser.has_option("autoload_info", dataset):
+        path = data._file_path / data._parser.get("autoload_info", dataset)
+    else:
+        return None
+
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return [path.name, stat.st_size, stat.st_mtime_ns]
+
+
+def _stored_path(name, params, sources):
+
+    from ..candi import data
+
+    tokens = [source_token(i) for i in sources]
+    if any(i is None for i in tokens):
+        return None, None
+
+    digest = hashlib.sha1(json.dumps(params, default=str).encode()).hexdigest()[:16]
+    return data._depmap_path / "derived" / "{0}-{1}.parquet".format(name, digest), json.dumps(tokens).encode()
+
+
+def read_stored(name, params, sources):
+    """Returns a DataFrame written by :func:`write_stored`.
+
+    Args:
+        name: str
+            name of the result, eg. "summary_cube"
+        params: list
+            JSON serializable parameters the result was computed with
+        sources: list
+            datasets of the global data object the result was computed from
+    Returns:
+        pandas.core.frame.DataFrame
+            None if it was never written or one of its source files changed since
+    """
+    import pyarrow.parquet as pq
+
+    path, tokens = _stored_path(name, params, sources)
+    if path is None or not path.exists():
+        return None
+    try:
+        table = pq.read_table(path)
+    except (OSError, ValueError):
+        return None
+
+    if (table.schema.metadata or {}).get(b"candi_sources") != tokens:
+        return None
+    return table.to_pandas()
+
+
+def write_stored(name, params, sources, df):
+    """Writes a DataFrame next to the datasets it was computed from, so every kernel reuses it until
+    one of the source files changes. Nothing is written for sources that are not installed files or
+    if the install is not writeable.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path, tokens = _stored_path(name, params, sources)
+    if path is None:
+        return
+
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata(dict(table.schema.metadata or {}, candi_sources=tokens))
+    part = "{0}.{1}.part".format(path, os.getpid())
+    try:
+        os.makedirs(path.parent, exist_ok=True)
+        pq.write_table(table, part)
+        os.replace(part, path)
+    except OSError:
+        if os.path.exists(part):
+            os.remove(part)
+
+
+def cohort_ids(cohort):
+    """Returns the DepMap_IDs of a cohort.
+
+    Args:
+        cohort: list, numpy.ndarray, pandas.Index, Cancer, CellLineCluster or CellLine
+            cohort of cell lines. CanDI objects are resolved through their depmap_ids.
+    Returns:
+        list
+    """
+    if hasattr(cohort, "depmap_ids"):
+        return list(cohort.depmap_ids)
+    elif hasattr(cohort, "depmap_id"):
+        return [cohort.depmap_id]
+    elif isinstance(cohort, str):
+        return [cohort]
+
+    return list(cohort)
+
+
+def gene_ids(genes):
+    """Returns the gene symbols of a set of genes.
+
+    Args:
+        genes: list, numpy.ndarray, pandas.Index, Gene, GeneCluster or Organelle
+            genes as symbols or CanDI objects. CanDI objects are resolved through their symbol or genes.
+    Returns:
+        list
+    """
+    if hasattr(genes, "symbol"):
+        return [genes.symbol]
+    elif hasattr(genes, "genes"):
+        return list(genes.genes)
+    elif isinstance(genes, str):
+        return [genes]
+
+    return [i.symbol if hasattr(i, "symbol") else i for i in genes]
+
+
+def bh_fdr(pvalues):
+    """Benjamini-Hochberg adjusted p-values.
+    NaN p-values are ignored and stay NaN in the output.
+
+    Args:
+        pvalues: array-like
+            p-values of any shape, all of them are treated as one family of tests.
+    Returns:
+        numpy.ndarray
+            adjusted p-values with the same shape as pvalues
+    """
+    pvalues = np.asarray(pvalues, dtype=float)
+    flat = pvalues.ravel()
+    out = np.full(flat.shape, np.nan)
+
+    tested = ~np.isnan(flat)
+    n = tested.sum()
+    if n == 0:
+        return out.reshape(pvalues.shape)
+
+    vals = flat[tested]
+    order = np.argsort(vals)
+    scaled = vals[order] * n / np.arange(1, n + 1)
+    scaled = np.minimum.accumulate(scaled[::-1])[::-1]
+
+    adjusted = np.empty(n)
+    adjusted[order] = np.minimum(scaled, 1.0)
+    out[tested] = adjusted
+
+    return out.reshape(pvalues.shape)
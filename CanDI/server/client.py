@@ -0,0 +1,136 @@
+"""Thin client of candi-serve mirroring the CanDI classes.
+It does not import the datasets, objects are proxies whose queries run on the server.
+
+    from CanDI.server import Client
+
+    candi = Client("http://127.0.0.1:8765") #or Client("/tmp/candi.sock")
+    tp53 = candi.Gene("TP53")
+    tp53.essential(style="values")
+    tp53.gene_effect
+"""
+import json
+import socket
+import http.client
+from urllib.parse import urlparse
+
+from . import protocol
+
+
+class ServerError(RuntimeError):
+    """Raised for server side failures that are not re-raised with their own type."""
+
+
+class _UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class Client(object):
+    """Connection to a candi-serve server.
+
+    Args:
+        address: str, optional
+            http://host:port of the server or the path of its unix socket
+        as_arrow: bool, optional
+            return frames as pyarrow Tables instead of pandas objects
+        timeout: float, optional
+            seconds to wait for a response
+    """
+    def __init__(self, address="http://127.0.0.1:8765", as_arrow=False, timeout=300.0):
+
+        self.address = address
+        self.as_arrow = as_arrow
+        self.timeout = timeout
+        self._api = self._request("GET", "/api")
+
+        for name in self._api:
+            setattr(self, name, _Factory(self, name))
+
+    def _connection(self):
+
+        if "://" not in self.address:
+            return _UnixConnection(self.address, self.timeout)
+        url = urlparse(self.address)
+        return http.client.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+
+    def _request(self, method, path, payload=None):
+
+        connection = self._connection()
+        try:
+            body = None if payload is None else json.dumps(payload).encode()
+            connection.request(method, path, body=body, headers={"Content-Type": protocol.JSON})
+            response = connection.getresponse()
+            content_type, data = response.getheader("Content-Type"), response.read()
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            error = json.loads(data)
+            raise protocol.ERRORS.get(error["error"], ServerError)(error["message"])
+        if method == "GET":
+            return json.loads(data)
+        return protocol.decode(content_type, data, self.as_arrow)
+
+    def query(self, entity, args=(), kwargs=None, method=None, method_args=(), method_kwargs=None, attr=None):
+        """Sends one query, see CanDI.server.server for the request format."""
+        request = {"entity": entity, "args": list(args), "kwargs": kwargs or {}}
+        if method is not None:
+            request.update(method=method, method_args=list(method_args), method_kwargs=method_kwargs or {})
+        else:
+            request["attr"] = attr
+        return self._request("POST", "/query", request)
+
+    def stats(self):
+        """Returns the server's load, cache metrics and loaded datasets."""
+        return self._request("GET", "/stats")
+
+
+class _Factory(object):
+
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        return RemoteEntity(self._client, self._name, args, kwargs)
+
+    def __repr__(self):
+        return "<remote class {}>".format(self._name)
+
+
+class RemoteEntity(object):
+    """Proxy of a CanDI object on the server.
+    Query methods and attributes (datasets, names, ids) are forwarded to the server.
+    """
+    def __init__(self, client, entity, args, kwargs):
+
+        self._client = client
+        self._entity = entity
+        self._args = list(args)
+        self._kwargs = kwargs
+
+    def __getattr__(self, attr):
+
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+
+        if attr in self._client._api[self._entity]:
+            def method(*args, **kwargs):
+                return self._client.query(self._entity, self._args, self._kwargs, attr, args, kwargs)
+            method.__name__ = attr
+            return method
+
+        return self._client.query(self._entity, self._args, self._kwargs, attr=attr)
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(self._client._api[self._entity]))
+
+    def __repr__(self):
+        return "<remote {0}({1})>".format(self._entity, ", ".join(repr(i) for i in self._args))
@@ -0,0 +1,56 @@
+"""Encoding of query results shared by the CanDI server and client.
+DataFrames and Series travel as Arrow IPC streams, everything else as JSON.
+"""
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+ARROW = "application/vnd.apache.arrow.stream"
+JSON = "application/json"
+
+#exceptions re-raised with their own type by the client
+ERRORS = {i.__name__: i for i in [KeyError, ValueError, AttributeError, TypeError, IndexError, AssertionError]}
+
+
+def encode(value):
+    """Returns (content type, body) of a query result."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        kind = b"series" if isinstance(value, pd.Series) else b"frame"
+        frame = value.to_frame(name="__series__" if value.name is None else value.name) if kind == b"series" else value
+        frame = frame.rename(columns=str)
+
+        table = pa.Table.from_pandas(frame, preserve_index=True)
+        table = table.replace_schema_metadata(dict(table.schema.metadata or {}, candi=kind))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return ARROW, sink.getvalue().to_pybytes()
+
+    return JSON, json.dumps({"value": value}, default=_default).encode()
+
+
+def decode(content_type, body, as_arrow=False):
+    """Inverse of encode. Arrow results are returned as pyarrow Tables if as_arrow."""
+    if content_type != ARROW:
+        return json.loads(body)["value"]
+
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    if as_arrow:
+        return table
+
+    frame = table.to_pandas()
+    if table.schema.metadata.get(b"candi") == b"series":
+        series = frame.iloc[:, 0]
+        return series.rename(None) if series.name == "__series__" else series
+    return frame
+
+
+def _default(value):
+
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    elif isinstance(value, (np.ndarray, pd.Index, set)):
+        return list(value)
+    raise TypeError("cannot encode {}".format(type(value).__name__))
@@ -0,0 +1,256 @@
+"""Local query server holding one warm Data instance.
+Queries of the CanDI classes are sent as JSON, results come back as Arrow IPC or JSON.
+
+    candi-serve --port 8765
+    candi-serve --socket /tmp/candi.sock --datasets gene_effect expression
+
+    POST /query {"entity": "Gene", "args": ["TP53"], "method": "essential", "method_kwargs": {"style": "values"}}
+    POST /query {"entity": "Cancer", "args": ["Lung Cancer"], "attr": "gene_effect"}
+    GET /api, GET /stats
+"""
+import os
+import json
+import inspect
+import argparse
+import threading
+import traceback
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from . import protocol
+from ..structures.cache import SliceCache, MISSING
+from ..structures.telemetry import instrument
+
+
+ENTITIES = ["Gene", "CellLine", "Cancer", "Organelle", "GeneCluster", "CellLineCluster"]
+
+#read only query methods served to clients. Methods that write files (export), return generators
+#(iter_blocks) or coroutines (the a* methods) are never served.
+QUERIES = {"essential", "non_essential", "dependent", "non_dependent", "expressed", "unexpressed",
+           "duplication", "deletion", "cn_normal", "mutated", "effect_of", "dependency_of", "expression_of",
+           "mutation_matrix", "summary", "pan_cancer_summary", "similar", "profile", "top",
+           "copy_number_in", "variants_in", "nearest_variants"}
+
+
+def api():
+    """Returns the query methods of every served class."""
+    from .. import candi
+
+    methods = {}
+    for name in ENTITIES:
+        cls = getattr(candi, name)
+        methods[name] = sorted(k for k, v in inspect.getmembers(cls, inspect.isfunction)
+                               if k in QUERIES and not inspect.iscoroutinefunction(v)) #results must be encodable
+    return methods
+
+
+class Server(object):
+    """Answers queries against the global data object.
+
+    Args:
+        datasets: list, optional
+            datasets loaded before serving, defaults to every installed dataset
+        cache_bytes: int, optional
+            size of the cache of encoded responses
+        max_concurrency: int, optional
+            number of queries computed at once, further requests wait up to queue_timeout seconds
+        queue_timeout: float, optional
+            requests still waiting after this many seconds get a 503 response
+    """
+    def __init__(self, datasets=None, cache_bytes=2**28, max_concurrency=4, queue_timeout=30.0):
+        from .. import candi
+
+        self.data = candi.data
+        for key in self.data.depmap_files if datasets is None else datasets:
+            if isinstance(getattr(self.data, key, None), Path):
+                self.data.load(key)
+
+        self.api = api()
+        self.responses = SliceCache(cache_bytes)
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def query(self, request):
+        """Returns (status, content type, body) of a query, cached by the canonical request."""
+        key = ("responses", json.dumps(request, sort_keys=True))
+        cached = self.responses.get(key)
+        if cached is not MISSING:
+            return 200, cached[0], cached[1]
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            return 503, protocol.JSON, _error("Busy", "{} queries are already running".format(self.max_concurrency))
+
+        with self._lock:
+            self.active += 1
+        try:
+            content_type, body = protocol.encode(self._run(request))
+        except (LookupError, ValueError, AttributeError, TypeError, AssertionError) as e:
+            return 400, protocol.JSON, _error(type(e).__name__, str(e))
+        except Exception as e:
+            return 500, protocol.JSON, _error(type(e).__name__, "".join(traceback.format_exception_only(type(e), e)))
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._slots.release()
+
+        self.responses.put(key, (content_type, body), 0)
+        return 200, content_type, body
+
+    @instrument("Server.query", label=lambda args: "{0}.{1}".format(args[1].get("entity"),
+                                                                    args[1].get("method") or args[1].get("attr")))
+    def _run(self, request):
+        from .. import candi
+
+        entity = request.get("entity")
+        if entity not in self.api:
+            raise KeyError("unknown class {}".format(entity))
+
+        obj = getattr(candi, entity)(*request.get("args", []), **request.get("kwargs", {}))
+        method, attr = request.get("method"), request.get("attr")
+        if method is not None:
+            if method not in self.api[entity]:
+                raise AttributeError("{0} has no query method {1}".format(entity, method))
+            self._check_loaded(_reads(type(obj), method, request))
+            return getattr(obj, method)(*request.get("method_args", []), **request.get("method_kwargs", {}))
+
+        if not attr or attr.startswith("_") or attr in self.api[entity]:
+            raise AttributeError("{0} has no attribute {1}".format(entity, attr))
+        self._check_loaded([attr])
+        return getattr(obj, attr)
+
+    def _check_loaded(self, keys):
+        """Unloaded datasets are never read by queries, the grabber would ask for them on the server's stdin."""
+        for key in keys:
+            if isinstance(getattr(self.data, key, None), Path):
+                raise ValueError("{} is not loaded on the server".format(key))
+
+    def stats(self):
+
+        return {"active": self.active, "rejected": self.rejected, "max_concurrency": self.max_concurrency,
+                "responses": self.responses.stats(),
+                "loaded": [k for k in self.data.depmap_files if not isinstance(getattr(self.data, k, None), Path)]}
+
+
+def _reads(cls, method, request):
+    """Datasets a method query reads: those of its awaitable version and the datasets named in its arguments."""
+    datasets = list(getattr(getattr(cls, "a" + method, None), "datasets", ()))
+    arguments = list(request.get("method_args", [])) + list(request.get("method_kwargs", {}).values())
+    return datasets + [i for i in arguments if isinstance(i, str)]
+
+
+def _error(kind, message):
+    return json.dumps({"error": kind, "message": message}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    server_version = "candi-serve"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+
+        if self.path == "/api":
+            self._send(200, protocol.JSON, json.dumps(self.server.candi.api).encode())
+        elif self.path == "/stats":
+            self._send(200, protocol.JSON, json.dumps(self.server.candi.stats()).encode())
+        elif self.path == "/health":
+            self._send(200, protocol.JSON, b'{"status": "ok"}')
+        else:
+            self._send(404, protocol.JSON, _error("NotFound", self.path))
+
+    def do_POST(self):
+
+        if self.path != "/query":
+            return self._send(404, protocol.JSON, _error("NotFound", self.path))
+        if self.headers.get_content_type() != protocol.JSON: #no cross site form or text/plain posts
+            return self._send(415, protocol.JSON, _error("ValueError", "requests must be sent as " + protocol.JSON))
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            assert isinstance(request, dict)
+        except (ValueError, AssertionError):
+            return self._send(400, protocol.JSON, _error("ValueError", "request must be a JSON object"))
+
+        self._send(*self.server.candi.query(request))
+
+    def _send(self, status, content_type, body):
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self): #unix socket clients have no address
+
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(server, host="127.0.0.1", port=8765, socket_path=None, verbose=False):
+    """Returns the http server answering with server, on a unix socket if socket_path is given."""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        httpd = UnixHTTPServer(socket_path, Handler)
+    else:
+        httpd = ThreadingHTTPServer((host, port), Handler)
+
+    httpd.candi = server
+    httpd.verbose = verbose
+    return httpd
+
+
+def serve(server, host="127.0.0.1", port=8765, socket_path=None, verbose=False):
+    """Serves queries until interrupted."""
+    httpd = make_server(server, host, port, socket_path, verbose)
+    address = socket_path or "http://{0}:{1}".format(host, httpd.server_address[1])
+    print("Serving CanDI on {}".format(address), flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve CanDI queries from one warm copy of the datasets")
+    parser.add_argument("--host", help="Address to listen on", default="127.0.0.1")
+    parser.add_argument("--port", help="Port to listen on", type=int, default=8765)
+    parser.add_argument("--socket", help="Listen on this unix socket instead of a port", default=None)
+    parser.add_argument("--datasets", help="Datasets to load, defaults to all installed datasets", nargs="*", default=None)
+    parser.add_argument("--cache-bytes", help="Size of the response cache", type=int, default=2**28)
+    parser.add_argument("--max-concurrency", help="Queries computed at once", type=int, default=4)
+    parser.add_argument("--queue-timeout", help="Seconds a request waits for a free slot", type=float, default=30.0)
+    parser.add_argument("--verbose", help="Log every request", action="store_true")
+    args = parser.parse_args()
+
+    server = Server(args.datasets, args.cache_bytes, args.max_concurrency, args.queue_timeout)
+    serve(server, args.host, args.port, args.socket, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,17 @@
 https://doi.org/10.7910/DVN/JIAT0H
 """
 import os
+import time
+import hashlib
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import sys
 
 
 CANDI_DATAVERSE_DOI = 'doi:10.7910/DVN/JIAT0H'
+CANDI_DATAVERSE_RELEASE = '21Q4' # the only DepMap release uploaded to the CanDI dataverse
 
 
 ### Datasets Metadata ###
@@ -80,57 +85,243 @@ def print_sys(s):
 
 ### Downloading scripts ###
 
+def fetch_manifest(doi=CANDI_DATAVERSE_DOI, server="https://dataverse.harvard.edu"):
+    """fetch the size and checksum of every file in a dataverse dataset
+
+    Args:
+        doi (str): persistent id of the dataset
+        server (str): the dataverse server
+
+    Returns:
+        dict: a dictionary mapping from file id to {"size": int, "checksum": [type, value], "original": bool}.
+            Ingested tabular files are served in a derived format, their entry describes the original upload,
+            which is downloaded instead (see Downloader.url).
+    """
+    url = f"{server}/api/datasets/:persistentId/?persistentId={doi}"
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+
+    manifest = {}
+    for entry in response.json()["data"]["latestVersion"]["files"]:
+        file = entry["dataFile"]
+        # the checksum of an ingested file is that of its original, so is the original size
+        original = "originalFileSize" in file
+        checksum = file.get("checksum", {"type": "MD5", "value": file.get("md5")})
+        manifest[file["id"]] = {"size": file["originalFileSize"] if original else file["filesize"],
+                                "checksum": [checksum["type"], checksum["value"]],
+                                "original": original}
+
+    return manifest
+
+
 class Downloader:
-    def __init__(self):
-        pass
+    def __init__(self, server_path="https://dataverse.harvard.edu/api/access/datafile/", manifest="auto",
+                 max_workers=4, retries=5, backoff=1.0, chunk_size=2**20, timeout=60):
+        """concurrent, resumable and verified downloads of dataverse files
+
+        Args:
+            server_path (str): the url files are requested from, followed by their id
+            manifest (dict or str): a dictionary mapping from file id to {"size": int, "checksum": [type, value]}.
+                "auto" fetches it from dataverse, None checks files against the size reported by the server.
+            max_workers (int): the number of files downloaded at the same time
+            retries (int): the number of attempts per file before giving up
+            backoff (float): seconds to wait before the first retry, doubled for every following retry
+            chunk_size (int): the number of bytes written per read from the connection
+            timeout (float): seconds to wait for the server before retrying
+        """
+        self.server_path = server_path
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._local = threading.local()
+
+        if manifest == "auto":
+            try:
+                manifest = fetch_manifest()
+            except (requests.RequestException, KeyError, ValueError):
+                print_sys("Could not fetch the dataverse manifest, files are only checked against the size "
+                          "reported by the server")
+                manifest = None
+
+        self.manifest = {int(k): v for k, v in (manifest or {}).items()}
+
+    @property
+    def session(self):
+        """one pooled requests session per download thread"""
+        if not hasattr(self._local, "session"):
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+
+        return self._local.session
+
+    def url(self, file_id):
+        """the download url of a file, the original upload for ingested tabular files
+
+        Args:
+            file_id (int): the dataverse id of the file
+
+        Returns:
+            str: the url
+        """
+        url = self.server_path + str(file_id)
+        if self.manifest.get(file_id, {}).get("original"):
+            url += "?format=original"
+
+        return url
+
+    def remote_size(self, url):
+        """the size of a file reported by the server, None if it does not report one
+
+        Args:
+            url (str): the url of the file
+
+        Returns:
+            int: the number of bytes
+        """
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+
+        length = response.headers.get("content-length")
+        return int(length) if length is not None else None
 
-    def _dataverse_download(self, url, path, name, types):
-        """dataverse download helper with progress bar
+    def verify(self, file_path, file_id, size=None):
+        """check a local file against the manifest
+
+        Args:
+            file_path (str): the path of the local file
+            file_id (int): the dataverse id of the file
+            size (int): the size reported by the server, checked if the file is not in the manifest
+
+        Returns:
+            bool: True if size and checksum match. Files that are not in the manifest only need to match size,
+                or to exist if size is None.
+        """
+        expected = self.manifest.get(file_id)
+        if expected is None:
+            return os.path.exists(file_path) and (size is None or os.path.getsize(file_path) == size)
+
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != expected["size"]:
+            return False
+
+        algorithm, value = expected["checksum"]
+        digest = hashlib.new(algorithm.lower().replace("-", ""))
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(self.chunk_size), b""):
+                digest.update(block)
+
+        return digest.hexdigest() == value
+
+    def _dataverse_download(self, url, path, name, types, file_id=None, position=0):
+        """dataverse download helper with progress bar, resume and retries
+
+        The file is written to <name>.<type>.part and only renamed once it is complete and verified.
+        An interrupted download is resumed with an HTTP Range request.
 
         Args:
             url (str): the url of the dataset
             path (str): the path to save the dataset
             name (str): the dataset name
             types (dict): a dictionary mapping from the dataset name to the file format
+            file_id (int): the dataverse id of the file, used to look it up in the manifest
+            position (int): the line of the progress bar
         """
         save_path = os.path.join(path, f"{name}.{types[name]}")
-        response = requests.get(url, stream=True)
-        total_size_in_bytes = int(response.headers.get("content-length", 0))
-        block_size = 1024
-        progress_bar = tqdm(total=total_size_in_bytes, unit="iB", unit_scale=True)
-        with open(save_path, "wb") as file:
-            for data in response.iter_content(block_size):
-                progress_bar.update(len(data))
-                file.write(data)
-        progress_bar.close()
-
-
-    def _download_wrapper(self, name, path, return_type=None):
+        part_path = save_path + ".part"
+        expected = self.manifest.get(file_id, {}).get("size")
+
+        for attempt in range(self.retries):
+            try:
+                total = self._fetch(url, part_path, name, expected, position)
+                if not self.verify(part_path, file_id, total):
+                    os.remove(part_path)
+                    raise IOError(f"{name} does not match the manifest")
+                os.replace(part_path, save_path)
+                return
+
+            except (requests.RequestException, IOError) as e:
+                if attempt == self.retries - 1:
+                    raise RuntimeError(f"Downloading {name} failed after {self.retries} attempts") from e
+                wait = self.backoff * 2 ** attempt
+                print_sys(f"Downloading {name} failed ({e}), retrying in {wait:.0f}s")
+                time.sleep(wait)
+
+    def _fetch(self, url, part_path, name, expected, position):
+        """stream url to part_path, continuing from the bytes already on disk
+
+        Returns:
+            int: the size of the whole file reported by the server, None if it did not report one
+        """
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if expected is not None and offset >= expected:
+            if offset > expected:
+                os.remove(part_path)
+                offset = 0
+            else:
+                return expected
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.session.get(url, stream=True, headers=headers, timeout=self.timeout) as response:
+            if response.status_code == 416: # nothing left to send, the part file is complete
+                return _range_total(response)
+            response.raise_for_status()
+
+            if response.status_code != 206: # the server ignored the range, start over
+                offset = 0
+
+            reported = _range_total(response) if response.status_code == 206 else None
+            if reported is None and "content-length" in response.headers:
+                reported = offset + int(response.headers["content-length"])
+            total = reported or 0
+            progress_bar = tqdm(total=total, initial=offset, unit="iB", unit_scale=True, desc=name, position=position)
+            with open(part_path, "ab" if offset else "wb") as file:
+                for data in response.iter_content(self.chunk_size):
+                    progress_bar.update(len(data))
+                    file.write(data)
+            progress_bar.close()
+
+            if offset + progress_bar.n < total:
+                raise IOError(f"connection closed after {progress_bar.n} of {total - offset} bytes")
+
+        return reported
+
+
+    def _download_wrapper(self, name, path, return_type=None, position=0):
         """wrapper for downloading a dataset given the name and path, for csv,pkl,tsv or similar files
 
         Args:
             name (str): the rough dataset query name
             path (str): the path to save the dataset
             return_type (str, optional): the return type. Defaults to None. Can be "url", "name", or ["url", "name"]
+            position (int): the line of the progress bar
 
         Returns:
             str: the exact dataset query name
         """
-        server_path = "https://dataverse.harvard.edu/api/access/datafile/"
-
-        url = server_path + str(name2id[name])
+        url = self.url(name2id[name])
 
         if not os.path.exists(path):
-            os.mkdir(path)
+            os.makedirs(path, exist_ok=True)
 
         file_name = f"{name}.{name2type[name]}"
 
-        if os.path.exists(os.path.join(path, file_name)):
-            print_sys("Found local copy...")
-            os.path.join(path, file_name)
+        local_path = os.path.join(path, file_name)
+        size = None
+        if name2id[name] not in self.manifest and os.path.exists(local_path):
+            size = self.remote_size(url)
+
+        if self.verify(local_path, name2id[name], size):
+            print_sys(f"Found local copy of {file_name}...")
         else:
-            print_sys("Downloading...")
-            self._dataverse_download(url, path, name, name2type)
+            print_sys(f"Downloading {file_name}...")
+            self._dataverse_download(url, path, name, name2type, file_id=name2id[name], position=position)
         
         if return_type == "url":
             return url
@@ -141,20 +332,22 @@ class Downloader:
 
     
     def run(self, path, datasets, return_type=None):
-        """download all datasets to the path
+        """download all datasets to the path, several at a time
 
         Args:
             path (str): the path to save the datasets
             return_type (str, optional): the return type. Defaults to None. Can be "url", "name", or ["url", "name"]
         """
-        url_list = []
-        file_names = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._download_wrapper, name, path, ["url", "name"], i)
+                for i, name in enumerate(datasets)
+            ]
+            results = [future.result() for future in futures]
+
+        url_list = [url for url, _ in results]
+        file_names = [file_name for _, file_name in results]
 
-        for name in datasets:
-            url, file_name = self._download_wrapper(name, path, return_type=["url", "name"])
-            url_list.append(url)
-            file_names.append(file_name)
-        
         if return_type == "url":
             return url_list
         elif return_type == "name":
@@ -163,17 +356,23 @@ class Downloader:
             return url_list, file_names
 
 
+def _range_total(response):
+    """the total size in the Content-Range header of a response, None if it has none"""
+    total = response.headers.get("content-range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
 class DepMapDownloader(Downloader):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
     
     def download(self, path, return_type=None):
         return self.run(path, depmap_dataset_names, return_type)
 
 
 class CoessentialityDownloader(Downloader):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
     
     def download(self, path, return_type=None):
         return self.run(path, coessentiality_dataset_names, return_type)
\ No newline at end of file
@@ -0,0 +1,388 @@
+"""
+The ingest module turns DepMap downloads into CanDI's on-disk format while they stream in.
+Records are parsed as bytes arrive, the transformations of BroadDepMap.format_depmap_data
+are applied batch by batch and the result is written to parquet, so installing makes a
+single pass over the data.
+"""
+
+import io
+import os
+import codecs
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+MATRIX_MARKERS = ("AAAS (8086)", "AAAS (ENSG00000094914)") #columns that identify gene score matrices
+
+
+def is_matrix(columns):
+    """Returns True if columns are the header of a cell line by gene score matrix."""
+    return any(i in columns for i in MATRIX_MARKERS)
+
+
+def format_matrix_columns(columns):
+    """Strips gene ids from matrix columns, "AAAS (8086)" becomes "AAAS".
+    The unnamed first column holding the cell lines becomes DepMap_ID.
+    """
+    columns = [i.split(" ")[0] for i in columns]
+    return ["DepMap_ID" if i in ("", "Unnamed:") else i for i in columns]
+
+
+def format_table(df):
+    """Applies the DepMap table transformations to a DataFrame or to a batch of one.
+
+    Mutation tables lose their unnamed index column, Hugo_Symbol is renamed gene and
+    fusion gene columns like "KRAS (ENSG00000133703)" are split into a gene and an EnsemblID column.
+    """
+    if "Protein_Change" in df.columns:
+        df = df.drop(columns=[i for i in df.columns if i == "" or i.startswith("Unnamed: 0")])
+
+    if "Hugo_Symbol" in df.columns:
+        df = df.rename(columns={"Hugo_Symbol": "gene"})
+
+    if "LeftGene" in df.columns:
+        for col in [i for i in df.columns if "Gene" in i]:
+            split_cols = df[col].astype("string").str.split(" ", n=1, expand=True).reindex(columns=[0, 1])
+            df[col] = split_cols[0]
+            df[col[:-4] + "EnsemblID"] = split_cols[1].str.replace("(", "").str.replace(")", "")
+
+    return df
+
+
+def iter_records(chunks, encoding="utf-8"):
+    """Decodes a stream of bytes into complete csv records.
+    Multibyte characters split across chunks and quoted fields spanning lines are kept intact.
+
+    Args:
+        chunks: iterable
+            bytes as they arrive, eg. requests.Response.iter_content()
+        encoding: str, optional
+    Returns:
+        generator
+            yields one str per record, including its line ending
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    record = ""
+    quoted = False
+
+    def split(text):
+        nonlocal record, quoted
+        for line in text.split("\n")[:-1]:
+            record += line + "\n"
+            quoted ^= line.count('"') % 2 == 1
+            if not quoted:
+                yield record
+                record = ""
+
+    for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        #the last line may be incomplete, keep it until the next chunk
+        cut = text.rfind("\n") + 1
+        pending = text[cut:]
+        yield from split(text[:cut])
+
+    pending += decoder.decode(b"", final=True)
+    yield from split(pending + "\n" if pending else "")
+    if record:
+        yield record
+
+
+def ingest(chunks, path, batch_size=50000, block_size=2000, encoding="utf-8", memory_limit=None, progress=False):
+    """Streams a DepMap csv or tsv download into a formatted parquet file.
+
+    Gene score matrices are written gene-indexed (rows are genes, columns are DepMap_IDs)
+    like BroadDepMap.format_depmap_data does, all other tables are written with format_table applied.
+    With a memory_limit, batches of records and blocks of written genes are sized from it like
+    :func:`transpose_matrix_csv` sizes its blocks.
+
+    Args:
+        chunks: iterable
+            bytes as they arrive, eg. requests.Response.iter_content()
+        path: str or pathlib.Path
+            output parquet file, written to <path>.part and renamed once complete
+        batch_size: int, optional
+            number of records parsed and written at once
+        block_size: int, optional
+            number of genes per row group when writing matrices
+        encoding: str, optional
+        memory_limit: int or str, optional
+            approximate ceiling for the memory used by a batch or block, eg. 2GB. Bounds batch_size and block_size.
+        progress: bool, optional
+            show a progress bar while writing matrices
+    Returns:
+        str
+            path of the written file
+    """
+    limit = None if memory_limit is None else parse_size(memory_limit)
+    path = str(path)
+    part = path + ".part"
+    records = iter_records(chunks, encoding)
+
+    header = next(records, None)
+    if header is None:
+        raise ValueError("{} is empty".format(path))
+
+    sep = "\t" if "\t" in header else ","
+    columns = next(iter(pd.read_csv(io.StringIO(header), sep=sep, header=None, dtype=str, keep_default_na=False).values))
+
+    try:
+        if is_matrix(columns):
+            _ingest_matrix(records, header, sep, part, batch_size, block_size, limit, progress)
+        else:
+            max_bytes = None if limit is None else max(1, limit // OVERHEAD)
+            _ingest_table(records, header, sep, part, batch_size, max_bytes)
+    except BaseException:
+        if os.path.exists(part): #no half written file is left behind
+            os.remove(part)
+        raise
+
+    os.replace(part, path)
+    return path
+
+
+def _batches(records, batch_size, max_bytes=None):
+    """Joins records into batches of at most batch_size records and, if given, about max_bytes characters."""
+    batch = []
+    size = 0
+    for record in records:
+        batch.append(record)
+        size += len(record)
+        if len(batch) == batch_size or (max_bytes is not None and size >= max_bytes):
+            yield "".join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield "".join(batch)
+
+
+def _ingest_table(records, header, sep, part, batch_size, max_bytes=None):
+
+    writer = None
+    dtypes = None
+
+    for text in _batches(records, batch_size, max_bytes):
+        if dtypes is None:
+            df = pd.read_csv(io.StringIO(header + text), sep=sep, low_memory=False)
+            #later batches are read with the types inferred from the first one so the schema stays fixed
+            dtypes = {k: _stable_dtype(v) if df[k].notna().any() else "string" for k, v in df.dtypes.items()}
+            df = df.astype(dtypes)
+        else:
+            df = _read_typed(header + text, sep, dtypes)
+
+        table = pa.Table.from_pandas(format_table(df), preserve_index=False,
+                                     schema=writer.schema if writer else None)
+        if writer is None:
+            writer = pq.ParquetWriter(part, table.schema)
+        writer.write_table(table)
+
+    if writer is None: #header only
+        df = format_table(pd.read_csv(io.StringIO(header), sep=sep))
+        writer = pq.ParquetWriter(part, pa.Table.from_pandas(df, preserve_index=False).schema)
+    writer.close()
+
+
+def _stable_dtype(dtype):
+
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    elif pd.api.types.is_integer_dtype(dtype):
+        return "Int64"
+    elif pd.api.types.is_float_dtype(dtype):
+        return "float64"
+    return "string"
+
+
+def _read_typed(text, sep, dtypes):
+
+    try:
+        return pd.read_csv(io.StringIO(text), sep=sep, dtype=dtypes, low_memory=False)
+    except (ValueError, TypeError):
+        #a value that does not fit the inferred type, coerce it to missing instead of failing the install
+        df = pd.read_csv(io.StringIO(text), sep=sep, dtype=str, low_memory=False)
+        for k, v in dtypes.items():
+            if v == "boolean":
+                df[k] = df[k].map({"True": True, "False": False}).astype(v)
+            elif v != "string":
+                values = pd.to_numeric(df[k], errors="coerce")
+                df[k] = values.where(values == values.round()).astype(v) if v == "Int64" else values
+        return df
+
+
+def _ingest_matrix(records, header, sep, part, batch_size, block_size, limit=None, progress=False):
+    """Cell lines arrive as rows, they are split into column tiles of block_size genes
+    which are then written out gene block by gene block.
+    With a limit, batches of cell lines are sized from the number of genes and written blocks
+    of genes from the number of cell lines, once it is known.
+    """
+    columns = list(pd.read_csv(io.StringIO(header), sep=sep, index_col=0).columns)
+    genes = format_matrix_columns(columns)
+    lines = []
+    if limit is not None:
+        batch_size = max(1, limit // (8 * max(len(genes), 1) * OVERHEAD))
+
+    store = TileStore(len(genes), block_size, os.path.dirname(os.path.abspath(part)))
+    try:
+        for text in _batches(records, batch_size):
+            df = pd.read_csv(io.StringIO(header + text), sep=sep, index_col=0, low_memory=False)
+            lines.extend(df.index.astype(str))
+            store.append(df.to_numpy(dtype=np.float64))
+
+        width = None if limit is None else max(1, limit // (8 * max(len(lines), 1) * OVERHEAD))
+        writer = None
+        with tqdm(total=len(genes), desc="Writing {}".format(os.path.basename(part)[:-len(".part")]),
+                  unit="genes", disable=not progress) as bar:
+            for start, tile in store.blocks(width):
+                block = pd.DataFrame(tile.T, columns=lines)
+                block.insert(0, "gene", genes[start:start + tile.shape[1]])
+
+                table = pa.Table.from_pandas(block, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(part, table.schema)
+                writer.write_table(table)
+                bar.update(tile.shape[1])
+        writer.close()
+    finally:
+        store.close()
+
+
+OVERHEAD = 4 #peak memory of a block relative to its raw float64 size (copies made by pandas and csv formatting)
+
+
+class TileStore(object):
+    """Scratch store for out-of-core transposes.
+    Row blocks are split into tiles of width columns and each tile is appended to its own file,
+    so a block of columns is read back with one sequential read of rows by width values.
+    """
+    def __init__(self, n_cols, width, directory=None):
+
+        self.n_cols = n_cols
+        self.width = max(1, int(width))
+        self.n_rows = 0
+        self._dir = tempfile.mkdtemp(prefix="candi_tiles_", dir=directory)
+
+    def _tile_path(self, start):
+        return os.path.join(self._dir, "{}.f8".format(start))
+
+    def append(self, block):
+        """Appends a rows by n_cols block."""
+        block = np.asarray(block, dtype=np.float64)
+        assert block.shape[1] == self.n_cols, "block must have {} columns".format(self.n_cols)
+
+        for start in range(0, self.n_cols, self.width):
+            with open(self._tile_path(start), "ab") as f:
+                f.write(np.ascontiguousarray(block[:, start:start + self.width]).tobytes())
+        self.n_rows += block.shape[0]
+
+    def __iter__(self):
+        """Yields (first column, rows by width array) for every tile."""
+        for start in range(0, max(self.n_cols, 1), self.width):
+            width = min(self.width, self.n_cols - start)
+            if self.n_rows == 0:
+                yield start, np.empty((0, width))
+            else:
+                yield start, np.fromfile(self._tile_path(start), dtype=np.float64).reshape(self.n_rows, width)
+
+    def blocks(self, width=None):
+        """Yields (first column, rows by columns array) in blocks of at most width columns.
+        Blocks narrower than a tile are read from a memory map of the tile, so only the block is held in memory.
+        """
+        width = self.width if width is None else max(1, min(int(width), self.width))
+        for start, tile in self._maps():
+            for offset in range(0, tile.shape[1], width):
+                yield start + offset, np.array(tile[:, offset:offset + width])
+
+    def _maps(self):
+
+        for start in range(0, max(self.n_cols, 1), self.width):
+            width = min(self.width, self.n_cols - start)
+            if self.n_rows == 0:
+                yield start, np.empty((0, width))
+            else:
+                yield start, np.memmap(self._tile_path(start), dtype=np.float64, mode="r", shape=(self.n_rows, width))
+
+    def close(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+def parse_size(size):
+    """Converts a memory size like 4GB, 512MB or a number of bytes to bytes."""
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    units = {"KB": 2**10, "MB": 2**20, "GB": 2**30, "TB": 2**40, "B": 1}
+    size = size.strip().upper()
+    for unit, factor in units.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+
+    return int(size)
+
+
+def count_rows(path, chunk_size=2**24):
+    """Counts the records of a csv file without parsing it, the header is not counted."""
+    rows = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            rows += block.count(b"\n")
+            last = block[-1:]
+
+    return rows - 1 + (last != b"\n")
+
+
+def transpose_matrix_csv(src, dst, memory_limit="2GB", progress=True):
+    """Writes a cell line by gene DepMap matrix csv as a gene-indexed csv with bounded memory.
+
+    Row blocks of the source are read and split into column tiles on disk, the tiles are then
+    read back one at a time and written as blocks of genes. Block sizes are derived from memory_limit.
+
+    Args:
+        src: str
+            DepMap matrix csv, cell lines as rows and "GENE (id)" columns
+        dst: str
+            output csv, may be the same as src
+        memory_limit: int or str, optional
+            approximate ceiling for the memory used by the blocks, eg. 4GB
+        progress: bool, optional
+            show progress bars for reading and writing
+    Returns:
+        str
+            dst
+    """
+    limit = parse_size(memory_limit)
+    columns = list(pd.read_csv(src, nrows=0, index_col=0).columns)
+    genes = format_matrix_columns(columns)
+    n_rows = count_rows(src)
+
+    row_block = max(1, limit // (8 * max(len(genes), 1) * OVERHEAD))
+    width = max(1, limit // (8 * max(n_rows, 1) * OVERHEAD))
+    name = os.path.basename(src)
+
+    part = str(dst) + ".part"
+    store = TileStore(len(genes), width, os.path.dirname(os.path.abspath(part)))
+    lines = []
+    try:
+        with tqdm(total=n_rows, desc="Reading {}".format(name), unit="lines", disable=not progress) as bar:
+            for chunk in pd.read_csv(src, chunksize=row_block, index_col=0, low_memory=False):
+                lines.extend(chunk.index.astype(str))
+                store.append(chunk.to_numpy(dtype=np.float64))
+                bar.update(chunk.shape[0])
+
+        with open(part, "w") as f, tqdm(total=len(genes), desc="Writing {}".format(name), unit="genes",
+                                         disable=not progress) as bar:
+            f.write(",".join(["gene"] + lines) + "\n")
+            for start, tile in store:
+                block = pd.DataFrame(tile.T, index=genes[start:start + tile.shape[1]], columns=lines)
+                block.to_csv(f, header=False)
+                bar.update(tile.shape[1])
+    finally:
+        store.close()
+
+    os.replace(part, dst)
+    return dst
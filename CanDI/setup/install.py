@@ -1,5 +1,5 @@
 import argparse
-from . import manager
+from . import manager, store, dataverse
 
 
 def main():
@@ -7,24 +7,33 @@ def main():
     parser.add_argument("--database", help="Specify the database to download", default="depmap")
     parser.add_argument("--source", help="Specify the download source", default="dataverse")
     parser.add_argument("--directory", help="Specify the parent data directory", default='auto')
+    parser.add_argument("--release", help="Specify the DepMap release, e.g. 21Q4", default=None)
+    parser.add_argument("--store", help="Install into the multi-release store next to other releases", action="store_true")
+    parser.add_argument("--memory-limit", help="Approximate memory ceiling for reformatting, e.g. 4GB", default="2GB")
     args = parser.parse_args()
 
     if args.database == 'depmap':
         if args.source == 'dataverse':
             print("Downloading data from Dataverse")
-            m = manager.DataverseDepMap(manager_path=args.directory, verbose=True)
-            m.download_reformatted_data()
-            m.write_config(m.cfig_path, m.parser)
+            m = manager.DataverseDepMap(manager_path=args.directory, verbose=True,
+                                        release=args.release or dataverse.CANDI_DATAVERSE_RELEASE)
+            if args.store:
+                m.install_release()
+            else:
+                m.download_reformatted_data()
+                m.write_config(m.cfig_path, m.parser)
         
         elif args.source == 'depmap':        
             print("Downloading data from DepMap")
             m = manager.BroadDepMap(manager_path=args.directory, verbose=True)
-            m.get_depmap_info()
+            m.get_depmap_info(release=args.release or "latest")
             m.write_config(m.cfig_path, m.parser)
-            m.download_defaults()
+            m.download_defaults(memory_limit=args.memory_limit)
             m.write_config(m.cfig_path, m.parser)
-            m.depmap_autoformat()
+            m.depmap_autoformat(memory_limit=args.memory_limit)
             m.write_config(m.cfig_path, m.parser)
+            if args.store: #no checksums to skip unchanged files with, the whole release was downloaded
+                store.ReleaseStore().import_release(m.release, m.cfig_path)
 
         else:
             raise ValueError("Invalid source. Please specify either 'dataverse' or 'depmap'")
@@ -15,7 +15,8 @@ import pandas as pd
 from time import sleep
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
-from . import dataverse
+from tqdm import tqdm
+from . import dataverse, ingest, store
 
 
 class Manager(object):
@@ -66,10 +67,41 @@ class Manager(object):
 
 
 class DataverseDepMap(Manager):
-    def __init__(self, manager_path='auto', cfig_path='auto', verbose=False):
+    def __init__(self, manager_path='auto', cfig_path='auto', verbose=False,
+                 release=dataverse.CANDI_DATAVERSE_RELEASE):
+        if release != dataverse.CANDI_DATAVERSE_RELEASE:
+            raise ValueError(f"The CanDI dataverse only hosts the {dataverse.CANDI_DATAVERSE_RELEASE} release, "
+                             f"use --source depmap to install {release}")
         super().__init__(manager_path, cfig_path, verbose)
-        self.release = '21Q4' # default release uploded to CanDI dataverse
+        self.release = release
         self.download_source = 'dataverse, ' + dataverse.CANDI_DATAVERSE_DOI
+        self.verbose = verbose
+
+    def install_release(self, release_store=None):
+        """Installs the release into a multi-release store next to other releases.
+        Files whose checksum is already in the store are linked instead of downloaded.
+        """
+        release_store = release_store or store.ReleaseStore()
+        session = dataverse.DepMapDownloader()
+
+        file_names = [f"{name}.{dataverse.name2type[name]}" for name in dataverse.depmap_dataset_names]
+        entries = {}
+        for name, file in zip(dataverse.depmap_dataset_names, file_names):
+            expected = session.manifest.get(dataverse.name2id[name])
+            entries[file] = expected["checksum"] if expected else None
+
+        fetch = lambda file, directory: os.path.join(
+            directory, session._download_wrapper(file.split('.')[0], directory, return_type="name")
+        )
+        fetched = release_store.sync(self.release, entries, fetch)
+        if self.verbose:
+            print(f"Downloaded {len(fetched)} of {len(entries)} files")
+
+        urls = [session.url(dataverse.name2id[name]) for name in dataverse.depmap_dataset_names]
+        self._set_dataverse_sections(urls, file_names, release_store.depmap_path(self.release))
+        self.parser["depmap_release"] = {"releaseName": self.release}
+
+        return release_store.write_config(self.release, self.parser)
     
     def download_reformatted_data(self):
         if not os.path.exists(self.manager_path + '/data/'):
@@ -84,6 +116,10 @@ class DataverseDepMap(Manager):
             return_type= ["url", "name"]
         )
 
+        self._set_dataverse_sections(urls, file_names, self.manager_path + '/data/depmap')
+
+    def _set_dataverse_sections(self, urls, file_names, depmap_dir):
+
         depmap_urls = {
             file: url for url, file in zip(urls, file_names)
         }
@@ -96,7 +132,7 @@ class DataverseDepMap(Manager):
             depmap_files[f_key] = file 
 
         formatted = {
-            f'{self.manager_path}/data/depmap/{file}': file for file in file_names 
+            f'{depmap_dir}/{file}': file for file in file_names 
             if 'readme' not in file.lower()
         }
 
@@ -141,7 +177,7 @@ class BroadDepMap(Manager):
             if self.release == table["releaseName"] and table["downloadUrl"]:
 
                 download_urls[table["fileName"]] = table["downloadUrl"]
-                depmap_files[self.format_filename(table["fileName"])] = table["fileName"]
+                depmap_files[self.format_filename(table["fileName"], self.release)] = table["fileName"]
 
         return download_urls, depmap_files
 
@@ -175,50 +211,89 @@ class BroadDepMap(Manager):
 
         return candi_name
 
-    def depmap_download(self, name, filename=False):
+    def depmap_download(self, name, filename=False, memory_limit="2GB", progress=True):
 
         time.sleep(1)
         entry = self.manage_request(name, "depmap")
-        self.fetch_url(entry)
+        self.fetch_url(entry, memory_limit, progress)
 
-    def fetch_url(self, entry):
+    def fetch_url(self, entry, memory_limit="2GB", progress=True, record=True):
+        """Streams a DepMap file straight into its formatted parquet file.
+        Records are parsed and formatted as they arrive, see :func:`ingest.ingest`.
 
+        Args:
+            entry: tuple
+                (filename, path, url) from manage_request
+            memory_limit: int or str, optional
+                approximate memory ceiling for parsing and transposing the file, eg. 4GB
+            progress: bool, optional
+                report download and formatting progress
+            record: bool, optional
+                point the config at the formatted file. Threads fetching in parallel leave the config alone,
+                parallel_fetch records their files once they are done.
+        Returns:
+            tuple
+                (filename, path of the formatted file)
+        """
         filename, path, url = entry
 
         r = requests.get(url, stream=True)
-        length = int(r.headers["content-length"])
-        chunk_size = 1024
-        total = 0
+        r.raise_for_status()
 
         print("Downloading {}...".format(filename))
-        if r.status_code == 200:
-
-            with open(path, "w") as f:
-
-               for chunk in r.iter_content(chunk_size=chunk_size):
+        total = int(r.headers.get("Content-Length", 0)) or None
+        with tqdm(total=total, desc="Downloading {}".format(filename), unit="B", unit_scale=True,
+                  disable=not progress) as bar:
+            chunks = (bar.update(len(i)) or i for i in r.iter_content(chunk_size=2**20))
+            path = ingest.ingest(chunks, Path(path).with_suffix(".parquet"), memory_limit=memory_limit,
+                                 progress=progress)
+        print("Downloading {} complete!".format(filename))
+
+        if record:
+            self._record_download(filename, path)
+        return filename, path
+
+    def _record_download(self, filename, path):
+        """Points the config at a downloaded and formatted file."""
+        self.parser["downloads"][filename] = path
+        self._record_formatted(filename, path)
+
+    def _record_formatted(self, filename, path):
+        """Points the config at a formatted file."""
+        self.parser["formatted"][filename] = str(path)
+
+        for key, value in self.parser["depmap_files"].items():
+            if value == filename:
+                self.parser["depmap_files"][key] = Path(path).name
+                if key == "sample_info":
+                    self.parser["autoload_info"]["cell_lines"] = self.parser["data_paths"]["depmap"] + Path(path).name
+
+    def parallel_fetch(self, entries, memory_limit="2GB", progress=True, max_workers=4):
+        """Fetches entries on max_workers threads, memory_limit is shared between the threads.
+        Files that were fetched are recorded in the config, then the first failed download is re-raised.
+        """
+        print("Starting Pool")
+        limit = max(1, ingest.parse_size(memory_limit) // max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.fetch_url, i, limit, progress, False) for i in entries]
 
-                   total += chunk_size
-                   chunk = chunk.decode("utf-8")
-                   chunk = chunk.replace("\t", ",")
-                   f.write(chunk)
-            print("Downloading {} complete!".format(filename))
-            downloads = self.parser["downloads"]
+        errors = []
+        for entry, future in zip(entries, futures):
+            try:
+                self._record_download(*future.result())
+            except Exception as e:
+                errors.append((entry[0], e))
 
-            downloads[filename] = str(path)
+        if errors:
+            raise RuntimeError("Downloading {} failed".format(", ".join(i for i, _ in errors))) from errors[0][1]
 
-    def parallel_fetch(self, entries):
-        print("Starting Pool")
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            for i in entries:
-                executor.submit(self.fetch_url, i)
-
-    def download_defaults(self):
+    def download_defaults(self, memory_limit="2GB", progress=True):
 
         default_sources = json.loads(self.parser.get("defaults","downloads"))
         to_download =  json.loads(self.parser.get("defaults", default_sources[0])) 
 
         entries = [self.manage_request(i, "depmap") for i in to_download]
-        self.parallel_fetch(entries)
+        self.parallel_fetch(entries, memory_limit, progress)
 
     def manage_request(self, name, path, filename=False):
 
@@ -240,63 +315,69 @@ class BroadDepMap(Manager):
 
         return (filename, write_path, url)
 
-    def depmap_autoformat(self):
+    def depmap_autoformat(self, memory_limit="2GB", progress=True):
+        """Formats downloaded DepMap files that have not been formatted yet.
+        Files fetched with fetch_url are formatted while they download, with the memory_limit given to
+        download_defaults, this formats csv files downloaded by other means.
 
+        Args:
+            memory_limit: int or str, optional
+                approximate memory ceiling for transposing gene score matrices, eg. 4GB
+            progress: bool, optional
+                report progress while transposing matrices
+        """
         try:
             downloaded = self.parser["downloads"] 
         except KeyError:
             raise(RuntimeError, "There are not data files to format. Please download data and try again or run install.py")
 
         for k,v in downloaded.items():
-            try:
-                if k not in self.parser["formatted"]:
-                    print("Formatting {}".format(k))
-                    df = pd.read_csv(v, low_memory=False, memory_map=True)
-                    self.format_depmap_data(df, v)
-            except KeyError:
-                print("Formatting {}".format(k))
+            if "formatted" in self.parser and k in self.parser["formatted"]:
+                continue
+
+            print("Formatting {}".format(k))
+            header = pd.read_csv(v, nrows=0)
+            if ingest.is_matrix(header.columns):
+                self.format_depmap_matrix(v, self.release, memory_limit, progress)
+            else:
                 df = pd.read_csv(v, low_memory=False, memory_map=True)
-                self.format_depmap_data(df, v)
+                self.format_depmap_data(df, v, self.release)
+
+    def format_depmap_matrix(self, path, release, memory_limit="2GB", progress=True):
+        """Out-of-core version of format_depmap_data for gene score matrices.
+        The matrix is transposed through column tiles on disk, see :func:`ingest.transpose_matrix_csv`.
+        """
+        if release == "21Q4":
+            ingest.transpose_matrix_csv(path, path, memory_limit, progress)
+        else:
+            #TODO: add more cases for different releases, e.g. 24Q4 new file formats
+            pass
+
+        try:
+            formatted = self.parser["formatted"]
+        except KeyError:
+            self.parser["formatted"] = {}
+            formatted = self.parser["formatted"]
+
+        formatted[path.split("/")[-1]] = path
 
     def format_depmap_data(self, df, path, release):
 
         if release == "21Q4":
-            if ("AAAS (8086)" in df.columns) or ("AAAS (ENSG00000094914)" in df.columns):
-
-                df.rename(columns = lambda s: s.split(" ")[0], inplace=True)
+            if ingest.is_matrix(df.columns):
 
-                if "Unnamed:" in df.columns:
-                    df.rename(columns={"Unnamed:":"DepMap_ID"}, inplace=True)
+                df.columns = ingest.format_matrix_columns(df.columns)
 
                 df = df.set_index("DepMap_ID").T
                 df.reset_index(inplace=True)
                 df.rename(columns={"index":"gene"}, inplace=True)
                 df.set_index("gene", inplace=True)
-                df.to_csv(path)
-
-            if "Protein_Change" in df.columns:
-
-                try:
-                    df.drop("Unnamed: 0", axis=1, inplace=True)
-                    df.to_csv(path, index=False)
-                except KeyError:
-                    pass
-
-            if "Hugo_Symbol" in df.columns:
-                try:
-                    df.rename(columns={"Hugo_Symbol": "gene"}, inplace=True)
-                    df.to_csv(path, index=False)
-                except KeyError:
-                    pass
-
-            if "LeftGene" in df.columns:
-                for col in df.columns:
-                    if "Gene" in col:
-                        split_cols = df[col].str.split(" ", expand=True)
-                        df[col] = split_cols[0]
-                        df[col[:-4] + "EnsemblID"] = split_cols[1].str.replace("(", "").str.replace(")", "")
-
-                df.to_csv(path, index=False)
+                _replace_csv(df, path)
+
+            elif any(i in df.columns for i in ["Protein_Change", "Hugo_Symbol", "LeftGene"]):
+
+                df = ingest.format_table(df)
+                _replace_csv(df, path, index=False)
         else:
             #TODO: add more cases for different releases, e.g. 24Q4 new file formats
             pass
@@ -310,6 +391,15 @@ class BroadDepMap(Manager):
         formatted[path.split("/")[-1]] = path
 
 
+def _replace_csv(df, path, **kwargs):
+    """Writes df to a new file renamed over path. A file hard linked into other releases of the store keeps
+    its content there instead of being rewritten for all of them.
+    """
+    part = str(path) + ".part"
+    df.to_csv(part, **kwargs)
+    os.replace(part, path)
+
+
 class SangerDepMap(Manager):
     def __init__(self, cfig_path='auto'):
         super().__init__(cfig_path)
@@ -344,16 +434,8 @@ class DataverseCoessentiality(Manager):
     def _load_coessentiality_matrix(self):
         data_dir = f'{self.manager_path}/data/coessentiality'
 
-        gene_names = pd.read_csv(
-            f'{data_dir}/genes.txt',header=None,names=['gene_name']
-        )['gene_name']
-        
-        GLS_sign = np.load(f'{data_dir}/GLS_sign.npy')
-        GLS_p = np.load(f'{data_dir}/GLS_p.npy')
-        
-        self.matrix = pl.from_dataframe(
-            pd.DataFrame((-1*np.log10(GLS_p)) * GLS_sign, columns = gene_names, index = gene_names).reset_index()
-        )
+        matrix = coessentiality_matrix(f'{data_dir}/genes.txt', f'{data_dir}/GLS_sign.npy', f'{data_dir}/GLS_p.npy')
+        self.matrix = pl.from_dataframe(matrix.reset_index())
 
     def _get_coessentiality_df(self, pvalue_threshold = 10**-3):
         df = self.matrix.melt('gene_name')
@@ -402,3 +484,26 @@ class DataverseCoessentiality(Manager):
             'coessentiality': coessentiality_df_path,
             'coessentiality_matrix': coessentiality_matrix_path,
         })
+
+
+def coessentiality_matrix(genes_path, sign_path, p_path):
+    """Builds the signed -log10(p) gene by gene coessentiality matrix from the GLS results.
+    The install writes it to coessentiality_matrix.csv, which is kept between installs.
+
+    Args:
+        genes_path: str
+            genes.txt with one gene name per line
+        sign_path: str
+            GLS_sign.npy, the signs of the GLS coefficients
+        p_path: str
+            GLS_p.npy, the GLS p values
+    Returns:
+        pandas.core.frame.DataFrame
+            gene by gene matrix, the index is named gene_name
+    """
+    gene_names = pd.read_csv(genes_path, header=None, names=['gene_name'])['gene_name']
+
+    GLS_sign = np.load(sign_path)
+    GLS_p = np.load(p_path)
+
+    return pd.DataFrame((-1*np.log10(GLS_p)) * GLS_sign, columns = gene_names, index = gene_names)
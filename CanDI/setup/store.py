@@ -0,0 +1,248 @@
+"""
+The store module keeps several DepMap releases side by side under one root.
+Every file is stored once in a content addressed objects directory and linked into
+each release that contains it, so byte-identical files are shared between releases.
+Stored files are read only, a file shared by several releases must be replaced
+(written to a new file and renamed over it), never rewritten in place.
+
+Only sources that publish checksums can skip downloads: updating a release from the
+CanDI dataverse only downloads the files that changed. The Broad DepMap API has no
+checksums, so Broad releases are downloaded in full and then imported, which still
+stores files identical to those of another release only once.
+
+    <root>/objects/<algorithm>-<checksum>
+    <root>/<release>/manifest.json
+    <root>/<release>/data/config.ini
+    <root>/<release>/data/depmap/<file>
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import configparser
+from pathlib import Path
+
+
+class ReleaseStore(object):
+    def __init__(self, root='auto'):
+        """Initializes the ReleaseStore class
+
+        Args:
+            root (str, optional): The directory holding all releases. Defaults to the CANDI_STORE
+                environment variable or data/releases next to the package config.
+                It is only created when a release is written, reading a store never writes to it.
+        """
+        if root == 'auto':
+            root = os.environ.get("CANDI_STORE") or Path(os.path.dirname(os.path.realpath(__file__))) / "data" / "releases"
+
+        self.root = Path(root)
+        self._objects = self.root / "objects"
+
+    def releases(self):
+        """Returns the names of all installed releases."""
+        if not self.root.exists():
+            return []
+        return sorted(i.name for i in self.root.iterdir() if i.name != "objects" and (i / "data" / "config.ini").exists())
+
+    def release_path(self, release):
+        return self.root / release
+
+    def depmap_path(self, release):
+        return self.release_path(release) / "data" / "depmap"
+
+    def config_path(self, release):
+        return self.release_path(release) / "data" / "config.ini"
+
+    def manifest(self, release):
+        """Returns {file name: {"checksum": [algorithm, value], "size": int}} for a release."""
+        path = self.release_path(release) / "manifest.json"
+        if not path.exists():
+            return {}
+
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_manifest(self, release, manifest):
+
+        path = self.release_path(release) / "manifest.json"
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    def _object_path(self, checksum):
+
+        algorithm, value = checksum
+        return self._objects / "{0}-{1}".format(algorithm.lower().replace("-", ""), value)
+
+    def find(self, checksum):
+        """Returns the stored object with this checksum or None."""
+        path = self._object_path(checksum)
+        return path if path.exists() else None
+
+    @staticmethod
+    def checksum(path, algorithm="MD5", chunk_size=2**20):
+        """Computes the [algorithm, value] checksum of a file."""
+        digest = hashlib.new(algorithm.lower().replace("-", ""))
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                digest.update(block)
+
+        return [algorithm, digest.hexdigest()]
+
+    def add(self, release, name, path, checksum=None, move=True):
+        """Adds a file to a release, storing its content only once.
+
+        Args:
+            release (str): The release the file belongs to.
+            name (str): The file name inside the release.
+            path (str): The file to add.
+            checksum (list, optional): [algorithm, value] of the file, computed if not given.
+            move (bool, optional): Move the file into the store instead of copying it.
+
+        Returns:
+            pathlib.Path: The path of the file inside the release.
+        """
+        checksum = list(checksum) if checksum else self.checksum(path)
+        obj = self._object_path(checksum)
+        size = os.path.getsize(path)
+        os.makedirs(self._objects, exist_ok=True)
+
+        if obj.exists():
+            if move:
+                os.remove(path)
+        else:
+            if move:
+                shutil.move(path, obj)
+            else:
+                shutil.copyfile(path, obj)
+            os.chmod(obj, 0o444) #shared by every release linking it
+
+        return self.link(release, name, checksum, size)
+
+    def link(self, release, name, checksum, size=None):
+        """Links a stored object into a release under name."""
+        obj = self._object_path(checksum)
+        dest = self.depmap_path(release) / name
+        os.makedirs(dest.parent, exist_ok=True)
+
+        if dest.exists() or dest.is_symlink():
+            os.remove(dest)
+        try:
+            os.link(obj, dest)
+        except OSError: #no hard links across devices or on this filesystem
+            try:
+                os.symlink(obj, dest)
+            except OSError:
+                shutil.copyfile(obj, dest)
+                os.chmod(dest, 0o444)
+
+        manifest = self.manifest(release)
+        manifest[name] = {"checksum": list(checksum), "size": size if size is not None else os.path.getsize(obj)}
+        self._save_manifest(release, manifest)
+
+        return dest
+
+    def sync(self, release, entries, fetch):
+        """Brings a release up to date, fetching only files whose content is not stored yet.
+
+        Args:
+            release (str): The release to update.
+            entries (dict): A dictionary mapping from file name to its [algorithm, value] checksum or None if unknown.
+            fetch (callable): fetch(name, directory) downloads a file into directory and returns its path.
+
+        Returns:
+            list: The names of the files that were downloaded.
+        """
+        current = self.manifest(release)
+        fetched = []
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix="candi_staging_", dir=self.root)
+
+        try:
+            for name, checksum in entries.items():
+                dest = self.depmap_path(release) / name
+                if checksum and current.get(name, {}).get("checksum") == list(checksum) and dest.exists():
+                    continue
+
+                if checksum and self.find(checksum):
+                    self.link(release, name, checksum)
+                    continue
+
+                path = fetch(name, staging)
+                self.add(release, name, path, checksum)
+                fetched.append(name)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        return fetched
+
+    def write_config(self, release, parser):
+        """Writes the config of a release.
+
+        The depmap data path points at the release directory and index tables shipped with the
+        package (genes, locations) are referenced by absolute path.
+        """
+        package_dir = Path(os.path.dirname(os.path.realpath(__file__)))
+        parser = _copy_parser(parser)
+
+        parser["data_paths"] = {"depmap": "data/depmap/"}
+        if parser.has_section("autoload_info"):
+            for key, value in parser["autoload_info"].items():
+                if not value.startswith("data/depmap/") and not os.path.isabs(value):
+                    parser["autoload_info"][key] = str(package_dir / value)
+
+        os.makedirs(self.config_path(release).parent, exist_ok=True)
+        with open(self.config_path(release), "w") as f:
+            parser.write(f)
+
+        return self.config_path(release)
+
+    def import_release(self, release, cfig_path):
+        """Copies an existing single release install (eg. made by candi-install) into the store.
+        This is how Broad DepMap releases enter the store: they are downloaded in full first, since their
+        API publishes no checksums, and only files identical to stored ones are shared.
+
+        Args:
+            release (str): The name of the release, eg. 21Q4.
+            cfig_path (str): The config.ini of the install.
+        """
+        parser = configparser.ConfigParser()
+        parser.read(cfig_path)
+        base = Path(cfig_path).parent.parent
+        depmap_dir = base / parser["data_paths"]["depmap"]
+
+        for name in set(parser["depmap_files"].values()):
+            if (depmap_dir / name).exists():
+                self.add(release, name, depmap_dir / name, move=False)
+
+        for key, value in parser["autoload_info"].items():
+            path = base / value
+            if value.startswith(parser["data_paths"]["depmap"]) and path.exists():
+                self.add(release, path.name, path, move=False)
+                parser["autoload_info"][key] = "data/depmap/" + path.name
+            else:
+                parser["autoload_info"][key] = str(path.absolute())
+
+        return self.write_config(release, parser)
+
+    def remove(self, release):
+        """Removes a release and every stored object no other release uses."""
+        if not self.release_path(release).is_dir():
+            raise ValueError("Release {0} is not in the store at {1}".format(release, self.root))
+        shutil.rmtree(self.release_path(release))
+
+        used = set()
+        for other in self.releases():
+            used.update(str(self._object_path(v["checksum"])) for v in self.manifest(other).values())
+
+        for obj in self._objects.iterdir() if self._objects.exists() else ():
+            if str(obj) not in used:
+                os.remove(obj)
+
+
+def _copy_parser(parser):
+
+    copy = configparser.ConfigParser()
+    copy.read_dict({k: dict(v) for k, v in parser.items() if k != "DEFAULT"})
+    return copy
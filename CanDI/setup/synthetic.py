@@ -0,0 +1,345 @@
+"""
+The synthetic module writes complete, schema faithful CanDI installs filled with random data.
+Every dataset has the columns, index and file format of a formatted DepMap release, so
+installs can be opened with Data(config_path) and used for tests and benchmarks at any scale.
+Matrices are generated and written in blocks of genes, so the generator's memory use does
+not grow with the size of the release.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+
+#approximate size of a DepMap release (21Q4), scale multiplies the number of cell lines
+DEPMAP_SCALE = {"n_genes": 18000, "n_lines": 1100, "mutations_per_line": 700, "fusions_per_line": 25}
+
+DEPMAP_FILES = {"cell_lines": "sample_info.csv",
+                "gene_effect": "CRISPR_gene_effect.csv",
+                "gene_dependency": "CRISPR_gene_dependency.csv",
+                "expression": "CCLE_expression.csv",
+                "rnaseq_reads": "CCLE_RNAseq_reads.csv",
+                "gene_cn": "CCLE_gene_cn.csv",
+                "mutations": "CCLE_mutations.csv",
+                "fusions": "CCLE_fusions.csv"}
+
+MATRICES = ["gene_effect", "gene_dependency", "expression", "rnaseq_reads", "gene_cn"]
+
+DISEASES = {"Lung Cancer": ("lung", ["NSCLC", "SCLC", "Mesothelioma"]),
+            "Breast Cancer": ("breast", ["Breast Ductal Carcinoma", "Breast Carcinoma"]),
+            "Colon/Colorectal Cancer": ("colorectal", ["Colorectal Adenocarcinoma"]),
+            "Leukemia": ("blood", ["AML", "ALL", "CML"]),
+            "Skin Cancer": ("skin", ["Melanoma"]),
+            "Brain Cancer": ("central_nervous_system", ["Glioma", "Medulloblastoma"]),
+            "Pancreatic Cancer": ("pancreas", ["Exocrine"]),
+            "Ovarian Cancer": ("ovary", ["Adenocarcinoma"]),
+            "Lymphoma": ("lymphocyte", ["DLBCL", "Hodgkin"]),
+            "Kidney Cancer": ("kidney", ["Renal Cell Carcinoma"])}
+
+VARIANTS = {"Missense_Mutation": 0.58, "Silent": 0.2, "Nonsense_Mutation": 0.05, "Frame_Shift_Del": 0.04,
+            "Frame_Shift_Ins": 0.02, "Splice_Site": 0.03, "In_Frame_Del": 0.02, "3'UTR": 0.04,
+            "5'UTR": 0.02}
+
+LOCATIONS = ["Nucleus", "Cytosol", "Mitochondria", "Plasma membrane", "Endoplasmic reticulum", "Golgi apparatus"]
+
+CHROMOSOMES = [str(i) for i in range(1, 23)] + ["X"]
+
+
+def release_shape(scale=1.0, n_genes=None, n_lines=None):
+    """Returns the number of genes and cell lines of a synthetic release.
+
+    Args:
+        scale (float, optional): Multiple of the number of cell lines in a DepMap release.
+            The number of genes stays fixed since the genome does not grow with new releases.
+        n_genes (int, optional): Overrides the number of genes.
+        n_lines (int, optional): Overrides the number of cell lines.
+    """
+    n_genes = n_genes or DEPMAP_SCALE["n_genes"]
+    n_lines = n_lines or max(int(round(DEPMAP_SCALE["n_lines"] * scale)), 2)
+    return n_genes, n_lines
+
+
+def make_release(root, scale=1.0, n_genes=None, n_lines=None, seed=0, file_format="csv", block_size=1000,
+                 mutations_per_line=None, fusions_per_line=None):
+    """Writes a synthetic CanDI install under root.
+
+    Args:
+        root (str): Directory of the install, data/config.ini is written inside it.
+        scale (float, optional): Multiple of the number of cell lines in a DepMap release, eg. 2 to 5
+            for benchmarking future releases or 0.01 for tests.
+        n_genes (int, optional): Overrides the number of genes.
+        n_lines (int, optional): Overrides the number of cell lines.
+        seed (int, optional): Seed of the random generator, the same arguments always write the same data.
+        file_format (str, optional): "csv" or "parquet", the formats written by the installers.
+        block_size (int, optional): Number of genes generated and written at once.
+        mutations_per_line (int, optional): Mean number of mutations per cell line.
+        fusions_per_line (int, optional): Mean number of fusions per cell line.
+
+    Returns:
+        str: The path of the config.ini of the install.
+    """
+    assert file_format in ["csv", "parquet"], "file_format must be 'csv' or 'parquet'"
+
+    rng = np.random.default_rng(seed)
+    n_genes, n_lines = release_shape(scale, n_genes, n_lines)
+    mutations_per_line = mutations_per_line or DEPMAP_SCALE["mutations_per_line"]
+    fusions_per_line = fusions_per_line or DEPMAP_SCALE["fusions_per_line"]
+
+    depmap_dir = os.path.join(root, "data", "depmap")
+    for d in ["data/depmap", "data/genes", "data/locations"]:
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+
+    genes = make_genes(n_genes, rng)
+    cell_lines = make_cell_lines(n_lines, rng)
+
+    genes.to_csv(os.path.join(root, "data/genes/gene_info.csv"))
+    make_locations(genes.index, rng).to_csv(os.path.join(root, "data/locations/merged_locations.csv"), index=False)
+
+    files = {k: _file_name(v, file_format) for k, v in DEPMAP_FILES.items()}
+    if file_format == "csv":
+        cell_lines.to_csv(os.path.join(depmap_dir, files["cell_lines"]), sep="\t")
+    else:
+        cell_lines.reset_index().to_parquet(os.path.join(depmap_dir, files["cell_lines"]), index=False)
+
+    write_matrices(depmap_dir, files, genes.index, cell_lines, rng, file_format, block_size)
+    _write(make_mutations(genes, cell_lines.index, mutations_per_line, rng),
+           os.path.join(depmap_dir, files["mutations"]), file_format)
+    _write(make_fusions(genes, cell_lines.index, fusions_per_line, rng),
+           os.path.join(depmap_dir, files["fusions"]), file_format)
+
+    config_path = os.path.join(root, "data", "config.ini")
+    with open(config_path, "w") as f:
+        f.write("[depmap_urls]\n\n[index]\n")
+        f.write("".join(f"{key} = gene\n" for key in MATRICES))
+        f.write(f"\n[autoload_info]\ncell_lines = data/depmap/{files['cell_lines']}\n"
+                "genes = data/genes/gene_info.csv\nlocations = data/locations/merged_locations.csv\n\n"
+                "[data_paths]\ndepmap = data/depmap/\n\n[depmap_files]\n")
+        f.write("".join(f"{key} = {name}\n" for key, name in files.items() if key != "cell_lines"))
+        f.write(f"\n[synthetic]\nn_genes = {n_genes}\nn_lines = {n_lines}\nseed = {seed}\n")
+
+    return config_path
+
+
+def make_genes(n_genes, rng):
+    """Returns a gene_info table indexed by Approved symbol.
+    Genes are laid out along the chromosomes with their chromosome, start and end, see gene_locus.
+    """
+    symbols = [f"GENE{i}" for i in range(n_genes)]
+    chromosome, start, end = gene_locus(np.arange(n_genes))
+    return pd.DataFrame({"Approved name": [f"synthetic gene {i}" for i in range(n_genes)],
+                         "Accession numbers": "",
+                         "UniProt ID": [f"Q{i:05d}" for i in range(n_genes)],
+                         "ENTREZ ID": np.arange(1, n_genes + 1).astype(str),
+                         "Ensembl ID": [f"ENSG{i:011d}" for i in range(n_genes)],
+                         "chromosome": chromosome,
+                         "start": start,
+                         "end": end},
+                        index=pd.Index(symbols, name="Approved symbol"))
+
+
+def gene_locus(positions):
+    """Returns chromosome, start and end of the genes at these positions of the gene list.
+    Genes are dealt round robin to the chromosomes, 50kb apart and 40kb long.
+    """
+    positions = np.asarray(positions)
+    start = (positions // len(CHROMOSOMES)) * 50000 + 1000
+    return np.asarray(CHROMOSOMES)[positions % len(CHROMOSOMES)], start, start + 40000
+
+
+def make_locations(genes, rng):
+    """Returns a merged_locations table with one to two distinct locations per gene."""
+    n = len(genes)
+    second = rng.random(n) < 0.3
+    first = rng.integers(0, len(LOCATIONS), size=n)
+    other = (first[second] + rng.integers(1, len(LOCATIONS), size=second.sum())) % len(LOCATIONS)
+
+    gene = np.concatenate([np.asarray(genes), np.asarray(genes)[second]])
+    return pd.DataFrame({"gene": gene,
+                         "location": np.asarray(LOCATIONS)[np.concatenate([first, other])],
+                         "confidence": rng.integers(1, 6, size=len(gene)).astype(float)})
+
+
+def make_cell_lines(n_lines, rng):
+    """Returns a sample_info table indexed by DepMap_ID with the columns of DepMap's sample_info.csv."""
+    ids = [f"ACH-{i:06d}" for i in range(1, n_lines + 1)]
+    diseases = list(DISEASES)
+    primary = rng.choice(diseases, size=n_lines)
+    lineage = [DISEASES[i][0] for i in primary]
+    subtype = [rng.choice(DISEASES[i][1]) for i in primary]
+    names = [f"LINE{i}" for i in range(1, n_lines + 1)]
+
+    return pd.DataFrame({"cell_line_name": names,
+                         "stripped_cell_line_name": names,
+                         "CCLE_Name": [f"{n}_{l.upper()}" for n, l in zip(names, lineage)],
+                         "alias": "",
+                         "COSMICID": rng.integers(600000, 1300000, size=n_lines).astype(float),
+                         "sex": rng.choice(["Male", "Female", "Unknown"], size=n_lines, p=[0.48, 0.48, 0.04]),
+                         "source": rng.choice(["ATCC", "DSMZ", "ECACC", "Academic lab"], size=n_lines),
+                         "RRID": [f"CVCL_{i:04X}" for i in range(n_lines)],
+                         "WTSI_Master_Cell_ID": rng.integers(1, 3000, size=n_lines).astype(float),
+                         "sample_collection_site": lineage,
+                         "primary_or_metastasis": rng.choice(["Primary", "Metastasis"], size=n_lines),
+                         "primary_disease": primary,
+                         "Subtype": subtype,
+                         "age": rng.integers(1, 90, size=n_lines).astype(float),
+                         "Sanger_Model_ID": [f"SIDM{i:05d}" for i in range(n_lines)],
+                         "depmap_public_comments": "",
+                         "lineage": lineage,
+                         "lineage_subtype": subtype,
+                         "lineage_sub_subtype": "",
+                         "lineage_molecular_subtype": "",
+                         "culture_type": rng.choice(["Adherent", "Suspension"], size=n_lines)},
+                        index=pd.Index(ids, name="DepMap_ID"))
+
+
+def make_matrix_block(genes, cell_lines, rng):
+    """Returns gene by cell line blocks of every matrix for a block of genes.
+    Dependency is derived from effect and read counts from expression, so the datasets agree with each other.
+    """
+    n_genes, n_lines = len(genes), len(cell_lines)
+
+    #a few common essentials, the rest centred on zero with per lineage shifts
+    essential = rng.random(n_genes) < 0.08
+    lineages, codes = np.unique(cell_lines.lineage, return_inverse=True)
+    lineage_shift = rng.normal(0, 0.15, size=(n_genes, len(lineages)))[:, codes]
+    effect = rng.normal(0, 0.25, size=(n_genes, n_lines)) + lineage_shift - 1.2 * essential[:, None]
+    dependency = 1 / (1 + np.exp(8 * (effect + 0.5)))
+
+    expressed = rng.random((n_genes, 1)) < 0.7
+    expression = np.where(expressed, rng.gamma(2.0, 1.5, size=(n_genes, n_lines)), 0.0)
+    expression[rng.random((n_genes, n_lines)) < 0.05] = 0.0
+    depth = rng.uniform(20, 80, size=n_lines)
+    reads = rng.poisson((2 ** expression - 1) * depth).astype(np.int64)
+
+    cn = np.exp(rng.normal(0, 0.15, size=(n_genes, n_lines)))
+    cn[rng.random((n_genes, n_lines)) < 0.02] *= 2.5
+    cn[rng.random((n_genes, n_lines)) < 0.02] *= 0.3
+
+    return {"gene_effect": effect,
+            "gene_dependency": dependency,
+            "expression": expression,
+            "rnaseq_reads": reads,
+            "gene_cn": cn}
+
+
+def write_matrices(depmap_dir, files, genes, cell_lines, rng, file_format="csv", block_size=1000):
+    """Writes all gene-indexed matrices, one block of genes at a time."""
+    writers = {}
+    try:
+        for start in range(0, len(genes), block_size):
+            block_genes = pd.Index(genes[start:start + block_size], name="gene")
+            for key, values in make_matrix_block(block_genes, cell_lines, rng).items():
+                block = pd.DataFrame(values, index=block_genes, columns=cell_lines.index.rename(None))
+                path = os.path.join(depmap_dir, files[key])
+
+                if file_format == "csv":
+                    if key not in writers:
+                        writers[key] = open(path, "w")
+                        writers[key].write(",".join(["gene"] + list(cell_lines.index)) + "\n")
+                    block.to_csv(writers[key], header=False)
+                else:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+
+                    table = pa.Table.from_pandas(block.reset_index(), preserve_index=False)
+                    if key not in writers:
+                        writers[key] = pq.ParquetWriter(path, table.schema)
+                    writers[key].write_table(table)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+def make_mutations(genes, lines, per_line, rng):
+    """Returns a formatted CCLE_mutations table (Hugo_Symbol renamed gene)."""
+    counts = rng.poisson(per_line, size=len(lines))
+    n = int(counts.sum())
+    idx = rng.integers(0, len(genes), size=n)
+    variant = rng.choice(list(VARIANTS), size=n, p=np.array(list(VARIANTS.values())) / sum(VARIANTS.values()))
+    #mutations of a gene fall inside its locus
+    chromosome, start, _ = gene_locus(idx)
+    start = start + rng.integers(0, 40000, size=n)
+    bases = np.array(list("ACGT"))
+    ref_code = rng.integers(0, 4, size=n)
+    ref = bases[ref_code]
+    alt = bases[(ref_code + rng.integers(1, 4, size=n)) % 4]
+    deleterious = np.isin(variant, ["Nonsense_Mutation", "Frame_Shift_Del", "Frame_Shift_Ins", "Splice_Site"])
+
+    return pd.DataFrame({"gene": np.asarray(genes.index)[idx],
+                         "Entrez_Gene_Id": np.asarray(genes["ENTREZ ID"])[idx].astype(float),
+                         "NCBI_Build": 37,
+                         "Chromosome": chromosome,
+                         "Start_position": start,
+                         "End_position": start + (variant == "Frame_Shift_Del"),
+                         "Strand": "+",
+                         "Variant_Classification": variant,
+                         "Variant_Type": np.where(np.char.startswith(variant.astype(str), "Frame_Shift"), "DEL", "SNP"),
+                         "Reference_Allele": ref,
+                         "Alternate_Allele": alt,
+                         "dbSNP_RS": "",
+                         "dbSNP_Val_Status": "",
+                         "Genome_Change": [f"g.chr{c}:{s}{r}>{a}" for c, s, r, a in
+                                           zip(chromosome, start, ref, alt)],
+                         "Annotation_Transcript": [f"ENST{i:011d}" for i in idx],
+                         "DepMap_ID": np.repeat(np.asarray(lines), counts),
+                         "cDNA_Change": "",
+                         "Codon_Change": "",
+                         "Protein_Change": [f"p.X{i}Y" for i in rng.integers(1, 2000, size=n)],
+                         "isDeleterious": deleterious,
+                         "isTCGAhotspot": rng.random(n) < 0.01,
+                         "TCGAhsCnt": rng.poisson(0.2, size=n).astype(float),
+                         "isCOSMIChotspot": rng.random(n) < 0.01,
+                         "COSMIChsCnt": rng.poisson(0.5, size=n).astype(float),
+                         "ExAC_AF": np.where(rng.random(n) < 0.1, rng.random(n) * 1e-3, np.nan),
+                         "Variant_annotation": np.where(deleterious, "damaging",
+                                                        np.where(variant == "Silent", "silent", "other non-conserving")),
+                         "CGA_WES_AC": [f"{a}:{b}" for a, b in rng.integers(1, 100, size=(n, 2))],
+                         "HC_AC": "",
+                         "RD_AC": "",
+                         "RNAseq_AC": "",
+                         "SangerWES_AC": "",
+                         "WGS_AC": ""})
+
+
+def make_fusions(genes, lines, per_line, rng):
+    """Returns a formatted CCLE_fusions table with gene and EnsemblID columns split."""
+    counts = rng.poisson(per_line, size=len(lines))
+    n = int(counts.sum())
+    left = rng.integers(0, len(genes), size=n)
+    right = rng.integers(0, len(genes), size=n)
+    symbols = np.asarray(genes.index)
+    ensembl = np.asarray(genes["Ensembl ID"])
+
+    return pd.DataFrame({"DepMap_ID": np.repeat(np.asarray(lines), counts),
+                         "FusionName": [f"{a}--{b}" for a, b in zip(symbols[left], symbols[right])],
+                         "JunctionReadCount": rng.poisson(10, size=n),
+                         "SpanningFragCount": rng.poisson(5, size=n),
+                         "SpliceType": rng.choice(["ONLY_REF_SPLICE", "INCL_NON_REF_SPLICE"], size=n),
+                         "LeftGene": symbols[left],
+                         "LeftBreakpoint": [f"chr{c}:{p}:+" for c, p in
+                                            zip(rng.choice(CHROMOSOMES, size=n), rng.integers(1, 2 * 10**8, size=n))],
+                         "RightGene": symbols[right],
+                         "RightBreakpoint": [f"chr{c}:{p}:+" for c, p in
+                                             zip(rng.choice(CHROMOSOMES, size=n), rng.integers(1, 2 * 10**8, size=n))],
+                         "LargeAnchorSupport": rng.choice(["YES_LDAS", "NO_LDAS"], size=n),
+                         "FFPM": rng.gamma(1.0, 0.5, size=n),
+                         "LeftBreakDinuc": "GT",
+                         "LeftBreakEntropy": rng.uniform(1, 2, size=n),
+                         "RightBreakDinuc": "AG",
+                         "RightBreakEntropy": rng.uniform(1, 2, size=n),
+                         "annots": "[]",
+                         "CCLE_count": rng.integers(1, 5, size=n),
+                         "LeftEnsemblID": ensembl[left],
+                         "RightEnsemblID": ensembl[right]})
+
+
+def _file_name(name, file_format):
+    return name if file_format == "csv" else name.rsplit(".", 1)[0] + ".parquet"
+
+
+def _write(df, path, file_format):
+
+    if file_format == "csv":
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
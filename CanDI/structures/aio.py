@@ -0,0 +1,88 @@
+"""Asyncio support for CanDI.
+Blocking work (reading datasets, slicing and filtering them) runs on a managed thread pool so
+coroutines never block the event loop. Concurrent requests for the same work are coalesced into
+one call, cancelling a waiter only stops the work once no other coroutine is waiting for it.
+
+The pool size defaults to the CANDI_ASYNC_WORKERS environment variable or the number of cpus, up to 8.
+"""
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+_executor = None
+_lock = threading.RLock()
+_pending = {} #key: [concurrent future, number of waiting coroutines]
+
+
+def executor():
+    """Returns the thread pool running blocking CanDI calls, creating it on first use."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = int(os.environ.get("CANDI_ASYNC_WORKERS", min(8, os.cpu_count() or 1)))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="candi")
+        return _executor
+
+
+def shutdown(wait=True):
+    """Shuts the pool down, a new one is created by the next call."""
+    global _executor
+    with _lock:
+        pool, _executor = _executor, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+async def run(func, *args, **kwargs):
+    """Awaits func(*args, **kwargs) run on the pool.
+    Cancelling drops calls that have not started, a running call finishes and its result is discarded.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), functools.partial(func, *args, **kwargs))
+
+
+async def coalesce(key, func, *args, **kwargs):
+    """Awaits func(*args, **kwargs) run on the pool, concurrent calls with the same key share one call.
+
+    Args:
+        key: hashable
+            identifies the work, eg. ("load", "gene_effect")
+        func: callable
+    Returns:
+        the result of func
+    """
+    with _lock:
+        entry = _pending.get(key)
+        if entry is None:
+            entry = _pending[key] = [None, 0]
+            entry[0] = executor().submit(func, *args, **kwargs)
+            entry[0].add_done_callback(functools.partial(_forget, key))
+        entry[1] += 1
+
+    wrapped = asyncio.wrap_future(entry[0])
+    try:
+        return await asyncio.shield(wrapped)
+    except asyncio.CancelledError:
+        wrapped.add_done_callback(_retrieve) #nobody awaits the shielded future anymore
+        raise
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel() #no coroutine is waiting, drop the call if it has not started
+
+
+def _forget(key, future):
+
+    with _lock:
+        if _pending.get(key, [None])[0] is future:
+            del _pending[key]
+
+
+def _retrieve(future):
+
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,182 @@
+"""Alignment of the gene by cell line datasets on shared genes and cell lines.
+Every loaded matrix is mapped once onto the sorted union of genes and lines of all loaded matrices,
+profiles are then built with one positional gather per dataset instead of label joins.
+Alignments only hold the maps, values are read from the loaded datasets when they are gathered,
+and the alignments of a dataset are dropped when it is loaded or unloaded.
+"""
+import threading
+import numpy as np
+import pandas as pd
+
+from .cache import slice_cache
+
+
+#datasets of a profile and their column names
+PROFILE = {"gene_effect": "effect",
+           "gene_dependency": "dependency",
+           "expression": "expression",
+           "gene_cn": "cn",
+           "rnaseq_reads": "reads"}
+
+_alignments = {} #(datasets, generations, frame ids): Alignment
+_lock = threading.Lock()
+
+
+class Alignment(object):
+    """Positions of the union of genes and lines in each of a set of gene by cell line DataFrames.
+    The DataFrames are not kept, :meth:`gather` reads them from the global data object.
+
+    Args:
+        frames: dict
+            dataset name: gene by cell line DataFrame
+    """
+    def __init__(self, frames):
+
+        self.datasets = list(frames)
+        self._ids = {k: id(df) for k, df in frames.items()}
+        self.genes = _union([df.index for df in frames.values()])
+        self.lines = _union([df.columns for df in frames.values()])
+        self.rows = {k: _positions(df.index, self.genes) for k, df in frames.items()} #-1 where missing
+        self.columns = {k: _positions(df.columns, self.lines) for k, df in frames.items()}
+        self._pairs = {}
+
+    def pair(self, first, second):
+        """Returns the positions of the genes and lines two datasets share.
+
+        Returns:
+            dict
+                "genes" and "lines" as (positions in first, positions in second) tuples of numpy arrays
+        """
+        key = (first, second)
+        if key not in self._pairs:
+            out = {}
+            for axis, maps in [("genes", self.rows), ("lines", self.columns)]:
+                shared = (maps[first] >= 0) & (maps[second] >= 0)
+                out[axis] = (maps[first][shared], maps[second][shared])
+            self._pairs[key] = out
+
+        return self._pairs[key]
+
+    def gather(self, dataset, genes=None, lines=None):
+        """Returns the values of a dataset on the given genes and lines of the union, NaN where it has none.
+
+        Args:
+            dataset: str
+            genes: numpy.ndarray, optional
+                positions in self.genes, defaults to all
+            lines: numpy.ndarray, optional
+                positions in self.lines, defaults to all
+        Returns:
+            numpy.ndarray
+                float array of shape (genes, lines)
+        """
+        rows = self.rows[dataset] if genes is None else self.rows[dataset][genes]
+        cols = self.columns[dataset] if lines is None else self.columns[dataset][lines]
+
+        from ..candi import data
+
+        df = getattr(data, dataset, None)
+        if id(df) != self._ids[dataset]:
+            raise RuntimeError("{} was reloaded since it was aligned, call alignment() again".format(dataset))
+
+        values = df.to_numpy()
+        out = values[np.ix_(np.maximum(rows, 0), np.maximum(cols, 0))].astype(float)
+        out[rows < 0, :] = np.nan
+        out[:, cols < 0] = np.nan
+        return out
+
+
+def alignment(datasets=None):
+    """Returns the alignment of the loaded gene by cell line datasets, built once per set of loads.
+
+    Args:
+        datasets: list, optional
+            defaults to the loaded datasets of PROFILE
+    Returns:
+        Alignment
+    """
+    from ..candi import data
+
+    if datasets is None:
+        datasets = [k for k in PROFILE if isinstance(getattr(data, k, None), pd.DataFrame)]
+    if not datasets:
+        raise ValueError("none of the gene by cell line datasets are loaded")
+    frames = {k: getattr(data, k) for k in datasets}
+    key = (tuple(datasets), tuple(slice_cache.generation(k) for k in datasets),
+           tuple(id(i) for i in frames.values()))
+
+    with _lock:
+        if key not in _alignments:
+            for old in [k for k in _alignments if k[0] == key[0]]: #maps of reassigned datasets are stale
+                del _alignments[old]
+            _alignments[key] = Alignment(frames)
+        return _alignments[key]
+
+
+def _forget(dataset):
+    """Drops the alignments of a dataset, or all of them, when its slices are invalidated."""
+    with _lock:
+        for key in [k for k in _alignments if dataset is None or dataset in k[0]]:
+            del _alignments[key]
+
+
+slice_cache.subscribe(_forget)
+
+
+def profile(genes=None, lines=None, datasets=None):
+    """Returns one aligned table of every loaded dataset and the mutation status.
+
+    Args:
+        genes: list, optional
+            gene symbols, defaults to every gene of the aligned datasets
+        lines: list, optional
+            DepMap_IDs, defaults to every cell line of the aligned datasets
+        datasets: list, optional
+            gene by cell line datasets, defaults to the loaded datasets of PROFILE
+    Returns:
+        pandas.core.frame.DataFrame
+            indexed by (gene, DepMap_ID) with one column per dataset (effect, dependency, expression, cn, reads)
+            and mutated, True if the line carries a non silent mutation of the gene. Mutated is missing
+            if the mutations are not loaded.
+    """
+    from ..candi import data
+
+    aligned = alignment(datasets)
+    gene_pos = None if genes is None else _keep(aligned.genes, genes)
+    line_pos = None if lines is None else _keep(aligned.lines, lines)
+    gene_index = aligned.genes if gene_pos is None else aligned.genes[gene_pos]
+    line_index = aligned.lines if line_pos is None else aligned.lines[line_pos]
+
+    index = pd.MultiIndex.from_product([gene_index, line_index], names=["gene", "DepMap_ID"])
+    columns = {PROFILE.get(k, k): aligned.gather(k, gene_pos, line_pos).ravel() for k in aligned.datasets}
+    out = pd.DataFrame(columns, index=index)
+
+    mutations = getattr(data, "mutations", None)
+    if isinstance(mutations, pd.DataFrame):
+        hits = mutations.loc[(mutations.Variant_Classification != "Silent")
+                             & mutations.gene.isin(gene_index) & mutations.DepMap_ID.isin(line_index),
+                             ["gene", "DepMap_ID"]]
+        out["mutated"] = index.isin(pd.MultiIndex.from_frame(hits))
+
+    return out
+
+
+def _union(indexes):
+    """Sorted labels of all indexes."""
+    return pd.Index(pd.unique(np.concatenate([np.asarray(i, dtype=object) for i in indexes]))).sort_values()
+
+
+def _positions(index, keys):
+    """Position of the first occurrence of every key in index, -1 if missing."""
+    if index.is_unique:
+        return index.get_indexer(keys)
+
+    first = ~index.duplicated()
+    positions = index[first].get_indexer(keys)
+    return np.where(positions >= 0, np.flatnonzero(first)[positions], -1)
+
+
+def _keep(index, keys):
+    """Positions of the keys found in index, in the order of keys."""
+    positions = index.get_indexer([keys] if isinstance(keys, str) else list(keys))
+    return positions[positions >= 0]
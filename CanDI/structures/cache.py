@@ -0,0 +1,173 @@
+"""Process wide cache of dataset slices shared by all CanDI objects.
+Slices are keyed by (dataset, entity type, key), so two objects for the same gene or cohort
+share one slice. The cache is bounded in bytes with least recently used eviction and a dataset's
+slices are dropped when it is loaded or unloaded again. Other caches built from a dataset
+(alignments, sorted indexes) subscribe to its invalidations to drop their entries as well.
+
+Cached slices are handed to every object asking for them, so they are read only: their arrays are
+marked non writeable and writing into them raises a ValueError. Copy a slice before modifying it.
+"""
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+import numpy as np
+
+
+MISSING = object() #returned by get on a miss, None is a valid cached slice
+
+
+class SliceCache(object):
+    """Byte bounded LRU cache of dataset slices.
+
+    Args:
+        max_bytes: int, optional
+            slices are evicted least recently used first once their total size exceeds max_bytes
+    """
+    def __init__(self, max_bytes=2**29):
+
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict() #key: (value, nbytes)
+        self._generations = {} #dataset: number of times it was invalidated
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, dataset):
+        """Returns the current generation of a dataset, pass it to :meth:`put`."""
+        return self._generations.get(dataset, 0)
+
+    def get(self, key):
+        """Returns the cached slice or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, generation):
+        """Caches a slice of key[0] computed while the dataset was at generation.
+        Slices computed before the dataset was reloaded are discarded. The arrays of a cached slice are
+        made read only, so value must not be a view of the dataset. Returns the cached slice, or value
+        when it was not cached.
+        """
+        nbytes = sizeof(value)
+        if nbytes > self.max_bytes:
+            return value
+
+        with self._lock:
+            if generation != self._generations.get(key[0], 0):
+                return value
+
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+
+            value = read_only(value)
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+        return value
+
+    def _evict(self):
+
+        while self.nbytes > self.max_bytes and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+
+    def invalidate(self, dataset=None):
+        """Drops the slices of a dataset, or every slice if dataset is None."""
+        with self._lock:
+            datasets = set(k[0] for k in self._entries) if dataset is None else {dataset}
+            datasets.update(self._generations if dataset is None else ())
+
+            for key in [k for k in self._entries if k[0] in datasets]:
+                self.nbytes -= self._entries.pop(key)[1]
+            for name in datasets:
+                self._generations[name] = self._generations.get(name, 0) + 1
+            self.invalidations += 1
+
+        for callback in list(self._subscribers):
+            callback(dataset)
+
+    def subscribe(self, callback):
+        """Calls callback(dataset) after the slices of a dataset are invalidated, dataset is None for all."""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def resize(self, max_bytes):
+        """Changes the size limit, evicting slices if needed."""
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def clear(self):
+        """Drops every slice and resets the metrics."""
+        self.invalidate()
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self):
+        """Returns hit/miss metrics and the current size of the cache.
+
+        Returns:
+            dict
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions,
+                    "invalidations": self.invalidations,
+                    "entries": len(self._entries),
+                    "bytes": self.nbytes,
+                    "max_bytes": self.max_bytes}
+
+
+def read_only(value):
+    """Returns the slice over arrays marked non writeable.
+    Frames are rebuilt around their own arrays (no copy) through public pandas API.
+    """
+    if isinstance(value, pd.Series):
+        read_only(value.to_numpy(copy=False)) #the Series' own array for numpy dtypes
+    elif isinstance(value, pd.DataFrame):
+        if value.dtypes.nunique() <= 1: #one block, its values are the transpose of the frame's array
+            return pd.DataFrame(read_only(value.to_numpy(copy=False)), index=value.index, columns=value.columns,
+                                copy=False)
+        columns = {i: read_only(value.iloc[:, i]) for i in range(value.shape[1])}
+        frame = pd.DataFrame(columns, index=value.index, copy=False)
+        frame.columns = value.columns
+        return frame
+    elif isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, tuple):
+        return tuple(read_only(i) for i in value)
+    return value
+
+
+def sizeof(value):
+    """Approximate bytes held by a slice."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    elif isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, bytes):
+        return len(value)
+    elif isinstance(value, tuple):
+        return sum(sizeof(i) for i in value)
+    return 64
+
+
+slice_cache = SliceCache(int(os.environ.get("CANDI_CACHE_BYTES", 2**29)))
@@ -1,5 +1,25 @@
 import pandas as pd
-from . import handlers
+from . import handlers, aio, alignment, intervals, export, ranks
+
+
+def awaitable(name, datasets):
+    """Returns an async version of the query method name.
+    The datasets it reads are loaded with Data.aload and the query runs on the CanDI thread pool,
+    they are kept in the datasets attribute of the returned method.
+    """
+    async def method(self, *args, **kwargs):
+        from ..candi import data
+
+        for key in datasets:
+            if getattr(data, key, None) is not None: #missing datasets raise in the query itself
+                await data.aload(key)
+        return await aio.run(getattr(self, name), *args, **kwargs)
+
+    method.__name__ = method.__qualname__ = "a" + name
+    method.__doc__ = "Awaitable version of :func:`{0}`, see its arguments.".format(name)
+    method.datasets = datasets
+    return method
+
 
 class Entity(object):
 
@@ -23,16 +43,20 @@ class Entity(object):
     - :func:`deletion <candi.Entity.deletion>`
     - :func:`cn_normal <candi.Entity.cn_normal>`
     - :func:`mutated <candi.Entity.mutated>`
+
+    With stream=True and no item, the filtering functions read the dataset in blocks of block_size genes
+    (block_size cell lines for a Gene) instead of slicing it at once, which bounds memory for large cohorts.
+    Results are the same as without streaming.
     """
 
     def __init__(self, obj):
 
-        if obj == ("gene" or "org"):
+        if obj in ("gene", "org"): #genes are rows of the datasets
             self._axis = 0
         else:
             self._axis = 1
 
-        if obj == ("gene" or "line"):
+        if obj in ("gene", "line"): #a single gene or line filters one column
             bi_filt = pd.Series
         else:
             bi_filt = pd.DataFrame
@@ -45,18 +69,212 @@ class Entity(object):
         self._copy_number_dup = handlers.BinaryFilter(1.07, bi_filt)
         self._mutation_handler = handlers.MutationHandler(obj)
 
+    #awaitable versions of the query methods
+    aexpressed = awaitable("expressed", ("expression",))
+    aunexpressed = awaitable("unexpressed", ("expression",))
+    aexpression_of = awaitable("expression_of", ("expression",))
+    aessential = awaitable("essential", ("gene_effect",))
+    anon_essential = awaitable("non_essential", ("gene_effect",))
+    aeffect_of = awaitable("effect_of", ("gene_effect",))
+    adependent = awaitable("dependent", ("gene_dependency",))
+    anon_dependent = awaitable("non_dependent", ("gene_dependency",))
+    adependency_of = awaitable("dependency_of", ("gene_dependency",))
+    aduplication = awaitable("duplication", ("gene_cn",))
+    adeletion = awaitable("deletion", ("gene_cn",))
+    acn_normal = awaitable("cn_normal", ("gene_cn",))
+    amutated = awaitable("mutated", ("mutations",))
+
     def __getattr__(self, attr):
+        """Datasets are looked up through the grabber, slices live in the shared slice cache
+        so entities only hold a reference to their grabber.
+        """
+        if attr.startswith("_"): #private and special attributes are never datasets
+            raise AttributeError(attr)
+
+        return self._grabber(attr)
+
+    def _memo_key(self): #identifies the object in keys of memoized results
+        return [self._grabber.grabber_type, self._grabber._cache_key]
+
+    def iter_blocks(self, dataset, block_size=2000, axis=0):
+        """Iterates over the object's slice of a dataset in blocks, without building the whole slice.
+
+        Args:
+            dataset: str
+                name of a gene by cell line dataset, eg. "gene_effect"
+            block_size: int, optional
+                number of genes (axis=0) or cell lines (axis=1) per block
+            axis: int, optional
+                0 for blocks of genes, 1 for blocks of cell lines
+        Returns:
+            generator
+                yields pandas DataFrames with genes as rows and cell lines as columns
+        """
+        return self._grabber.iter_blocks(dataset, block_size, axis)
+
+    def profile(self, items=None, datasets=None):
+        """Returns the object's values in every loaded gene by cell line dataset and its mutation status in one table.
+        Datasets are aligned once on shared genes and cell lines, see CanDI.structures.alignment.
+
+        Args:
+            items: str or list, optional
+                cell lines of a Gene, Organelle or GeneCluster profile, genes of a CellLine, Cancer or CellLineCluster profile
+            datasets: list, optional
+                gene by cell line datasets, defaults to the loaded ones of effect, dependency, expression,
+                copy number and reads
+        Returns:
+            pandas.core.frame.DataFrame
+                indexed by DepMap_ID for a Gene, by gene for a CellLine and by (gene, DepMap_ID) otherwise,
+                with effect, dependency, expression, cn, reads and mutated columns
+        """
+        grabber_type, key = self._grabber.grabber_type, self._grabber.key
+        if grabber_type in ("gene", "org"):
+            table = alignment.profile(genes=key, lines=items, datasets=datasets)
+        else:
+            table = alignment.profile(genes=items, lines=key, datasets=datasets)
+
+        if grabber_type == "gene":
+            return table.droplevel("gene")
+        elif grabber_type == "line":
+            return table.droplevel("DepMap_ID")
+        return table
+
+    def _region_filter(self):
+        """Genes or cell lines region queries of the object are restricted to."""
+        key = self._grabber.key
+        key = [key] if isinstance(key, str) else list(key)
+        return {"genes": key} if self._grabber.grabber_type in ("gene", "org") else {"lines": key}
+
+    def variants_in(self, region):
+        """Returns the object's mutations in a genomic region, see CanDI.structures.intervals.
+
+        Args:
+            region: str or tuple
+                "chr17:7,660,000-7,690,000" or (chromosome, start, end)
+        Returns:
+            pandas.core.frame.DataFrame
+                rows of the mutations table sorted by position
+        """
+        return intervals.variants_in(region, **self._region_filter())
+
+    def nearest_variants(self, position, k=1):
+        """Returns the object's k mutations closest to a position, with their distance in bases.
+
+        Args:
+            position: str or tuple
+                "chr17:7675000" or (chromosome, position)
+            k: int, optional
+        Returns:
+            pandas.core.frame.DataFrame
+        """
+        return intervals.nearest_variants(position, k, **self._region_filter())
+
+    def copy_number_in(self, region):
+        """Returns copy number of the genes in a genomic region across the object's cell lines.
+
+        Args:
+            region: str or tuple
+        Returns:
+            pandas.core.frame.DataFrame
+                genes by cell lines
+        """
+        return intervals.copy_number_in(region, self._region_filter().get("lines"))
+
+    def export(self, dataset, path, file_format="parquet", columns=None, compression="zstd", block_size=1000):
+        """Streams the object's slice of a dataset to a Parquet or Arrow IPC file without building the slice.
+
+        Args:
+            dataset: str
+                gene by cell line dataset, or a table with gene or DepMap_ID columns such as "mutations"
+            path: str
+                output file
+            file_format: str, optional
+                "parquet" or "arrow"
+            columns: list, optional
+                only export these columns, cell lines of a gene by cell line dataset
+            compression: str, optional
+                "zstd", "snappy", "lz4" or None
+            block_size: int, optional
+                number of rows per row group
+        Returns:
+            int
+                number of rows written
+        """
+        from ..candi import data
+
+        grabber_type, key = self._grabber.grabber_type, self._grabber.key
+        matrix = self._grabber.gtype.get(dataset) in (self._grabber.get_one, self._grabber.get_several)
+        if matrix:
+            chunks = self.iter_blocks(dataset, block_size)
+        else:
+            column = "gene" if grabber_type in ("gene", "org") else "DepMap_ID"
+            keep = set([key] if isinstance(key, str) else key)
+            chunks = (i.loc[i[column].isin(keep)] for i in data.iter_chunks(dataset, block_size))
 
-        values = self._grabber(attr)
+        if columns is not None:
+            chunks = (i.reindex(columns=[c for c in columns if c in i.columns]) for i in chunks)
 
-        setattr(self, attr, values)
-        return values
+        metadata = export.describe(data, dataset=dataset, columns=columns,
+                                   entity={"class": type(self).__name__, "type": grabber_type,
+                                           "key": [key] if isinstance(key, str) else list(key)})
+        schema = export.dataset_schema(data, dataset, scan=not matrix) #filtered table chunks are often sparse
+        return export.write(chunks, path, file_format, compression, metadata, schema)
+
+    def top(self, k=10, dataset="gene_effect", direction="under"):
+        """Returns the k most extreme genes of each of the object's cell lines, or lines of each of its genes.
+        Rankings are read from a sorted-value index of the dataset built once per load, see CanDI.structures.ranks.
+
+        Args:
+            k: int, optional
+                number of genes or cell lines per item
+            dataset: str, optional
+                gene by cell line dataset
+            direction: str, optional
+                "under" ranks the smallest values first (eg. most essential), "over" the largest
+        Returns:
+            pandas.core.frame.DataFrame
+                indexed by (item, rank) with the ranked gene or DepMap_ID and its value
+        """
+        key = self._grabber.key
+        key = [key] if isinstance(key, str) else list(key)
+        index = ranks.sorted_index(dataset)
+        if self._grabber.grabber_type in ("gene", "org"):
+            return index.top(k, genes=key, direction=direction)
+        return index.top(k, lines=key, direction=direction)
+
+    def _stream_filter(self, dataset, filters, style, return_lines, block_size):
+        """Applies filters block by block.
+        Filters decide on every gene (or cell line of a Gene) separately, so reducing the blocks gives the same
+        result as filtering the whole slice. Blocks of a Gene or CellLine are filtered as Series like their slices.
+        """
+        grabber_type = self._grabber.grabber_type
+        kept = []
+        for block in self.iter_blocks(dataset, block_size, 1 if grabber_type == "gene" else 0):
+            if grabber_type == "gene":
+                block = block.iloc[0]
+            elif grabber_type == "line":
+                block = block.iloc[:, 0]
+            for filt, caller, threshold in filters:
+                block = filt(block, "values", caller, threshold, False)
+            kept.append(block)
+
+        if grabber_type in ("gene", "line"):
+            values = pd.concat(kept) if kept else pd.Series(dtype=float)
+            return values if style == "values" else list(values.index)
+
+        values = pd.concat(kept) if kept else pd.DataFrame()
+        if style == "values":
+            return values
+        elif return_lines is False:
+            return list(values.index)
+        return {k: list(values.columns) for k in values.index}
 
     # """The following functions handle most common biologically relevant queries of candi objects.
     # They automatically call the filtering objects that are defined during instantiation.
     # """
 
-    def expressed(self, item=None, style='bool', threshold=1.0, return_lines=False):
+    def expressed(self, item=None, style='bool', threshold=1.0, return_lines=False, stream=False,
+                  block_size=2000):
         """Returns genes/celllines that are above a certain expression filter.
 
         Args:
@@ -70,6 +288,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item input is str
@@ -82,10 +303,15 @@ class Entity(object):
             pands.core.frame.DataFrame
                 Returns if style arg is 'values' and filter result is 2-d.
         """
+        if stream and item is None:
+            return self._stream_filter("expression", [(self._expression_filter, "over", threshold)],
+                                       style, return_lines, block_size)
+
         values = self._subset_handler(item, self.expression)
         return self._expression_filter(values, style, "over", threshold, return_lines)
 
-    def unexpressed(self, item=None, style='bool', threshold=1.0, return_lines=False):
+    def unexpressed(self, item=None, style='bool', threshold=1.0, return_lines=False, stream=False,
+                    block_size=2000):
         """Unexpressed function returns genes/cellline(s) that are below a certain expression filter.
 
         Args:
@@ -99,6 +325,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item input is str
@@ -111,6 +340,10 @@ class Entity(object):
             pands.core.frame.DataFrame
                 Returns if style arg is 'values' and filter result is 2-d.
         """
+        if stream and item is None:
+            return self._stream_filter("expression", [(self._expression_filter, "under", threshold)],
+                                       style, return_lines, block_size)
+
         values = self._subset_handler(item, self.expression)
 
         return self._expression_filter(values, style, "under", threshold, return_lines)
@@ -144,7 +377,8 @@ class Entity(object):
         """
         return self._subset_handler(items, self.gene_effect)
 
-    def essential(self, item=None, style="bool", threshold=1.0, return_lines=False):
+    def essential(self, item=None, style="bool", threshold=1.0, return_lines=False, stream=False,
+                  block_size=2000):
         """Returns genes/cellline(s) who's gene effect is less than -1.
 
         Args:
@@ -158,6 +392,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item input is str
@@ -170,10 +407,15 @@ class Entity(object):
             pands.core.frame.DataFrame
                 Returns if style arg is 'values' and filter result is 2-d.
         """
+        if stream and item is None:
+            return self._stream_filter("gene_effect", [(self._essentiality_filter, "under", threshold)],
+                                       style, return_lines, block_size)
+
         values = self._subset_handler(item, self.gene_effect)
         return self._essentiality_filter(values, style, "under", threshold, return_lines)
 
-    def non_essential(self, item=None, style="bool", threshold=1.0, return_lines=False):
+    def non_essential(self, item=None, style="bool", threshold=1.0, return_lines=False, stream=False,
+                      block_size=2000):
         """Returns genes/cellline(s) who's gene effect is greater than -1.
         
         Args:
@@ -187,6 +429,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item input is str
@@ -195,8 +440,13 @@ class Entity(object):
             pandas.core.series.Series
                 Returns if style arg is 'values'.
             pands.core.frame.DataFrame
-                Returns if style arg is 'values'. Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
+                Returns if style arg is 'values'. Only relevant for Cancer, CellLineCluster, Organelle,
+                and GeneCluster objects.
         """
+        if stream and item is None:
+            return self._stream_filter("gene_effect", [(self._essentiality_filter, "over", threshold)],
+                                       style, return_lines, block_size)
+
         values = self._subset_handler(item, self.gene_effect)
         return self._essentiality_filter(values, style, "over", threshold, return_lines)
 
@@ -214,7 +464,8 @@ class Entity(object):
         """
         return self._subset_handler(items, self.gene_dependency)
 
-    def dependent(self, item=None, style='bool', threshold=1.0, return_lines=False):
+    def dependent(self, item=None, style='bool', threshold=1.0, return_lines=False, stream=False,
+                  block_size=2000):
         """Returns genes/cellline(s) whose gene dependency is greater than 0.5
         
         Args:
@@ -228,6 +479,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item arg is type str
@@ -240,10 +494,15 @@ class Entity(object):
             pands.core.frame.DataFrame
                 Returns if style arg is 'values' and filter result is 2-d.
         """
+        if stream and item is None:
+            return self._stream_filter("gene_dependency", [(self._dependency_filter, "over", threshold)],
+                                       style, return_lines, block_size)
+
         values = self._subset_handler(item, self.gene_dependency)
         return self._dependency_filter(values, style, "over", threshold, return_lines)
 
-    def non_dependent(self, item=None, style='bool', threshold=1.0, return_lines=False):
+    def non_dependent(self, item=None, style='bool', threshold=1.0, return_lines=False, stream=False,
+                      block_size=2000):
         """Returns genes/celline(s) whose gene dependency is less than 0.5
         
         Args:
@@ -257,6 +516,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item arg is type str
@@ -269,10 +531,15 @@ class Entity(object):
             pands.core.frame.DataFrame
                 Returns if style arg is 'values' and filter result is 2-d.
         """
+        if stream and item is None:
+            return self._stream_filter("gene_dependency", [(self._dependency_filter, "under", threshold)],
+                                       style, return_lines, block_size)
+
         values = self._subset_handler(item, self.gene_dependency)
         return self._dependency_filter(values, style, "under", threshold, return_lines)
 
-    def duplication(self, item=None, style='bool', threshold=1.0, return_lines=False):
+    def duplication(self, item=None, style='bool', threshold=1.0, return_lines=False, stream=False,
+                    block_size=2000):
         """Returns gene(s)/cellline(s) with copy number above specific threshold.
 
         Args:
@@ -286,6 +553,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item arg is type str
@@ -298,10 +568,15 @@ class Entity(object):
             pands.core.frame.DataFrame
                 Returns if style arg is 'values' and filter result is 2-d.
         """
+        if stream and item is None:
+            return self._stream_filter("gene_cn", [(self._copy_number_dup, "over", threshold)],
+                                       style, return_lines, block_size)
+
         values = self._subset_handler(item, self.gene_cn)
         return self._copy_number_dup(values, style, "over", threshold, return_lines)
 
-    def deletion(self, item=None, style='bool', threshold=1.0, return_lines=False):
+    def deletion(self, item=None, style='bool', threshold=1.0, return_lines=False, stream=False,
+                 block_size=2000):
         """Returns gene(s)/cellline(s) with copy number below specific threshold.
 
         Args:
@@ -315,6 +590,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item arg is type str
@@ -327,10 +605,15 @@ class Entity(object):
             pands.core.frame.DataFrame
                 Returns if style arg is 'values' and filter result is 2-d.
         """
+        if stream and item is None:
+            return self._stream_filter("gene_cn", [(self._copy_number_del, "under", threshold)],
+                                       style, return_lines, block_size)
+
         values = self._subset_handler(item, self.gene_cn)
         return self._copy_number_del(values, style, "under", threshold, return_lines)
 
-    def cn_normal(self, item=None, style='bool', threshold=1.0, return_lines=False):
+    def cn_normal(self, item=None, style='bool', threshold=1.0, return_lines=False, stream=False,
+                  block_size=2000):
         """Returns gene(s)/cellline(s) with normal copy number.
 
         Args:
@@ -344,6 +627,9 @@ class Entity(object):
                 Only relevant for Cancer, CellLineCluster, Organelle, and GeneCluster objects.
             return_lines: bool, optional
                 not implemented
+            stream: bool, optional
+            block_size: int, optional
+                see streaming in :class:`Entity <candi.Entity>`
         Returns:
             bool
                 Returns bool if item arg is type str
@@ -356,6 +642,10 @@ class Entity(object):
             pands.core.frame.DataFrame
                 Returns if style arg is 'values' and filter result is 2-d.
         """
+        if stream and item is None:
+            filters = [(self._copy_number_dup, "under", threshold), (self._copy_number_del, "over", threshold)]
+            return self._stream_filter("gene_cn", filters, style, return_lines, block_size)
+
         values = self._subset_handler(item, self.gene_cn)
         under = self._copy_number_dup(values, "values", "under", threshold, return_lines)
         over = self._copy_number_del(under, style, "over", threshold, return_lines)
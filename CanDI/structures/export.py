@@ -0,0 +1,222 @@
+"""Streaming export of datasets and query results to Parquet and Arrow IPC files.
+Chunks of a dataset are converted and written one row group or record batch at a time, so an export
+never holds more than one chunk in memory. Every file carries the CanDI version, release, config and
+the query it was written from in its schema metadata under the "candi" key.
+
+The schema of a file is the schema of the whole dataset, see dataset_schema, so columns that are
+missing or hold only integers in the first chunks keep the type of their later values.
+"""
+import json
+import itertools
+from pathlib import Path
+import pandas as pd
+
+from ..__version__ import version
+
+
+FORMATS = ["parquet", "arrow"]
+
+
+def write(chunks, path, file_format="parquet", compression="zstd", metadata=None, schema=None):
+    """Writes an iterable of DataFrames to one file.
+
+    Args:
+        chunks: iterable
+            pandas DataFrames with the same columns. Indexes other than a RangeIndex are written as columns.
+        path: str
+            output file
+        file_format: str, optional
+            "parquet" or "arrow" (Arrow IPC file)
+        compression: str, optional
+            codec of the row groups or record batches, eg. "zstd", "snappy" (parquet only), "lz4" or None
+        metadata: dict, optional
+            JSON serializable description stored in the schema metadata
+        schema: pyarrow.Schema, optional
+            types of the columns (see dataset_schema), fields missing from the chunks are dropped. Defaults to the
+            types of the first non-empty chunk with missing columns as strings, later chunks are cast to them.
+    Returns:
+        int
+            number of rows written
+    """
+    import pyarrow as pa #imported here so CanDI imports without pyarrow
+
+    if file_format not in FORMATS:
+        raise ValueError("file_format must be one of {}".format(FORMATS))
+
+    writer = empty = None
+    rows = 0
+    try:
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is None: #end of the chunks, an empty result still gets a file with its columns
+                if writer is not None or empty is None:
+                    break
+                chunk = empty
+            elif chunk.empty and writer is None and schema is None:
+                #types of empty chunks are unknown, filtered blocks are often empty
+                empty = chunk
+                continue
+
+            preserve_index = not _is_range(chunk.index)
+            if writer is None:
+                schema = schema_of(chunk, schema)
+                schema = schema.with_metadata(dict(schema.metadata or {}, candi=json.dumps(metadata or {}, default=str)))
+                writer = _writer(path, schema, file_format, compression)
+            writer.write_table(_table(chunk, schema, preserve_index))
+            rows += len(chunk)
+            if chunk is empty:
+                break
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        raise ValueError("nothing to export")
+    return rows
+
+
+def schema_of(df, schema=None):
+    """Returns the arrow schema of a DataFrame's columns and named index.
+    Text and empty columns are strings. With a schema, the types of its fields are used for the columns it has.
+    """
+    import pyarrow as pa
+
+    preserve_index = not _is_range(df.index)
+    inferred = pa.Schema.from_pandas(df.iloc[:0], preserve_index=preserve_index)
+    dtypes = dict(df.dtypes.items())
+    if preserve_index:
+        dtypes.update({"__index_level_{}__".format(i) if name is None else name: df.index.get_level_values(i).dtype
+                       for i, name in enumerate(df.index.names)})
+
+    fields = []
+    for field in inferred:
+        if schema is not None and field.name in schema.names:
+            field = schema.field(field.name)
+        elif pa.types.is_null(field.type) or not pd.api.types.is_numeric_dtype(dtypes.get(field.name, object)) \
+                and not pd.api.types.is_bool_dtype(dtypes.get(field.name, object)):
+            field = field.with_type(pa.string())
+        fields.append(field)
+
+    return pa.schema(fields, metadata=inferred.metadata)
+
+
+def dataset_schema(data, key, scan=True, chunk_size=100000):
+    """Returns the arrow schema of a whole dataset of the global data object.
+    Loaded datasets and parquet files give their schema directly, csv files are scanned once in chunks
+    and every column gets the widest type of its values (missing, integer, float or string).
+
+    Args:
+        data: Data
+        key: str
+            name of the dataset
+        scan: bool, optional
+            scan csv files, otherwise None is returned for them
+        chunk_size: int, optional
+            rows per chunk when scanning a csv file
+    Returns:
+        pyarrow.Schema
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    dataset = getattr(data, key, None)
+    if isinstance(dataset, pd.DataFrame):
+        return schema_of(dataset)
+    if Path(dataset).suffix == ".parquet":
+        return pq.read_schema(dataset)
+    if not scan:
+        return None
+
+    kinds = {}
+    for chunk in data.iter_chunks(key, chunk_size):
+        columns = chunk.reset_index() if not _is_range(chunk.index) else chunk
+        for name, values in columns.items():
+            kinds[name] = _widest(kinds.get(name), _kind(values))
+
+    types = {"int": pa.int64(), "float": pa.float64(), "bool": pa.bool_(), "string": pa.string(), None: pa.string()}
+    return pa.schema([(name, types[kind]) for name, kind in kinds.items()])
+
+
+def read_metadata(path):
+    """Returns the CanDI metadata of an exported Parquet or Arrow IPC file."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        schema = pq.read_schema(path)
+    except pa.ArrowInvalid:
+        with pa.memory_map(str(path)) as source:
+            schema = pa.ipc.open_file(source).schema
+
+    return json.loads((schema.metadata or {}).get(b"candi", b"{}"))
+
+
+def describe(data, **query):
+    """Returns the metadata of an export from the global data object."""
+    release = data.release or data._parser.get("depmap_release", "releaseName", fallback=None)
+    return dict({"version": version, "release": release, "config": str(getattr(data, "config_path", ""))}, **query)
+
+
+def _table(chunk, schema, preserve_index):
+    """Converts a chunk to a table of the schema, casting columns whose values pandas inferred differently."""
+    import pyarrow as pa
+
+    try:
+        return pa.Table.from_pandas(chunk, schema=schema, preserve_index=preserve_index)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+
+    chunk = chunk.copy()
+    for field in schema:
+        if field.name not in chunk.columns:
+            continue
+        values = chunk[field.name]
+        if pa.types.is_string(field.type):
+            chunk[field.name] = values.map(lambda v: v if isinstance(v, str) or pd.isna(v) else str(v)).astype(object)
+        elif pa.types.is_floating(field.type) or pa.types.is_integer(field.type):
+            try:
+                chunk[field.name] = pd.to_numeric(values)
+            except (ValueError, TypeError):
+                raise ValueError("column {0} has values that are not {1}, pass the schema of the whole dataset"
+                                 .format(field.name, field.type)) from None
+    return pa.Table.from_pandas(chunk, schema=schema, preserve_index=preserve_index)
+
+
+def _kind(values):
+
+    values = values.dropna()
+    if values.empty:
+        return None
+    elif pd.api.types.is_bool_dtype(values):
+        return "bool"
+    elif pd.api.types.is_integer_dtype(values):
+        return "int"
+    elif pd.api.types.is_float_dtype(values):
+        return "float" if (values != values.round()).any() else "int"
+    return "string"
+
+
+def _widest(first, second):
+
+    if first is None or first == second:
+        return second
+    if second is None:
+        return first
+    if {first, second} == {"int", "float"}:
+        return "float"
+    return "string"
+
+
+def _writer(path, schema, file_format, compression):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format == "parquet":
+        return pq.ParquetWriter(str(path), schema, compression=compression or "none")
+
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    return pa.ipc.new_file(str(path), schema, options=options)
+
+
+def _is_range(index):
+
+    return isinstance(index, pd.RangeIndex) and index.name is None
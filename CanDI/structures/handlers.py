@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 from collections.abc import Iterable
 import six
+from .telemetry import instrument
 
 
 class BinaryFilter:
@@ -17,6 +18,7 @@ class BinaryFilter:
         self._default = self._handlers[handler]
 
 
+    @instrument("BinaryFilter.__call__", measure=lambda args, result: args[1])
     def __call__(self, vals, style, caller, threshold, return_lines=False):
         """Core function of binary filter. Behavior is defined during instantiation
         and is applied here.
@@ -118,6 +120,7 @@ class MutationHandler(object):
         self.version = version
 
 
+    @instrument("MutationHandler.__call__", measure=lambda args, result: args[1])
     def __call__(self, mut_dat, output, variant, item, translocations, fusions, all_except):
         """Core function of mutation handler.
         Behavior is defined on instantiation and applied in this function.
@@ -0,0 +1,315 @@
+"""Genomic interval index of the mutations and gene coordinates.
+Intervals are sorted by start within every chromosome next to the running maximum of their ends,
+so the intervals overlapping a region are found with two binary searches. Indexes are built
+once per loaded table and rebuilt when it is loaded again.
+
+Regions are "chr17:7,660,000-7,690,000", "17:7660000" or (chromosome, start, end) tuples,
+positions are 1-based and inclusive like the positions of the mutations table.
+"""
+import re
+import threading
+import numpy as np
+import pandas as pd
+
+from .cache import slice_cache
+
+
+#chromosome, start and end columns of the mutations table
+MUTATION_COLUMNS = ("Chromosome", "Start_position", "End_position")
+#accepted names of coordinate columns in gene_info
+GENE_COLUMNS = [("chromosome", "start", "end"), ("Chromosome", "Start", "End"), ("chrom", "start", "end")]
+
+_indexes = {} #name: (token, IntervalIndex)
+_lock = threading.Lock()
+
+
+class IntervalIndex(object):
+    """Index of the intervals of a table.
+
+    Args:
+        chromosomes: array-like
+        starts: array-like
+        ends: array-like
+            intervals, in the order of the rows of the indexed table
+    """
+    def __init__(self, chromosomes, starts, ends):
+
+        chromosomes = np.asarray([_chromosome(i) for i in chromosomes], dtype=object)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        self.size = len(starts)
+
+        self._chromosomes = {}
+        for chrom in pd.unique(chromosomes):
+            rows = np.flatnonzero(chromosomes == chrom)
+            order = rows[np.argsort(starts[rows], kind="stable")]
+            self._chromosomes[chrom] = (order, starts[order], ends[order], np.maximum.accumulate(ends[order]))
+
+    @property
+    def chromosomes(self):
+        return list(self._chromosomes)
+
+    def overlap(self, region):
+        """Returns the sorted rows of the intervals overlapping a region."""
+        chrom, start, end = parse_region(region)
+        if chrom not in self._chromosomes:
+            return np.empty(0, dtype=np.int64)
+
+        order, starts, ends, max_ends = self._chromosomes[chrom]
+        hi = np.searchsorted(starts, end, side="right") #intervals starting after the region are out
+        lo = np.searchsorted(max_ends, start, side="left") #as are intervals before the first one reaching it
+        rows = order[lo:hi][ends[lo:hi] >= start]
+        return np.sort(rows)
+
+    def overlap_many(self, regions):
+        """Returns (region position, row) pairs of every interval overlapping each region.
+
+        Args:
+            regions: list or pandas.core.frame.DataFrame
+                regions, or a DataFrame with chromosome, start and end as its first three columns
+        Returns:
+            tuple
+                two numpy arrays of equal length
+        """
+        if isinstance(regions, pd.DataFrame):
+            regions = list(regions.iloc[:, :3].itertuples(index=False, name=None))
+
+        queries, rows = [], []
+        for i, region in enumerate(regions):
+            hits = self.overlap(region)
+            queries.append(np.full(len(hits), i))
+            rows.append(hits)
+
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(queries).astype(np.int64), np.concatenate(rows)
+
+    def nearest(self, position, k=1, rows=None):
+        """Returns the rows of the k intervals closest to a position, closest first.
+
+        Args:
+            position: str or tuple
+                "chr17:7675000" or (chromosome, position)
+            k: int, optional
+            rows: numpy.ndarray, optional
+                only consider these rows of the table
+        Returns:
+            tuple
+                rows and their distances in bases, 0 for intervals containing the position
+        """
+        chrom, start, _ = parse_region(position)
+        if chrom not in self._chromosomes:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        order, starts, ends, _ = self._chromosomes[chrom]
+        if rows is not None:
+            keep = np.isin(order, rows)
+            order, starts, ends = order[keep], starts[keep], ends[keep]
+
+        distance = np.maximum(np.maximum(starts - start, start - ends), 0)
+        k = min(k, len(order))
+        closest = np.argpartition(distance, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+        closest = closest[np.lexsort((order[closest], distance[closest]))]
+        return order[closest], distance[closest]
+
+
+def parse_region(region):
+    """Returns (chromosome, start, end) of a region or position.
+
+    Args:
+        region: str or tuple
+            "chr17:7,660,000-7,690,000", "17:7660000", (chromosome, start, end) or (chromosome, position)
+    Returns:
+        tuple
+    """
+    if isinstance(region, str):
+        match = re.fullmatch(r"(?:chr)?([^:]+):([\d,_]+)(?:-([\d,_]+))?", region.strip())
+        if match is None:
+            raise ValueError("cannot parse region {}".format(region))
+        chrom, start, end = match.groups()
+        start = int(re.sub(r"[,_]", "", start))
+        end = start if end is None else int(re.sub(r"[,_]", "", end))
+    elif len(region) == 2:
+        chrom, start = region
+        end = start
+    else:
+        chrom, start, end = region
+
+    if end < start:
+        raise ValueError("region {} ends before it starts".format(region))
+    return _chromosome(chrom), int(start), int(end)
+
+
+def _chromosome(chrom):
+    chrom = str(chrom)
+    chrom = chrom[3:] if chrom.lower().startswith("chr") else chrom
+    return chrom[:-2] if chrom.endswith(".0") else chrom #numeric chromosomes read as floats
+
+
+def mutation_index():
+    """Returns the interval index of the loaded mutations table, built once per load."""
+    from ..candi import data
+
+    mutations = _loaded(data, "mutations")
+    return _cached("mutations", (slice_cache.generation("mutations"), id(mutations)),
+                   lambda: IntervalIndex(*[mutations[i] for i in MUTATION_COLUMNS]))
+
+
+def gene_coordinates(coordinates=None):
+    """Returns chromosome, start and end of every gene.
+    Coordinates come from a coordinates table, or from gene_info if it has chromosome, start and end columns.
+
+    Args:
+        coordinates: pandas.core.frame.DataFrame or str, optional
+            table indexed by gene symbol with chromosome, start and end columns (any names of GENE_COLUMNS),
+            or a csv file of it with the symbols in the first column. Defaults to data.gene_coordinates if it
+            is set, otherwise gene_info.
+    Returns:
+        pandas.core.frame.DataFrame
+            indexed by gene symbol
+    """
+    from ..candi import data
+
+    table = _coordinate_table(data, coordinates)
+    for columns in GENE_COLUMNS:
+        if all(i in table.columns for i in columns):
+            coordinates = table[list(columns)].dropna()
+            coordinates.columns = ["chromosome", "start", "end"]
+            return coordinates.astype({"start": np.int64, "end": np.int64})
+
+    raise ValueError("gene coordinates need chromosome, start and end columns, gene_info has none: "
+                     "pass a coordinates table or set data.gene_coordinates")
+
+
+def gene_index(coordinates=None):
+    """Returns (interval index, gene symbols) of the gene coordinates, see gene_coordinates."""
+    from ..candi import data
+
+    source = getattr(data, "gene_coordinates", None) if coordinates is None else coordinates
+    token = (id(data.genes), id(source) if isinstance(source, pd.DataFrame) else str(source))
+
+    def build():
+        table = gene_coordinates(coordinates)
+        return IntervalIndex(table.chromosome, table.start, table.end), table.index
+
+    return _cached("genes", token, build)
+
+
+def variants_in(region, lines=None, genes=None):
+    """Returns the mutations overlapping a region.
+
+    Args:
+        region: str or tuple
+        lines: list, optional
+            only variants of these DepMap_IDs
+        genes: list, optional
+            only variants of these genes
+    Returns:
+        pandas.core.frame.DataFrame
+            rows of the mutations table sorted by position
+    """
+    from ..candi import data
+
+    mutations = _loaded(data, "mutations")
+    hits = mutations.iloc[mutation_index().overlap(region)]
+    hits = _restrict(hits, lines, genes)
+    return hits.sort_values(list(MUTATION_COLUMNS[1:]), kind="stable")
+
+
+def nearest_variants(position, k=1, lines=None, genes=None):
+    """Returns the k mutations closest to a position with their distance in a distance column."""
+    from ..candi import data
+
+    mutations = _loaded(data, "mutations")
+    rows = None
+    if lines is not None or genes is not None:
+        rows = np.flatnonzero(_restrict(mutations, lines, genes, mask=True))
+
+    rows, distance = mutation_index().nearest(position, k, rows)
+    return mutations.iloc[rows].assign(distance=distance)
+
+
+def overlapping_variants(regions, lines=None, genes=None):
+    """Returns the mutations overlapping each of several regions.
+
+    Args:
+        regions: list or pandas.core.frame.DataFrame
+            see IntervalIndex.overlap_many
+    Returns:
+        pandas.core.frame.DataFrame
+            mutations with the position of the region they overlap in a region column
+    """
+    from ..candi import data
+
+    mutations = _loaded(data, "mutations")
+    queries, rows = mutation_index().overlap_many(regions)
+    hits = mutations.iloc[rows].assign(region=queries)
+    return _restrict(hits, lines, genes)
+
+
+def genes_in(region, coordinates=None):
+    """Returns the symbols of the genes overlapping a region, sorted by position.
+    Genes are placed by their coordinates, see gene_coordinates.
+    """
+    index, symbols = gene_index(coordinates)
+    return list(symbols[index.overlap(region)])
+
+
+def copy_number_in(region, lines=None, coordinates=None):
+    """Returns the gene_cn rows of the genes in a region.
+
+    Args:
+        region: str or tuple
+        lines: list, optional
+            only these DepMap_IDs
+        coordinates: pandas.core.frame.DataFrame or str, optional
+            see gene_coordinates
+    Returns:
+        pandas.core.frame.DataFrame
+            genes by cell lines
+    """
+    from ..candi import data
+
+    gene_cn = _loaded(data, "gene_cn")
+    values = gene_cn.reindex([i for i in genes_in(region, coordinates) if i in gene_cn.index])
+    if lines is not None:
+        values = values[[i for i in lines if i in values.columns]]
+    return values
+
+
+def _restrict(table, lines, genes, mask=False):
+
+    keep = np.ones(len(table), dtype=bool)
+    if lines is not None:
+        keep &= table.DepMap_ID.isin([lines] if isinstance(lines, str) else lines).to_numpy()
+    if genes is not None:
+        keep &= table.gene.isin([genes] if isinstance(genes, str) else genes).to_numpy()
+    return keep if mask else table.loc[keep]
+
+
+def _loaded(data, key):
+
+    table = getattr(data, key, None)
+    if not isinstance(table, pd.DataFrame):
+        raise ValueError("{} must be loaded for region queries".format(key))
+    return table
+
+
+def _coordinate_table(data, coordinates):
+
+    if coordinates is None:
+        coordinates = getattr(data, "gene_coordinates", None)
+    if coordinates is None:
+        return data.genes
+    if not isinstance(coordinates, pd.DataFrame):
+        coordinates = pd.read_csv(coordinates, index_col=0)
+    return coordinates
+
+
+def _cached(name, token, build):
+
+    with _lock:
+        cached = _indexes.get(name)
+        if cached is None or cached[0] != token:
+            cached = _indexes[name] = (token, build())
+        return cached[1]
@@ -0,0 +1,392 @@
+"""Persistent memoization of expensive CanDI analyses.
+Results are stored on disk under a key made from the function, its parameters and a content
+fingerprint of the datasets and files it reads, so a result is reused by every kernel until
+its inputs change. The store is bounded in bytes, least recently used results are evicted first.
+Several processes can share a store, results are written atomically and a result being
+computed by one process is waited for instead of computed twice.
+
+The store is off by default, memoized functions are then plain calls. Turn it on with CANDI_MEMO=1
+or memo.enabled = True, CANDI_MEMO_BYTES bounds its size (1 GB by default).
+
+    from CanDI.structures.memo import memo
+
+    @memo.memoize(datasets=("dataset",), ignore=("n_jobs",))
+    def analysis(dataset, cutoff, n_jobs=4):
+        ...
+
+Pipelines can be split into checkpointed stages, rerunning a crashed run resumes after the
+last completed stage:
+
+    with memo.checkpoints("screen") as stage:
+        counts, metadata = stage("counts", cohort_counts, cohorts)
+        results = stage("deseq", run_deseq_contrasts, cohorts)
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import inspect
+import tempfile
+import functools
+from importlib import metadata
+from pathlib import Path
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+from ..__version__ import version
+
+try:
+    import fcntl
+except ImportError: #no advisory locks on windows, concurrent writers may compute a result twice
+    fcntl = None
+
+
+MISSING = object()
+
+
+class Memo(object):
+    """On disk store of memoized results.
+
+    Args:
+        directory: str, optional
+            root of the store. Defaults to the CANDI_MEMO_DIR environment variable or ~/.cache/candi/memo
+        max_bytes: int, optional
+            results are evicted least recently used first once the store grows past max_bytes.
+            Defaults to the CANDI_MEMO_BYTES environment variable or 1 GB. Checkpoints are not evicted.
+        enabled: bool, optional
+            memoized functions are called directly when False. Defaults to True only if CANDI_MEMO=1.
+    """
+    def __init__(self, directory="auto", max_bytes=None, enabled=None):
+
+        if directory == "auto":
+            directory = os.environ.get("CANDI_MEMO_DIR") or Path.home() / ".cache" / "candi" / "memo"
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("CANDI_MEMO_BYTES", 2**30))
+        if enabled is None:
+            enabled = os.environ.get("CANDI_MEMO", "0") == "1"
+
+        self.directory = Path(directory)
+        self.max_bytes = int(max_bytes)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._fingerprints = {} #(path, size, mtime) → checksum, mirrored in fingerprints.json
+
+    @property
+    def _objects(self):
+        return self.directory / "objects"
+
+    def _path(self, key):
+        return self._objects / key[:2] / "{}.pkl".format(key)
+
+    def key(self, name, params):
+        """Returns the hex digest identifying a call of name with params."""
+        payload = json.dumps([version, name, _canonical(params, self)], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Returns the stored result or MISSING."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return MISSING
+
+        try:
+            os.utime(path) #the modification time orders eviction
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Stores a result atomically and evicts old results if the store is over its size limit."""
+        _atomic_dump(value, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used results until the store fits in max_bytes."""
+        if not self._objects.exists():
+            return
+
+        with self._locked("evict"):
+            entries = []
+            for path in self._objects.glob("*/*.pkl"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(i[1] for i in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._remove_lock(path.stem)
+                total -= size
+
+    def clear(self):
+        """Removes every stored result, checkpoints are kept."""
+        for path in self._objects.glob("*/*.pkl") if self._objects.exists() else ():
+            os.remove(path)
+            self._remove_lock(path.stem)
+
+    def stats(self):
+        """Returns hit/miss counts of this process and the size of the store."""
+        sizes = [i.stat().st_size for i in self._objects.glob("*/*.pkl")] if self._objects.exists() else []
+        return {"hits": self.hits, "misses": self.misses, "entries": len(sizes),
+                "bytes": sum(sizes), "max_bytes": self.max_bytes, "directory": str(self.directory)}
+
+    @contextmanager
+    def _locked(self, name):
+        """Holds an exclusive lock shared by all processes using the store."""
+        if fcntl is None:
+            yield
+            return
+
+        lock_dir = self.directory / "locks"
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(lock_dir / "{}.lock".format(name), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _remove_lock(self, name):
+        """Removes the lock file of a result unless a process holds it."""
+        path = self.directory / "locks" / "{}.lock".format(name)
+        if fcntl is None or not path.exists():
+            return
+
+        try:
+            with open(path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(path)
+        except (BlockingIOError, FileNotFoundError):
+            pass
+
+    def fingerprint_file(self, path):
+        """Returns the MD5 of a file's content.
+        Checksums are kept per (path, size, modification time) so each version of a file is read once.
+        """
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        token = "{0}:{1}:{2}".format(path, stat.st_size, stat.st_mtime_ns)
+
+        if token not in self._fingerprints:
+            index = self.directory / "fingerprints.json"
+            if not self._fingerprints and index.exists():
+                try:
+                    with open(index) as f:
+                        self._fingerprints.update(json.load(f))
+                except ValueError:
+                    pass
+
+        if token not in self._fingerprints:
+            digest = hashlib.md5()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(2**24), b""):
+                    digest.update(block)
+            self._fingerprints[token] = digest.hexdigest()
+
+            with self._locked("fingerprints"):
+                index = self.directory / "fingerprints.json"
+                stored = {}
+                if index.exists():
+                    try:
+                        with open(index) as f:
+                            stored = json.load(f)
+                    except ValueError:
+                        pass
+                stored[token] = self._fingerprints[token]
+                _atomic_write_text(json.dumps(stored), index)
+
+        return self._fingerprints[token]
+
+    def fingerprint_dataset(self, dataset):
+        """Returns a content fingerprint of a dataset of the global data object or of a DataFrame."""
+        if not isinstance(dataset, str):
+            return _canonical(dataset, self)
+
+        from ..candi import data #imported here so the store can be used without installed data
+
+        path = data.path(dataset) if dataset in data.depmap_files else None
+        if path is not None and path.exists():
+            return self.fingerprint_file(path)
+
+        return _canonical(getattr(data, dataset), self)
+
+    def memoize(self, func=None, datasets=(), uses=(), files=(), ignore=(), versions=(), when=None, name=None):
+        """Decorator storing the results of a function on disk.
+
+        Args:
+            func: callable
+            datasets: tuple, optional
+                names of parameters holding datasets, either names of datasets on the global data object
+                or DataFrames. Their content fingerprint is part of the key instead of their value.
+            uses: tuple, optional
+                names of datasets on the global data object the function reads without taking them as parameters
+            files: tuple, optional
+                names of parameters holding file paths whose content is part of the key
+            ignore: tuple, optional
+                names of parameters that do not change the result, eg. number of workers
+            versions: tuple, optional
+                names of installed packages whose version is part of the key, eg. the package fitting a model
+            when: callable, optional
+                when(params) returns False for calls that should not be memoized
+            name: str, optional
+                name of the function in the key, defaults to its module and qualified name
+        """
+        if func is None:
+            return functools.partial(self.memoize, datasets=datasets, uses=uses, files=files,
+                                     ignore=ignore, versions=versions, when=when, name=name)
+
+        signature = inspect.signature(func)
+        name = name or "{0}.{1}".format(func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            if when is not None and not when(params):
+                return func(*args, **kwargs)
+
+            for i in ignore:
+                params.pop(i, None)
+            for i in datasets:
+                params[i] = {"dataset": self.fingerprint_dataset(params[i])}
+            for i in files:
+                params[i] = {"file": self.fingerprint_file(params[i])}
+            params["__uses__"] = {i: self.fingerprint_dataset(i) for i in uses}
+            params["__versions__"] = {i: metadata.version(i) for i in versions}
+
+            key = self.key(name, params)
+            value = self.get(key)
+            if value is not MISSING:
+                return value
+
+            with self._locked(key): #another process may be computing the same result
+                value = self.get(key)
+                if value is MISSING:
+                    value = func(*args, **kwargs)
+                    self.put(key, value)
+
+            return value
+
+        wrapper.memo = self
+        return wrapper
+
+    @contextmanager
+    def checkpoints(self, run):
+        """Context manager yielding a :class:`Checkpoints` for a named pipeline run."""
+        yield Checkpoints(self, run)
+
+
+class Checkpoints(object):
+    """Completed stages of a pipeline run, stored outside the evicted part of the store.
+
+    Calling it runs a stage, stage(name, func, *args, **kwargs) returns the stored result
+    if the stage already completed with the same function and arguments.
+    """
+    def __init__(self, memo, run):
+
+        self.memo = memo
+        self.run = run
+        self.directory = memo.directory / "checkpoints" / run
+
+    def _path(self, stage, key):
+        return self.directory / "{0}-{1}.pkl".format(stage, key[:16])
+
+    def __call__(self, stage, func, *args, **kwargs):
+
+        key = self.memo.key("{0}/{1}".format(self.run, stage),
+                            {"func": "{0}.{1}".format(func.__module__, func.__qualname__),
+                             "args": list(args), "kwargs": kwargs})
+        path = self._path(stage, key)
+
+        if path.exists():
+            with open(path, "rb") as f:
+                return pickle.load(f)
+
+        value = func(*args, **kwargs)
+        _atomic_dump(value, path)
+        return value
+
+    def stages(self):
+        """Returns the names of the completed stages."""
+        if not self.directory.exists():
+            return []
+        return sorted(i.name.rsplit("-", 1)[0] for i in self.directory.glob("*.pkl"))
+
+    def clear(self):
+        """Removes the stored stages of this run."""
+        for path in self.directory.glob("*.pkl") if self.directory.exists() else ():
+            os.remove(path)
+
+
+def _atomic_dump(value, path):
+
+    os.makedirs(path.parent, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _atomic_write_text(text, path):
+
+    os.makedirs(path.parent, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=path.parent)
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _canonical(value, memo):
+    """Turns a parameter into a JSON serializable value that identifies it."""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    elif isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    elif isinstance(value, (list, tuple)):
+        return [_canonical(i, memo) for i in value]
+    elif isinstance(value, (set, frozenset)):
+        return sorted(_canonical(i, memo) for i in value)
+    elif isinstance(value, dict):
+        return {str(k): _canonical(v, memo) for k, v in value.items()}
+    elif isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        digest = hashlib.sha256(pd.util.hash_pandas_object(value, index=not isinstance(value, pd.Index)).values.tobytes())
+        digest.update(json.dumps([str(i) for i in getattr(value, "columns", [])] + [str(value.dtypes)]).encode())
+        return {"frame": digest.hexdigest()}
+    elif isinstance(value, np.ndarray):
+        return {"array": hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest(), "dtype": str(value.dtype),
+                "shape": list(value.shape)}
+    elif isinstance(value, Path):
+        return str(value)
+    elif hasattr(value, "_memo_key"): #CanDI objects identify themselves
+        return {type(value).__name__: _canonical(value._memo_key(), memo)}
+
+    #a repr can hold an id or be truncated, it would never hit or serve the result of another call
+    raise TypeError("{} parameters can not be part of a memo key, pass a dataset name, "
+                    "a DataFrame or an array instead".format(type(value).__name__))
+
+
+memo = Memo()
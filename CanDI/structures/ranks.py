@@ -0,0 +1,208 @@
+"""Sorted-value index of the gene by cell line datasets.
+Every gene's values across lines and every line's values across genes are sorted once per load.
+Counts of lines past a threshold are then binary searches, quantiles are lookups and the top k
+genes or lines of any number of entities are read off the sort orders in one vectorized call.
+The index holds the sorted values and both sort orders, about twice the size of the dataset,
+and is dropped when the dataset is loaded or unloaded.
+"""
+import threading
+import numpy as np
+import pandas as pd
+
+from .cache import slice_cache
+
+
+DIRECTIONS = ["under", "over"] #smallest values first (eg. most essential), largest values first
+
+_indexes = {} #dataset: (token, SortedIndex)
+_lock = threading.Lock()
+
+
+class SortedIndex(object):
+    """Sort orders of a gene by cell line DataFrame. Missing values sort last and are never counted.
+
+    Args:
+        df: pandas.core.frame.DataFrame
+    """
+    def __init__(self, df):
+
+        values = df.to_numpy(dtype=np.float64)
+        self.genes = df.index
+        self.lines = df.columns
+        self.gene_order = np.argsort(values, axis=1, kind="stable").astype(np.int32) #lines of each gene by value
+        self.gene_sorted = np.take_along_axis(values, self.gene_order, axis=1)
+        self.gene_n = (~np.isnan(values)).sum(axis=1)
+        self.line_order = np.argsort(values, axis=0, kind="stable").T.astype(np.int32) #genes of each line by value
+        self.line_n = (~np.isnan(values)).sum(axis=0)
+        self._values = values
+        self._groups = {}
+
+    def count(self, threshold, direction="under"):
+        """Returns the number of lines below (under) or above (over) a threshold for every gene.
+
+        Args:
+            threshold: float or array-like
+                one threshold, or one per gene
+            direction: str, optional
+                "under" or "over"
+        Returns:
+            pandas.core.series.Series
+                indexed by gene
+        """
+        under = _direction(direction) == "under"
+        below = _search_rows(self.gene_sorted, self.gene_n, threshold, "left" if under else "right")
+        counts = below if under else self.gene_n - below
+        return pd.Series(counts, index=self.genes, name="count")
+
+    def sweep(self, thresholds, direction="under"):
+        """Returns the counts of lines past each of several thresholds, genes by thresholds."""
+        return pd.concat({t: self.count(t, direction) for t in thresholds}, axis=1)
+
+    def quantile(self, q, by=None):
+        """Returns quantiles of every gene across lines, linearly interpolated like numpy.nanquantile.
+
+        Args:
+            q: float or list
+            by: pandas.core.series.Series, optional
+                group label of every line (eg. data.cell_lines.lineage), quantiles are then computed per group
+        Returns:
+            pandas.core.frame.DataFrame
+                genes by quantiles, or genes by (group, quantile) if by is given
+        """
+        qs = [q] if np.isscalar(q) else list(q)
+        if by is None:
+            return pd.DataFrame({i: _interpolate(self.gene_sorted, self.gene_n, i) for i in qs}, index=self.genes)
+
+        out = {}
+        for group, (sorted_values, n) in self._group_sorts(by).items():
+            for i in qs:
+                out[(group, i)] = _interpolate(sorted_values, n, i)
+        return pd.DataFrame(out, index=self.genes)
+
+    def top(self, k=10, genes=None, lines=None, direction="under"):
+        """Returns the k most extreme lines of each gene, or the k most extreme genes of each line.
+
+        Args:
+            k: int, optional
+            genes: list, optional
+                rank the lines of these genes
+            lines: list, optional
+                rank the genes of these lines, used if genes is None
+            direction: str, optional
+                "under" ranks the smallest values first, "over" the largest
+        Returns:
+            pandas.core.frame.DataFrame
+                indexed by (gene or DepMap_ID, rank) with the ranked label and its value
+        """
+        if genes is not None:
+            items, positions = _present(self.genes, genes)
+            orders, n, labels = self.gene_order[positions], self.gene_n[positions], self.lines
+            names = ["gene", "rank", "DepMap_ID"]
+            values = lambda rows, cols: self._values[positions[rows], cols]
+        else:
+            items, positions = _present(self.lines, lines)
+            orders, n, labels = self.line_order[positions], self.line_n[positions], self.genes
+            names = ["DepMap_ID", "rank", "gene"]
+            values = lambda rows, cols: self._values[cols, positions[rows]]
+
+        ranks = np.arange(k)
+        if _direction(direction) == "under":
+            slots = np.broadcast_to(ranks, (len(n), k))
+        else:
+            slots = n[:, None] - 1 - ranks[None, :]
+
+        rows, cols = np.nonzero(ranks[None, :] < n[:, None]) #missing values are never ranked
+        picked = orders[rows, slots[rows, cols]]
+        index = pd.MultiIndex.from_arrays([items[rows], cols + 1], names=names[:2])
+        return pd.DataFrame({names[2]: labels[picked], "value": values(rows, picked)}, index=index)
+
+    def _group_sorts(self, by):
+        """Sorted values and counts of every gene within each group of lines, the last grouping is cached."""
+        key = (by.name, id(by))
+        if key not in self._groups:
+            labels = by.reindex(self.lines)
+            groups = {}
+            for group in sorted(labels.dropna().unique()):
+                sub = np.sort(self._values[:, np.flatnonzero((labels == group).to_numpy())], axis=1)
+                groups[group] = (sub, (~np.isnan(sub)).sum(axis=1))
+            self._groups = {key: groups}
+        return self._groups[key]
+
+
+def sorted_index(dataset):
+    """Returns the sorted-value index of a loaded dataset, built once per load.
+
+    Args:
+        dataset: str or pandas.core.frame.DataFrame
+    Returns:
+        SortedIndex
+    """
+    if isinstance(dataset, pd.DataFrame):
+        return SortedIndex(dataset)
+
+    from ..candi import data
+
+    df = getattr(data, dataset, None)
+    if not isinstance(df, pd.DataFrame):
+        raise ValueError("{} must be loaded to be indexed".format(dataset))
+
+    token = (slice_cache.generation(dataset), id(df))
+    with _lock:
+        cached = _indexes.get(dataset)
+        if cached is None or cached[0] != token:
+            cached = _indexes[dataset] = (token, SortedIndex(df))
+        return cached[1]
+
+
+def _forget(dataset):
+    """Drops the index of a dataset, or every index, when its slices are invalidated."""
+    with _lock:
+        for key in [k for k in _indexes if dataset is None or k == dataset]:
+            del _indexes[key]
+
+
+slice_cache.subscribe(_forget)
+
+
+def _direction(direction):
+
+    if direction not in DIRECTIONS:
+        raise ValueError("direction must be one of {}".format(DIRECTIONS))
+    return direction
+
+
+def _search_rows(sorted_values, n, threshold, side):
+    """Row wise searchsorted over the first n[i] values of every row, a binary search for all rows at once."""
+    threshold = np.broadcast_to(np.asarray(threshold, dtype=np.float64), n.shape)
+    lo = np.zeros(len(n), dtype=np.int64)
+    hi = n.astype(np.int64)
+    rows = np.arange(len(n))
+
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        value = sorted_values[rows, np.minimum(mid, sorted_values.shape[1] - 1)]
+        right = (value < threshold) if side == "left" else (value <= threshold)
+        lo = np.where(active & right, mid + 1, lo)
+        hi = np.where(active & ~right, mid, hi)
+
+
+def _interpolate(sorted_values, n, q):
+    """Quantile q of the first n[i] values of every sorted row."""
+    position = (n - 1) * q
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, np.maximum(n - 1, 0))
+    rows = np.arange(len(n))
+    low = sorted_values[rows, np.maximum(below, 0)]
+    high = sorted_values[rows, np.maximum(above, 0)]
+    out = low + (high - low) * (position - below)
+    return np.where(n > 0, out, np.nan)
+
+
+def _present(index, keys):
+
+    keys = pd.Index([keys] if isinstance(keys, str) else list(keys))
+    positions = index.get_indexer(keys)
+    return keys[positions >= 0], positions[positions >= 0]
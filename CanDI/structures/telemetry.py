@@ -0,0 +1,305 @@
+"""Low overhead instrumentation of CanDI's hot paths.
+Instrumented functions record call counts, wall time, the rows and columns they touched
+and the bytes of the data they returned. Recording is off by default, a disabled
+instrumented call costs one attribute lookup.
+
+    from CanDI import candi
+    with candi.profile() as prof:
+        candi.Cancer("Lung Cancer").essential()
+    prof.stats()
+"""
+import os
+import json
+import time
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+import numpy as np
+
+
+class _State(object):
+
+    enabled = False #read by every instrumented call, keep it a plain attribute
+    memory = False #any collector records allocations
+    tracing = False #tracemalloc was started by telemetry and is stopped with the last memory collector
+    collectors = []
+
+
+_state = _State()
+_lock = threading.Lock()
+_local = threading.local() #peaks of the instrumented calls running in a thread, innermost last
+
+
+class Collector(object):
+    """Collector aggregates the records of instrumented calls.
+    One collector backs :func:`stats`, :func:`profile` adds a scoped one.
+    """
+    COLUMNS = ["calls", "wall_s", "max_s", "rows", "columns", "bytes", "allocated"]
+
+    def __init__(self, trace=False, memory=False):
+
+        self.trace = trace
+        self.memory = memory
+        self.records = {}
+        self.events = []
+        self._origin = time.perf_counter()
+
+    def add(self, key, start, elapsed, rows, cols, nbytes, allocated):
+
+        rec = self.records.get(key)
+        if rec is None:
+            rec = self.records[key] = dict.fromkeys(self.COLUMNS, 0)
+
+        rec["calls"] += 1
+        rec["wall_s"] += elapsed
+        rec["max_s"] = max(rec["max_s"], elapsed)
+        rec["rows"] += rows
+        rec["columns"] += cols
+        rec["bytes"] += nbytes
+        rec["allocated"] += allocated
+
+        if self.trace:
+            self.events.append({"name": key[0], "cat": "candi", "ph": "X",
+                                "ts": (start - self._origin) * 1e6, "dur": elapsed * 1e6,
+                                "pid": os.getpid(), "tid": threading.get_ident(),
+                                "args": {"dataset": key[1], "rows": rows, "columns": cols, "bytes": nbytes}})
+
+    def stats(self):
+        """Returns the aggregated records.
+
+        Returns:
+            pandas.core.frame.DataFrame
+                indexed by (function, dataset) with calls, total and max wall time in seconds,
+                rows and columns touched, bytes returned and the sum of each call's peak allocation above the
+                memory in use when it started (only when memory tracing is on)
+        """
+        with _lock:
+            records = {k: dict(v) for k, v in self.records.items()}
+
+        index = pd.MultiIndex.from_tuples(list(records), names=["function", "dataset"])
+        df = pd.DataFrame(list(records.values()), index=index, columns=self.COLUMNS)
+        df.insert(2, "mean_s", df.wall_s / df.calls)
+
+        return df.sort_values("wall_s", ascending=False)
+
+    def reset(self):
+
+        with _lock:
+            self.records = {}
+            self.events = []
+
+    def to_chrome_trace(self, path):
+        """Writes the recorded calls in Chrome trace format, viewable in chrome://tracing or Perfetto.
+        Requires the collector to be created with trace=True.
+        """
+        with _lock:
+            events = list(self.events)
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        return path
+
+    def to_openmetrics(self):
+        """Returns the aggregated records in OpenMetrics text format."""
+        with _lock:
+            records = {k: dict(v) for k, v in self.records.items()}
+
+        families = [("candi_calls", "counter", "calls", "Number of calls."),
+                    ("candi_wall_seconds", "counter", "wall_s", "Total wall time of calls."),
+                    ("candi_rows", "counter", "rows", "Rows touched by calls."),
+                    ("candi_columns", "counter", "columns", "Columns touched by calls."),
+                    ("candi_bytes", "counter", "bytes", "Bytes of data returned by calls."),
+                    ("candi_allocated_bytes", "counter", "allocated", "Peak bytes allocated during calls.")]
+
+        lines = []
+        for name, kind, field, doc in families:
+            lines.append("# TYPE {0} {1}".format(name, kind))
+            lines.append("# HELP {0} {1}".format(name, doc))
+            for (function, dataset), rec in records.items():
+                lines.append('{0}_total{{function="{1}",dataset="{2}"}} {3}'.format(name, _escape(function),
+                                                                                    _escape(dataset), rec[field]))
+        lines.append("# EOF")
+
+        return "\n".join(lines) + "\n"
+
+
+_global = Collector()
+
+
+def instrument(name, label=None, measure=None):
+    """Decorator recording calls of a function while telemetry is enabled.
+
+    Args:
+        name: str
+            name the calls are recorded under
+        label: callable, optional
+            label(args) returns the dataset the call is about, eg. the key passed to Data.load
+        measure: callable, optional
+            measure(args, result) returns the object whose rows, columns and bytes are recorded.
+            Defaults to the result.
+    """
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+
+            memory = _state.memory
+            if memory:
+                before = _peak_start()
+
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                allocated = _peak_end(before) if memory else 0
+            elapsed = time.perf_counter() - start
+
+            rows, cols, nbytes = _size(measure(args, result) if measure else result)
+            key = (name, str(label(args)) if label else "")
+
+            with _lock:
+                for collector in _state.collectors:
+                    collector.add(key, start, elapsed, rows, cols, nbytes, allocated)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _peak_start():
+    """Starts measuring the peak allocation of a call, returns the memory in use.
+    The peak of tracemalloc is reset for every call, the peak reached so far is handed to the enclosing call.
+    """
+    peaks = _local.__dict__.setdefault("peaks", [])
+    current, peak = tracemalloc.get_traced_memory()
+    if peaks:
+        peaks[-1] = max(peaks[-1], peak)
+    tracemalloc.reset_peak()
+    peaks.append(current)
+    return current
+
+
+def _peak_end(before):
+    """Returns the peak bytes allocated above before since the matching _peak_start."""
+    peaks = _local.peaks
+    peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+    if peaks:
+        peaks[-1] = max(peaks[-1], peak)
+    return max(peak - before, 0)
+
+
+def _escape(value):
+    """Escapes an OpenMetrics label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _size(obj):
+    """rows, columns and bytes of a returned object."""
+    if isinstance(obj, pd.DataFrame):
+        return obj.shape[0], obj.shape[1], int(obj.memory_usage(index=False, deep=False).sum())
+    elif isinstance(obj, pd.Series):
+        return obj.shape[0], 1, int(obj.memory_usage(index=False, deep=False))
+    elif isinstance(obj, np.ndarray):
+        shape = obj.shape + (1, 1)
+        return shape[0], shape[1], obj.nbytes
+    elif isinstance(obj, (list, dict, set, tuple)):
+        return len(obj), 1, 0
+    elif obj is None:
+        return 0, 0, 0
+
+    return 1, 1, 0
+
+
+def _refresh():
+
+    _state.enabled = bool(_state.collectors)
+    _state.memory = any(i.memory for i in _state.collectors)
+    if _state.memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _state.tracing = True
+    elif not _state.memory and _state.tracing: #tracing started by the user is left on
+        tracemalloc.stop()
+        _state.tracing = False
+
+
+def enable(memory=False, trace=False):
+    """Starts recording instrumented calls into the global collector read by :func:`stats`.
+
+    Args:
+        memory: bool, optional
+            also record the peak bytes allocated during calls with tracemalloc, which slows calls down noticeably
+        trace: bool, optional
+            keep every call for :func:`to_chrome_trace`
+    """
+    with _lock:
+        _global.trace = trace
+        _global.memory = memory
+        if _global not in _state.collectors:
+            _state.collectors.append(_global)
+        _refresh()
+
+
+def disable():
+    """Stops recording into the global collector. Recorded stats are kept until :func:`reset`.
+    Memory tracing stays on while a :func:`profile` recording allocations is open.
+    """
+    with _lock:
+        if _global in _state.collectors:
+            _state.collectors.remove(_global)
+        _refresh()
+
+
+def reset():
+    """Clears the global collector."""
+    _global.reset()
+
+
+def stats():
+    """Returns the stats recorded since telemetry was enabled, see :meth:`Collector.stats`."""
+    return _global.stats()
+
+
+def to_chrome_trace(path):
+    """Writes the calls recorded by the global collector in Chrome trace format."""
+    return _global.to_chrome_trace(path)
+
+
+def to_openmetrics():
+    """Returns the global stats in OpenMetrics text format."""
+    return _global.to_openmetrics()
+
+
+@contextmanager
+def profile(memory=False, trace=False):
+    """Context manager recording only the instrumented calls made inside it.
+
+    Args:
+        memory: bool, optional
+            also record the peak bytes allocated during calls with tracemalloc
+        trace: bool, optional
+            keep every call for Collector.to_chrome_trace
+    Returns:
+        Collector
+    """
+    collector = Collector(trace=trace, memory=memory)
+
+    with _lock:
+        _state.collectors.append(collector)
+        _refresh()
+    try:
+        yield collector
+    finally:
+        with _lock:
+            _state.collectors.remove(collector)
+            _refresh()
+
+
+if os.environ.get("CANDI_TELEMETRY"):
+    enable(trace=os.environ["CANDI_TELEMETRY"] == "trace")
@@ -0,0 +1,257 @@
+"""
+Benchmarks CanDI on a synthetic DepMap release.
+
+Import, Data.load, entity construction, every Entity query, the interval queries and the pipelines are timed
+and memory profiled, results are written as JSON so runs can be compared for regressions.
+
+    python benchmarks/run.py --scale 1 --out results.json
+    python benchmarks/run.py --scale 1 --out new.json --compare results.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import tempfile
+import traceback
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from CanDI.setup import synthetic
+
+
+QUERIES = ["expressed", "unexpressed", "essential", "non_essential", "dependent", "non_dependent",
+           "duplication", "deletion", "cn_normal", "mutated"]
+
+LOOKUPS = {"expression_of": "expression", "effect_of": "gene_effect", "dependency_of": "gene_dependency"}
+
+
+class Runner(object):
+    def __init__(self, repeat=3, memory=True, only=None):
+        """Times and memory profiles benchmarks.
+
+        Args:
+            repeat (int, optional): Number of timed runs of every benchmark.
+            memory (bool, optional): Make one extra run under tracemalloc to record peak memory.
+            only (str, optional): Only run benchmarks whose name contains this string.
+        """
+        self.repeat = repeat
+        self.memory = memory
+        self.only = only
+        self.results = []
+
+    def __call__(self, name, func, setup=None, group=None):
+        """Runs func(*setup()) repeat times, setup is not timed."""
+        if self.only and self.only not in name:
+            return
+
+        result = {"name": name, "group": group or name.split(".")[0], "times": [], "peak_bytes": None, "error": None}
+        try:
+            for _ in range(self.repeat):
+                args = setup() if setup else ()
+                start = time.perf_counter()
+                func(*args)
+                result["times"].append(time.perf_counter() - start)
+
+            if self.memory:
+                args = setup() if setup else ()
+                tracemalloc.start()
+                func(*args)
+                result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+        except Exception as e:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            result["error"] = "".join(traceback.format_exception_only(type(e), e)).strip()
+
+        if result["times"]:
+            result["min_s"] = min(result["times"])
+            result["median_s"] = statistics.median(result["times"])
+
+        self.results.append(result)
+        status = "{:.4f}s".format(result["median_s"]) if "median_s" in result else "-"
+        print(f"{name:<45} {status:>10}  {result['error'] or ''}", flush=True)
+
+    def add(self, result):
+        self.results.append(result)
+        print(f"{result['name']:<45} {result['median_s']:>9.4f}s", flush=True)
+
+
+def bench_import(runner, config_path):
+    """Imports CanDI in fresh interpreters, which includes loading the index tables."""
+    code = ("import time, resource; start = time.perf_counter(); import CanDI.candi; "
+            "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)")
+    env = dict(os.environ, CANDI_CONFIG=config_path)
+    env["PYTHONPATH"] = os.pathsep.join([str(Path(__file__).resolve().parent.parent), env.get("PYTHONPATH", "")])
+
+    times, peaks = [], []
+    for _ in range(runner.repeat):
+        out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        elapsed, maxrss = out.stdout.split()
+        times.append(float(elapsed))
+        peaks.append(int(maxrss) * (1 if sys.platform == "darwin" else 1024))
+
+    runner.add({"name": "import", "group": "import", "times": times, "min_s": min(times),
+                "median_s": statistics.median(times), "peak_bytes": max(peaks), "error": None})
+
+
+def bench_load(runner, data, datasets):
+
+    def reload(key):
+        if not isinstance(getattr(data, key), Path):
+            data.unload(key)
+        data.load(key)
+
+    for key in datasets:
+        runner(f"Data.load.{key}", reload, setup=lambda key=key: (key,))
+        if not isinstance(getattr(data, key), Path):
+            continue
+        data.load(key) #the queries below need every dataset in memory
+
+
+def bench_entities(runner, candi, data):
+
+    genes = list(data.genes.index[:50])
+    lines = list(data.cell_lines.index[:20])
+    disease = data.cell_lines.primary_disease.value_counts().index[0]
+    location = data.locations.location.iloc[0]
+
+    makers = {"Gene": lambda: candi.Gene(genes[0]),
+              "CellLine": lambda: candi.CellLine(lines[0]),
+              "Cancer": lambda: candi.Cancer(disease),
+              "Organelle": lambda: candi.Organelle(location, min_conf=1),
+              "GeneCluster": lambda: candi.GeneCluster(genes),
+              "CellLineCluster": lambda: candi.CellLineCluster(lines)}
+
+    for name, make in makers.items():
+        runner(f"{name}.__init__", make, group="entity")
+
+    items = {"Gene": lines, "CellLine": genes, "Cancer": genes, "Organelle": lines,
+             "GeneCluster": lines, "CellLineCluster": genes}
+
+    for name, make in makers.items():
+        for method in QUERIES:
+            runner(f"{name}.{method}", lambda e, m=method: getattr(e, m)(), setup=lambda make=make: (make(),),
+                   group="query")
+        for method in LOOKUPS:
+            runner(f"{name}.{method}", lambda e, m=method, i=items[name]: getattr(e, m)(i),
+                   setup=lambda make=make: (make(),), group="query")
+
+    runner("Cancer.mutation_matrix", lambda e: e.mutation_matrix(genes), setup=lambda: (makers["Cancer"](),),
+           group="query")
+
+
+def bench_intervals(runner, data):
+
+    from CanDI.structures import intervals
+
+    chromosome, start, end = data.genes[["chromosome", "start", "end"]].iloc[0]
+    region = (chromosome, int(start), int(start) + 10**7)
+    lines = list(data.cell_lines.index[:20])
+
+    runner("intervals.gene_index", lambda: intervals.gene_index(), group="intervals")
+    runner("intervals.genes_in", lambda: intervals.genes_in(region), group="intervals")
+    runner("intervals.variants_in", lambda: intervals.variants_in(region), group="intervals")
+    runner("intervals.nearest_variants", lambda: intervals.nearest_variants((chromosome, int(start)), k=10),
+           group="intervals")
+    runner("intervals.copy_number_in", lambda: intervals.copy_number_in(region, lines), group="intervals")
+
+
+def bench_pipelines(runner, data, deseq=False):
+
+    from CanDI.pipelines import differential, association, diffexp
+
+    counts = data.cell_lines.primary_disease.value_counts()
+    first, second = counts.index[:2]
+    group1 = list(data.cell_lines.index[data.cell_lines.primary_disease == first])
+    group2 = list(data.cell_lines.index[data.cell_lines.primary_disease == second])
+
+    runner("pipelines.differential", lambda: differential.differential(group1, group2, "gene_effect"))
+    runner("pipelines.lineage_scan", lambda: differential.lineage_scan("gene_effect"))
+    runner("pipelines.mutation_scan", lambda: association.mutation_scan("gene_effect", min_mutants=5))
+    runner("pipelines.pseudobulk", lambda: diffexp.pseudobulk("primary_disease"))
+
+    if deseq:
+        runner("pipelines.run_deseq_contrasts",
+               lambda: diffexp.run_deseq_contrasts({first: group1, second: group2}, n_jobs=1, n_cpus=1))
+
+
+def compare(results, baseline, tolerance):
+    """Returns the benchmarks whose median time grew by more than tolerance relative to the baseline."""
+    before = {i["name"]: i for i in baseline["results"] if i.get("median_s")}
+    regressions = []
+    for result in results:
+        old = before.get(result["name"])
+        if old and result.get("median_s") and result["median_s"] > old["median_s"] * (1 + tolerance):
+            regressions.append((result["name"], old["median_s"], result["median_s"]))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CanDI on a synthetic DepMap release")
+    parser.add_argument("--scale", type=float, default=0.1, help="Multiple of the cell lines of a DepMap release")
+    parser.add_argument("--genes", type=int, default=None, help="Number of genes, defaults to a full release")
+    parser.add_argument("--lines", type=int, default=None, help="Number of cell lines, overrides --scale")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="File format of the release")
+    parser.add_argument("--data", default=None, help="Directory of the synthetic release, reused if it exists")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc runs")
+    parser.add_argument("--deseq", action="store_true", help="Also benchmark the DESeq2 pipeline")
+    parser.add_argument("--only", default=None, help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON file the results are written to")
+    parser.add_argument("--compare", default=None, help="Baseline results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slow down relative to the baseline")
+    args = parser.parse_args()
+
+    root = args.data or tempfile.mkdtemp(prefix="candi_bench_")
+    config_path = os.path.join(root, "data", "config.ini")
+    n_genes, n_lines = synthetic.release_shape(args.scale, args.genes, args.lines)
+
+    if not os.path.exists(config_path):
+        print(f"Writing a synthetic release of {n_genes} genes and {n_lines} cell lines to {root}")
+        start = time.perf_counter()
+        synthetic.make_release(root, n_genes=n_genes, n_lines=n_lines, file_format=args.format)
+        print(f"Done in {time.perf_counter() - start:.1f}s")
+
+    runner = Runner(repeat=args.repeat, memory=not args.no_memory, only=args.only)
+    if not args.only or args.only in "import":
+        bench_import(runner, config_path)
+
+    os.environ["CANDI_CONFIG"] = config_path
+    from CanDI import candi
+
+    bench_load(runner, candi.data, list(candi.data.depmap_files))
+    bench_entities(runner, candi, candi.data)
+    bench_intervals(runner, candi.data)
+    bench_pipelines(runner, candi.data, args.deseq)
+
+    meta = {"scale": args.scale, "n_genes": n_genes, "n_lines": n_lines, "format": args.format,
+            "repeat": args.repeat, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "packages": {i: __import__(i).__version__ for i in ["numpy", "pandas"]},
+            "commit": subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                     cwd=Path(__file__).resolve().parent).stdout.strip() or None}
+
+    with open(args.out, "w") as f:
+        json.dump({"meta": meta, "results": runner.results}, f, indent=1)
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(runner.results, json.load(f), args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.4f}s -> {new:.4f}s")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
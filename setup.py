@@ -19,16 +19,23 @@ setup(
     python_requires='>=3.11,<4.0',
     install_requires=[
         "pandas",
+        "numpy",
+        "scipy",
+        "pyarrow",
         "configparser",
         "requests",
         "tqdm",
     ],
+    extras_require={
+        "anndata": ["anndata", "h5py", "zarr"], #Data.to_anndata stores
+    },
     url = 'https://github.com/GilbertLabUCSF/CanDI',
     
     entry_points={
         'console_scripts': [
             'candi-install = CanDI.setup.install:main',
             'candi-uninstall = CanDI.setup.uninstall:main',
+            'candi-serve = CanDI.server.server:main',
         ],
     },
     
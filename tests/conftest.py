@@ -0,0 +1,52 @@
+import os
+import atexit
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+
+
+def make_install(root, n_genes=30, n_lines=12):
+    """Writes a tiny CanDI install (config, index tables and one read count matrix) under root."""
+    rng = np.random.default_rng(0)
+    genes = ["GENE{}".format(i) for i in range(n_genes)]
+    lines = ["ACH-{:06d}".format(i) for i in range(n_lines)]
+
+    for d in ["data/depmap", "data/genes", "data/locations"]:
+        os.makedirs(os.path.join(root, d))
+
+    pd.DataFrame({"DepMap_ID": lines,
+                  "primary_disease": ["Lung Cancer", "Breast Cancer"] * (n_lines // 2),
+                  "lineage_subtype": ["NSCLC", "TNBC", "SCLC", "ER+"] * (n_lines // 4),
+                  "sex": ["Male", "Female", "Female"] * (n_lines // 3)}
+                 ).to_csv(os.path.join(root, "data/depmap/sample_info.csv"), sep="\t", index=False)
+    pd.DataFrame({"Approved symbol": genes, "Approved name": genes, "ENTREZ ID": range(n_genes),
+                  "Ensembl ID": genes}).to_csv(os.path.join(root, "data/genes/gene_info.csv"), index=False)
+    pd.DataFrame({"gene": genes, "location": "Nucleus", "confidence": 3.0}
+                 ).to_csv(os.path.join(root, "data/locations/merged_locations.csv"), index=False)
+
+    reads = pd.DataFrame(rng.integers(0, 1000, size=(n_genes, n_lines)), index=pd.Index(genes, name="gene"),
+                         columns=lines)
+    reads.to_csv(os.path.join(root, "data/depmap/CCLE_RNAseq_reads.csv"))
+
+    with open(os.path.join(root, "data/config.ini"), "w") as f:
+        f.write("[depmap_urls]\n\n"
+                "[index]\nrnaseq_reads = gene\n\n"
+                "[autoload_info]\ncell_lines = data/depmap/sample_info.csv\n"
+                "genes = data/genes/gene_info.csv\nlocations = data/locations/merged_locations.csv\n\n"
+                "[data_paths]\ndepmap = data/depmap/\n\n"
+                "[depmap_files]\nrnaseq_reads = CCLE_RNAseq_reads.csv\n")
+
+    return reads
+
+
+#memoized results of the tests are kept out of the user's store
+os.environ["CANDI_MEMO"] = "1"
+os.environ["CANDI_MEMO_DIR"] = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, os.environ["CANDI_MEMO_DIR"], True)
+
+#CanDI.candi instantiates a global Data object on import, point it at a tiny install
+_root = tempfile.mkdtemp()
+make_install(_root)
+os.environ["CANDI_CONFIG"] = os.path.join(_root, "data/config.ini")
+atexit.register(shutil.rmtree, _root, True)
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import unittest
+import pandas as pd
+from CanDI import candi
+from CanDI.structures import aio
+
+
+class testAsync(unittest.TestCase):
+
+    def tearDown(self):
+
+        if isinstance(candi.data.rnaseq_reads, pd.DataFrame):
+            candi.data.unload("rnaseq_reads")
+        candi.data.expression = None
+
+    def test_aload(self):
+
+        async def load():
+            return await asyncio.gather(*[candi.data.aload("rnaseq_reads") for _ in range(4)])
+
+        before = candi.slice_cache.stats()["invalidations"]
+        frames = asyncio.run(load())
+
+        #one read shared by every caller
+        self.assertEqual(candi.slice_cache.stats()["invalidations"] - before, 1)
+        self.assertTrue(all(i is candi.data.rnaseq_reads for i in frames))
+        self.assertIs(asyncio.run(candi.data.aload("rnaseq_reads")), frames[0])
+
+    def test_queries(self):
+
+        candi.data.expression = candi.data.load("rnaseq_reads") / 500
+        gene = candi.Gene("GENE3")
+
+        async def query():
+            return await gene.aexpressed(style="values", threshold=0.5), await gene.aexpression_of(["ACH-000001"])
+
+        values, expression = asyncio.run(query())
+        pd.testing.assert_series_equal(values, gene.expressed(style="values", threshold=0.5))
+        pd.testing.assert_series_equal(expression, gene.expression_of(["ACH-000001"]))
+
+    def test_cancel(self):
+
+        release = threading.Event()
+        calls = []
+
+        def work():
+            release.wait(5)
+            calls.append(1)
+            return "done"
+
+        async def waiters():
+            first = asyncio.ensure_future(aio.coalesce("work", work))
+            second = asyncio.ensure_future(aio.coalesce("work", work))
+            await asyncio.sleep(0.05)
+            first.cancel() #the other waiter keeps the call alive
+            release.set()
+            return await second, first
+
+        result, first = asyncio.run(waiters())
+        self.assertEqual(result, "done")
+        self.assertTrue(first.cancelled())
+        self.assertEqual(calls, [1])
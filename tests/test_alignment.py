@@ -0,0 +1,73 @@
+import gc
+import weakref
+import unittest
+import numpy as np
+import pandas as pd
+from CanDI import candi
+from CanDI.structures import alignment
+
+
+class testAlignment(unittest.TestCase):
+
+    def setUp(self):
+
+        self.reads = candi.data.load("rnaseq_reads")
+        #expression covers fewer genes and lines, in another order
+        candi.data.expression = (self.reads / 500).iloc[5:, 2:].iloc[::-1]
+        candi.data.mutations = pd.DataFrame({"gene": ["GENE7", "GENE7", "GENE8"],
+                                             "DepMap_ID": ["ACH-000003", "ACH-000004", "ACH-000003"],
+                                             "Variant_Classification": ["Missense_Mutation", "Silent", "Nonsense_Mutation"]})
+
+    def tearDown(self):
+
+        candi.data.unload("rnaseq_reads")
+        candi.data.expression = None
+        candi.data.mutations = None
+
+    def test_maps(self):
+
+        aligned = alignment.alignment()
+        self.assertIs(alignment.alignment(), aligned)
+
+        pair = aligned.pair("rnaseq_reads", "expression")
+        genes, lines = pair["genes"], pair["lines"]
+        np.testing.assert_array_equal(self.reads.index[genes[0]], candi.data.expression.index[genes[1]])
+        np.testing.assert_array_equal(self.reads.columns[lines[0]], candi.data.expression.columns[lines[1]])
+        self.assertEqual((len(genes[0]), len(lines[0])), (25, 10))
+
+        #reloading a dataset rebuilds the maps
+        candi.data.unload("rnaseq_reads")
+        candi.data.load("rnaseq_reads")
+        self.assertIsNot(alignment.alignment(), aligned)
+
+    def test_memory_is_released(self):
+
+        aligned = alignment.alignment()
+        expression = weakref.ref(candi.data.expression)
+        candi.data.expression = None
+        gc.collect()
+        self.assertIsNone(expression()) #alignments hold the maps, not the datasets
+
+        candi.data.unload("rnaseq_reads")
+        self.assertFalse(alignment._alignments)
+        with self.assertRaises(RuntimeError):
+            aligned.gather("rnaseq_reads")
+        candi.data.load("rnaseq_reads")
+
+    def test_profiles(self):
+
+        gene = candi.Gene("GENE7").profile()
+        self.assertEqual(list(gene.columns), ["expression", "reads", "mutated"])
+        pd.testing.assert_series_equal(gene.reads, self.reads.loc["GENE7"].astype(float), check_names=False)
+        self.assertTrue(np.isnan(gene.expression.loc["ACH-000000"]))
+        self.assertAlmostEqual(gene.expression.loc["ACH-000005"], self.reads.loc["GENE7", "ACH-000005"] / 500)
+        self.assertEqual(list(gene.index[gene.mutated]), ["ACH-000003"])
+
+        line = candi.data.cell_lines.index[3]
+        table = alignment.profile(lines=[line])
+        self.assertEqual(list(table.index[table.mutated].get_level_values("gene")), ["GENE7", "GENE8"])
+        pd.testing.assert_series_equal(table.reads.droplevel("DepMap_ID"), self.reads[line].sort_index().astype(float),
+                                       check_names=False, check_index_type=False)
+
+        cohort = alignment.profile(genes=["GENE1", "GENE9"], lines=list(self.reads.columns[:4]))
+        self.assertEqual(cohort.shape, (8, 3))
@@ -0,0 +1,38 @@
+import unittest
+import pandas as pd
+import numpy as np
+from CanDI.pipelines import association, differential
+
+
+class testAssociation(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(1)
+        self.lines = ["ACH-{:06d}".format(i) for i in range(80)]
+        self.matrix = pd.DataFrame(rng.normal(size=(100, 80)),
+                                   index=["gene_{}".format(i) for i in range(100)],
+                                   columns=self.lines)
+        self.mutants = list(rng.choice(self.lines, 20, replace=False))
+        rare = list(rng.choice(self.lines, 2, replace=False))
+        self.mutations = pd.DataFrame({"gene": ["KRAS"] * 20 + ["RARE"] * 2 + ["KRAS"],
+                                       "DepMap_ID": self.mutants + rare + [self.mutants[0]],
+                                       "Variant_Classification": ["Missense_Mutation"] * 22 + ["Silent"]})
+        self.matrix.loc["gene_5", self.mutants] -= 2
+
+    def test_design(self):
+
+        design, muts = association.mutation_design(self.lines, self.mutations, min_mutants=5)
+
+        self.assertEqual(list(muts), ["KRAS"])
+        self.assertEqual(design.sum(), 20)
+
+    def test_scan(self):
+
+        res = association.mutation_scan(self.matrix, self.mutations, max_fdr=1.0)
+        wildtype = [i for i in self.lines if i not in self.mutants]
+        single = differential.differential(self.mutants, wildtype, self.matrix)
+
+        self.assertEqual(res.loc[0, "gene"], "gene_5")
+        self.assertEqual(res.attrs["n_tests"], 100)
+        np.testing.assert_allclose(res.set_index("gene").loc[single.index, "fdr"], single.t_fdr)
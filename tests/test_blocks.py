@@ -0,0 +1,90 @@
+import unittest
+from pathlib import Path
+import pandas as pd
+from CanDI import candi
+
+
+class testBlocks(unittest.TestCase):
+
+    def setUp(self):
+
+        #the columns of sample_info read by CellLine and CellLineCluster
+        self.cell_lines = candi.data.cell_lines
+        candi.data.cell_lines = self.cell_lines.assign(lineage="lung", lineage_subtype="NSCLC", cell_line_name="",
+                                                       CCLE_Name="", source="", stripped_cell_line_name="",
+                                                       alias="", COSMICID=0, Sanger_Model_ID="", Subtype="")
+        self.lines = list(candi.data.cell_lines.index[:6])
+        self.cluster = candi.CellLineCluster(self.lines)
+
+    def tearDown(self):
+
+        candi.data.cell_lines = self.cell_lines
+
+        if not isinstance(candi.data.rnaseq_reads, Path):
+            candi.data.unload("rnaseq_reads")
+        for dataset in ["expression", "gene_effect", "gene_dependency", "gene_cn"]:
+            setattr(candi.data, dataset, None)
+
+    def test_file_blocks(self):
+
+        expected = candi.data.load("rnaseq_reads")[self.lines]
+        candi.data.unload("rnaseq_reads")
+
+        blocks = list(self.cluster.iter_blocks("rnaseq_reads", block_size=7))
+        self.assertEqual([len(i) for i in blocks], [7, 7, 7, 7, 2])
+        pd.testing.assert_frame_equal(pd.concat(blocks), expected, check_dtype=False)
+
+        blocks = list(self.cluster.iter_blocks("rnaseq_reads", block_size=4, axis=1))
+        self.assertEqual([i.shape[1] for i in blocks], [4, 2])
+        pd.testing.assert_frame_equal(pd.concat(blocks, axis=1), expected, check_dtype=False)
+
+    def test_memory_blocks(self):
+
+        reads = candi.data.load("rnaseq_reads")
+        gene = candi.Gene("GENE3")
+
+        blocks = list(self.cluster.iter_blocks("rnaseq_reads", block_size=7))
+        pd.testing.assert_frame_equal(pd.concat(blocks), reads[self.lines])
+        blocks = list(gene.iter_blocks("rnaseq_reads", block_size=5, axis=1))
+        pd.testing.assert_frame_equal(pd.concat(blocks, axis=1), reads.loc[["GENE3"]])
+
+        with self.assertRaises(ValueError):
+            next(self.cluster.iter_blocks("mutations"))
+
+    def test_stream_filters(self):
+
+        candi.data.expression = candi.data.load("rnaseq_reads") / 500
+
+        for method in ["expressed", "unexpressed"]:
+            query = getattr(self.cluster, method)
+            self.assertEqual(query(threshold=0.5, stream=True, block_size=7), query(threshold=0.5))
+            pd.testing.assert_frame_equal(query(style="values", threshold=0.5, stream=True, block_size=7),
+                                          query(style="values", threshold=0.5))
+
+    def test_stream_every_entity(self):
+
+        reads = candi.data.load("rnaseq_reads")
+        candi.data.expression = reads / 500
+        candi.data.gene_effect = -reads / 500
+        candi.data.gene_dependency = reads / 1000
+        candi.data.gene_cn = 0.85 + reads / 2500
+
+        entities = [candi.Gene("GENE3"), candi.CellLine("ACH-000002"), candi.Organelle("Nucleus"),
+                    candi.GeneCluster(["GENE1", "GENE4", "GENE9"]), candi.Cancer("Lung Cancer"), self.cluster]
+        methods = ["expressed", "unexpressed", "essential", "non_essential", "dependent", "non_dependent",
+                   "duplication", "deletion", "cn_normal"]
+
+        for entity in entities:
+            for method in methods:
+                query = getattr(entity, method)
+                with self.subTest(entity=type(entity).__name__, method=method):
+                    self.assertEqual(query(threshold=0.5, stream=True, block_size=7), query(threshold=0.5))
+                    streamed = query(style="values", threshold=0.5, stream=True, block_size=7)
+                    expected = query(style="values", threshold=0.5)
+                    if isinstance(expected, pd.Series):
+                        pd.testing.assert_series_equal(streamed, expected)
+                    else:
+                        pd.testing.assert_frame_equal(streamed, expected)
+
+        self.assertEqual(candi.Gene("GENE3").expressed(stream=True), candi.Gene("GENE3").expressed())
+        self.assertTrue(candi.Gene("GENE3").expressed(stream=True))
@@ -0,0 +1,102 @@
+import unittest
+import pandas as pd
+import numpy as np
+from CanDI import candi
+from CanDI.structures.cache import SliceCache, MISSING
+
+
+class testSliceCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.block = pd.Series(np.zeros(100)) #800 bytes of values plus the index
+        self.cache = SliceCache(max_bytes=3 * self.block.memory_usage(index=True))
+
+    def test_lru(self):
+
+        for i in range(3):
+            self.cache.put(("gene_effect", "gene", i), self.block, 0)
+        self.cache.get(("gene_effect", "gene", 0)) #0 becomes the most recently used
+        self.cache.put(("gene_effect", "gene", 3), self.block, 0)
+
+        self.assertIs(self.cache.get(("gene_effect", "gene", 1)), MISSING)
+        self.assertIs(self.cache.get(("gene_effect", "gene", 0)), self.block)
+        stats = self.cache.stats()
+        self.assertEqual((stats["entries"], stats["evictions"], stats["hits"], stats["misses"]), (3, 1, 2, 1))
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+
+    def test_invalidate(self):
+
+        self.cache.put(("gene_effect", "gene", "A"), self.block, 0)
+        self.cache.put(("expression", "gene", "A"), self.block, 0)
+        self.cache.invalidate("gene_effect")
+
+        self.assertIs(self.cache.get(("gene_effect", "gene", "A")), MISSING)
+        self.assertIs(self.cache.get(("expression", "gene", "A")), self.block)
+        #a slice computed before the reload is not cached
+        self.cache.put(("gene_effect", "gene", "A"), self.block, 0)
+        self.assertIs(self.cache.get(("gene_effect", "gene", "A")), MISSING)
+
+    def test_read_only_mixed_types(self):
+
+        mutations = pd.DataFrame({"gene": ["A", "B"], "position": [10, 20], "score": [0.5, 1.5]})
+        cached = self.cache.put(("mutations", "gene", "A"), mutations, 0)
+
+        self.assertIs(self.cache.get(("mutations", "gene", "A")), cached)
+        pd.testing.assert_frame_equal(cached, mutations)
+        self.assertTrue(np.shares_memory(cached.score.values, mutations.score.values)) #no copy is made
+        for column in range(3):
+            with self.subTest(column=column), self.assertRaises(ValueError):
+                cached.iloc[0, column] = cached.iloc[1, column]
+
+    def test_subscribe(self):
+
+        invalidated = []
+        self.cache.subscribe(invalidated.append)
+        self.cache.invalidate("gene_effect")
+        self.cache.clear()
+        self.assertEqual(invalidated, ["gene_effect", None])
+
+
+class testEntityCache(unittest.TestCase):
+
+    def setUp(self):
+
+        candi.slice_cache.clear()
+        candi.data.load("rnaseq_reads")
+
+    def tearDown(self):
+
+        candi.data.unload("rnaseq_reads")
+
+    def test_shared(self):
+
+        first = candi.Gene("GENE1").rnaseq_reads
+        second = candi.Gene("GENE1").rnaseq_reads
+
+        self.assertIs(first, second)
+        pd.testing.assert_series_equal(first, candi.data.rnaseq_reads.loc["GENE1"])
+        self.assertEqual(candi.slice_cache.stats()["hits"], 1)
+        self.assertNotIn("rnaseq_reads", vars(candi.Gene("GENE1")))
+        self.assertFalse(hasattr(candi.Gene("GENE1"), "not_a_dataset"))
+
+    def test_read_only(self):
+
+        for entity in [candi.Gene("GENE1"), candi.GeneCluster(["GENE1", "GENE4"])]:
+            with self.subTest(entity=entity):
+                values = entity.rnaseq_reads
+                with self.assertRaises(ValueError):
+                    values.iloc[0] = -1
+                self.assertTrue((entity.rnaseq_reads.values >= 0).all())
+
+        #the dataset itself stays writeable
+        self.assertTrue(candi.data.rnaseq_reads.values.flags.writeable)
+        candi.data.rnaseq_reads.iloc[0, 0] = candi.data.rnaseq_reads.iloc[0, 0]
+
+    def test_reload(self):
+
+        first = candi.Gene("GENE1").rnaseq_reads
+        candi.data.unload("rnaseq_reads")
+        candi.data.load("rnaseq_reads")
+
+        self.assertIsNot(candi.Gene("GENE1").rnaseq_reads, first)
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+import numpy as np
+from CanDI.candi.data import Data
+from .conftest import make_install
+
+
+class testData(unittest.TestCase):
+
+    def setUp(self):
+
+        self.root = tempfile.mkdtemp()
+        self.reads = make_install(self.root)
+        self.data = Data(os.path.join(self.root, "data/config.ini"))
+
+    def tearDown(self):
+
+        shutil.rmtree(self.root)
+
+    def test_iter_chunks(self):
+
+        lines = list(self.reads.columns[:4])
+        chunks = list(self.data.iter_chunks("rnaseq_reads", chunk_size=7, columns=lines))
+
+        self.assertEqual(len(chunks), 5)
+        pd.testing.assert_frame_equal(pd.concat(chunks), self.reads[lines])
+
+    def test_to_anndata(self):
+
+        lines = list(self.reads.columns[2:8])
+        with mock.patch.object(self.data, "iter_chunks", wraps=self.data.iter_chunks) as iter_chunks:
+            adata = self.data.to_anndata("rnaseq_reads", cohort=lines, chunk_size=7)
+        self.assertEqual(iter_chunks.call_count, 1) #the values are read once, obs and var from the index only
+
+        self.assertTrue(adata.isbacked)
+        self.assertEqual(list(adata.obs_names), lines)
+        self.assertEqual(adata.obs.loc[lines[0], "primary_disease"], "Lung Cancer")
+        np.testing.assert_array_equal(adata.X[:], self.reads[lines].to_numpy().T)
+        adata.file.close()
+
+
+    def test_axes(self):
+
+        lines = list(self.reads.columns[5:1:-1])
+        expected = (list(self.reads.index), sorted(lines))
+        self.assertEqual(self.data._axes("rnaseq_reads", lines), expected)
+
+        path = os.path.join(self.root, "data/depmap/reads.parquet")
+        self.reads.reset_index().to_parquet(path)
+        self.data.rnaseq_reads = path
+        self.assertEqual(self.data._axes("rnaseq_reads", lines), expected)
+
+        self.data.load("rnaseq_reads")
+        self.assertEqual(self.data._axes("rnaseq_reads", lines), (list(self.reads.index), lines))
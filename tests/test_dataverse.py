@@ -0,0 +1,140 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from CanDI.setup import dataverse
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """Serves files by dataverse id with Range support. The first request for a file can be cut short."""
+
+    files = {}
+    truncate = set()
+    requested = []
+
+    def do_HEAD(self):
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.files[self._file_id()])))
+        self.end_headers()
+
+    def do_GET(self):
+
+        self.requested.append(self.path)
+        file_id = self._file_id()
+        body = self.files[file_id]
+        start = 0
+
+        if "Range" in self.headers:
+            start = int(self.headers["Range"].split("=")[1].split("-")[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        if file_id in self.truncate:
+            self.truncate.discard(file_id)
+            self.wfile.write(body[start:start + len(body) // 3])
+            self.close_connection = True
+            return
+
+        self.wfile.write(body[start:])
+
+    def _file_id(self):
+        return int(self.path.split("?")[0].rstrip("/").split("/")[-1])
+
+    def log_message(self, *args):
+        pass
+
+
+class testDownloader(unittest.TestCase):
+
+    def setUp(self):
+
+        self.path = tempfile.mkdtemp()
+        self.body = os.urandom(50000)
+        _FileHandler.files = {dataverse.name2id["GLS_p"]: self.body,
+                              dataverse.name2id["GLS_sign"]: self.body[::-1]}
+        _FileHandler.truncate = set()
+        _FileHandler.requested = []
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FileHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        manifest = {k: {"size": len(v), "checksum": ["MD5", hashlib.md5(v).hexdigest()]}
+                    for k, v in _FileHandler.files.items()}
+        self.server_path = "http://127.0.0.1:{}/api/access/datafile/".format(self.server.server_port)
+        self.downloader = dataverse.Downloader(server_path=self.server_path, manifest=manifest, backoff=0.01,
+                                               chunk_size=1024)
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    def test_concurrent_download(self):
+
+        names = self.downloader.run(self.path, ["GLS_p", "GLS_sign"], return_type="name")
+
+        self.assertEqual(names, ["GLS_p.npy", "GLS_sign.npy"])
+        with open(os.path.join(self.path, "GLS_sign.npy"), "rb") as f:
+            self.assertEqual(f.read(), self.body[::-1])
+
+    def test_resume_after_dropped_connection(self):
+
+        _FileHandler.truncate = {dataverse.name2id["GLS_p"]}
+        self.downloader.run(self.path, ["GLS_p"])
+
+        with open(os.path.join(self.path, "GLS_p.npy"), "rb") as f:
+            self.assertEqual(f.read(), self.body)
+        self.assertFalse(os.path.exists(os.path.join(self.path, "GLS_p.npy.part")))
+
+    def test_truncated_local_copy_is_replaced(self):
+
+        with open(os.path.join(self.path, "GLS_p.npy"), "wb") as f:
+            f.write(self.body[:100])
+
+        self.assertFalse(self.downloader.verify(os.path.join(self.path, "GLS_p.npy"), dataverse.name2id["GLS_p"]))
+        self.downloader.run(self.path, ["GLS_p"])
+        self.assertTrue(self.downloader.verify(os.path.join(self.path, "GLS_p.npy"), dataverse.name2id["GLS_p"]))
+
+    def test_without_manifest(self):
+
+        downloader = dataverse.Downloader(server_path=self.server_path, manifest=None, backoff=0.01)
+        local_path = os.path.join(self.path, "GLS_p.npy")
+        with open(local_path, "wb") as f:
+            f.write(self.body[:100])
+
+        #the size reported by the server replaces the manifest
+        self.assertFalse(downloader.verify(local_path, dataverse.name2id["GLS_p"], len(self.body)))
+        downloader.run(self.path, ["GLS_p"])
+        with open(local_path, "rb") as f:
+            self.assertEqual(f.read(), self.body)
+
+    def test_ingested_files_are_downloaded_as_uploaded(self):
+
+        file_id = dataverse.name2id["GLS_p"]
+        listing = {"data": {"latestVersion": {"files": [
+            {"dataFile": {"id": file_id, "filesize": 10, "originalFileSize": len(self.body),
+                          "checksum": {"type": "MD5", "value": hashlib.md5(self.body).hexdigest()}}}]}}}
+        with mock.patch.object(dataverse.requests, "get") as get:
+            get.return_value.json.return_value = listing
+            manifest = dataverse.fetch_manifest()
+        self.assertEqual(manifest[file_id]["size"], len(self.body))
+
+        downloader = dataverse.Downloader(server_path=self.server_path, manifest=manifest, backoff=0.01)
+        self.assertEqual(downloader.url(file_id), self.server_path + "{}?format=original".format(file_id))
+        downloader.run(self.path, ["GLS_p"])
+        self.assertEqual(_FileHandler.requested, ["/api/access/datafile/{}?format=original".format(file_id)])
+        self.assertTrue(downloader.verify(os.path.join(self.path, "GLS_p.npy"), file_id))
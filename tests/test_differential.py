@@ -0,0 +1,51 @@
+import unittest
+import pandas as pd
+import numpy as np
+from scipy import stats
+from CanDI.pipelines import differential
+from CanDI.pipelines.utils import bh_fdr
+
+
+class testDifferential(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+        self.matrix = pd.DataFrame(np.round(rng.normal(size=(60, 40)), 1),
+                                   index=["gene_{}".format(i) for i in range(60)],
+                                   columns=["ACH-{:06d}".format(i) for i in range(40)])
+        self.matrix.iloc[3, 5] = np.nan
+        self.group1 = list(self.matrix.columns[:15])
+        self.group2 = list(self.matrix.columns[15:])
+
+    def test_matches_scipy(self):
+
+        res = differential.differential(self.group1, self.group2, self.matrix)
+
+        for gene in ["gene_0", "gene_3"]:
+            a = self.matrix.loc[gene, self.group1].dropna()
+            b = self.matrix.loc[gene, self.group2].dropna()
+            welch = stats.ttest_ind(a, b, equal_var=False)
+            mwu = stats.mannwhitneyu(a, b, method="asymptotic")
+
+            self.assertAlmostEqual(res.loc[gene, "t_stat"], welch.statistic)
+            self.assertAlmostEqual(res.loc[gene, "t_pvalue"], welch.pvalue)
+            self.assertAlmostEqual(res.loc[gene, "u_stat"], mwu.statistic)
+            self.assertAlmostEqual(res.loc[gene, "u_pvalue"], mwu.pvalue)
+
+    def test_lineage_scan(self):
+
+        groups = {"A": self.group1, "B": self.group2[:10]}
+        res = differential.lineage_scan(self.matrix, groups=groups)
+        single = differential.differential(self.group1, self.group2, self.matrix)
+
+        self.assertEqual(res.shape[0], 2 * self.matrix.shape[0])
+        np.testing.assert_allclose(res.loc["A", "t_stat"], single["t_stat"], atol=1e-12)
+
+    def test_bh_fdr(self):
+
+        pvals = np.array([0.01, np.nan, 0.04, 0.03, 0.5])
+        expected = stats.false_discovery_control(pvals[~np.isnan(pvals)])
+
+        np.testing.assert_allclose(bh_fdr(pvals)[~np.isnan(pvals)], expected)
+        self.assertTrue(np.isnan(bh_fdr(pvals)[1]))
@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+import pandas as pd
+import numpy as np
+import anndata as ad
+from CanDI import candi
+from CanDI.pipelines import diffexp
+from CanDI.structures.memo import memo
+
+
+class testDeseqContrasts(unittest.TestCase):
+
+    def setUp(self):
+
+        self.warnings = warnings.catch_warnings()
+        self.warnings.__enter__()
+        warnings.simplefilter("ignore", UserWarning) #the dispersion trend of 30 genes does not converge
+        self.reads = candi.data.load("rnaseq_reads")
+        lines = list(self.reads.columns)
+        self.cohorts = {"A": lines[:4], "B": lines[4:8], "C": lines[8:]}
+        self.contrasts = [("A", "B"), ("A", "C"), ("A", None)]
+        self.out_dir = tempfile.mkdtemp()
+        self.memo = mock.patch.object(memo, "enabled", False) #every call fits its own model
+        self.memo.start()
+
+    def tearDown(self):
+
+        self.memo.stop()
+        self.warnings.__exit__(None, None, None)
+        shutil.rmtree(self.out_dir)
+        candi.data.unload("rnaseq_reads")
+
+    def test_cohort_counts(self):
+
+        counts, metadata = diffexp.cohort_counts(self.cohorts, self.reads)
+
+        pd.testing.assert_frame_equal(counts, self.reads.T.astype(int), check_names=False, check_like=True)
+        self.assertEqual(list(metadata.cohort), ["A"] * 4 + ["B"] * 4 + ["C"] * 4)
+
+        #reads of duplicated genes are summed
+        duplicated = self.reads.rename(index={"GENE1": "GENE0"})
+        counts, _ = diffexp.cohort_counts(self.cohorts, duplicated)
+        pd.testing.assert_series_equal(counts["GENE0"], self.reads.loc["GENE0"] + self.reads.loc["GENE1"],
+                                       check_names=False)
+
+        with self.assertRaises(ValueError):
+            diffexp.cohort_counts({"A": self.cohorts["A"], "B": self.cohorts["A"][:1]}, self.reads)
+
+    def test_contrasts(self):
+
+        res = diffexp.run_deseq_contrasts(self.cohorts, self.contrasts, self.reads, n_jobs=1, n_cpus=1)
+        self.assertEqual(list(res), ["A_vs_B", "A_vs_C", "A_vs_rest"])
+
+        #A vs rest is A against the average of the other cohorts
+        lfc = {k: v.log2FoldChange for k, v in res.items()}
+        np.testing.assert_allclose(lfc["A_vs_rest"], (lfc["A_vs_B"] + lfc["A_vs_C"]) / 2)
+
+        #one contrast of the shared model matches a model fit for it alone
+        counts, metadata = diffexp.cohort_counts(self.cohorts, self.reads)
+        with mock.patch("builtins.print"):
+            single = diffexp.run_deseq(counts, "cohort", "A", "B", n_cpus=1, metadata=metadata)
+        pd.testing.assert_frame_equal(res["A_vs_B"], single)
+
+        default = diffexp.run_deseq_contrasts(self.cohorts, counts=self.reads, n_jobs=1, n_cpus=1)
+        self.assertEqual(list(default), ["A_vs_rest", "B_vs_rest", "C_vs_rest"])
+        self.assertIsNone(diffexp._dds) #a serial run keeps no fitted model around
+
+    def test_design_formula(self):
+
+        counts, metadata = diffexp.cohort_counts(self.cohorts, self.reads)
+        with warnings.catch_warnings(record=True) as caught, mock.patch("builtins.print"):
+            warnings.simplefilter("always")
+            diffexp.run_deseq(counts, "cohort", "A", "B", n_cpus=1, metadata=metadata)
+        self.assertFalse([i for i in caught if "design_factors" in str(i.message)])
+
+    def test_parallel_contrasts(self):
+
+        serial = diffexp.run_deseq_contrasts(self.cohorts, self.contrasts, self.reads, n_jobs=1, n_cpus=1)
+        parallel = diffexp.run_deseq_contrasts(self.cohorts, self.contrasts, self.reads, n_jobs=2, n_cpus=1)
+
+        self.assertEqual(list(parallel), list(serial))
+        for name in serial:
+            pd.testing.assert_frame_equal(parallel[name], serial[name])
+
+    def test_out_dir(self):
+
+        serial = diffexp.run_deseq_contrasts(self.cohorts, self.contrasts, self.reads, n_jobs=1, n_cpus=1)
+        paths = diffexp.run_deseq_contrasts(self.cohorts, self.contrasts, self.reads, out_dir=self.out_dir,
+                                            n_jobs=2, n_cpus=1)
+
+        self.assertEqual(sorted(os.listdir(self.out_dir)), ["A_vs_B.csv", "A_vs_C.csv", "A_vs_rest.csv"])
+        for name, path in paths.items():
+            self.assertEqual(str(path), os.path.join(self.out_dir, name + ".csv"))
+            pd.testing.assert_frame_equal(pd.read_csv(path, index_col=0), serial[name], check_exact=False)
+
+
+class testPseudobulk(unittest.TestCase):
+
+    def setUp(self):
+
+        self.reads = candi.data.load("rnaseq_reads")
+        self.groups = candi.data.cell_lines[["primary_disease", "sex"]]
+
+    def tearDown(self):
+
+        candi.data.unload("rnaseq_reads")
+
+    def test_aggregation(self):
+
+        for method in ["sum", "mean"]:
+            out, metadata = diffexp.pseudobulk(["primary_disease", "sex"], self.reads, method)
+            expected = self.reads.T.groupby([self.groups.primary_disease, self.groups.sex]).agg(method)
+            expected.index = ["_".join(i) for i in expected.index]
+
+            pd.testing.assert_frame_equal(out.sort_index(), expected.sort_index(), check_names=False,
+                                          check_dtype=method == "mean")
+            self.assertEqual(metadata.n_lines.sum(), self.reads.shape[1])
+            self.assertEqual(list(metadata.index), list(out.index))
+
+    def test_missing_values(self):
+
+        reads = self.reads.astype(float)
+        reads.iloc[0, 0] = np.nan
+        out, _ = diffexp.pseudobulk("primary_disease", reads)
+
+        expected = reads.fillna(0).T.groupby(self.groups.primary_disease).sum()
+        pd.testing.assert_frame_equal(out.sort_index(), expected.round().astype(int), check_names=False)
+        self.assertTrue(np.isnan(reads.iloc[0, 0])) #zeroed in the copy of the grouped lines only
+
+    def test_cohort(self):
+
+        cohort = list(self.reads.columns[:5])
+        labels = pd.Series(["x", "y", None, "x", "y"], index=cohort, name="label") #unlabeled lines are dropped
+        out, metadata = diffexp.pseudobulk(labels, self.reads, cohort=cohort + ["ACH-999999"])
+
+        expected = self.reads[cohort].T.groupby(labels).sum()
+        pd.testing.assert_frame_equal(out, expected, check_names=False, check_dtype=False)
+        self.assertEqual(list(metadata.n_lines), [2, 2])
+
+        out, _ = diffexp.pseudobulk("primary_disease", self.reads, cohort=cohort)
+        self.assertEqual(list(out.sum(axis=1).sort_index()),
+                         list(self.reads[cohort].T.groupby(self.groups.primary_disease).sum().sum(axis=1)))
+
+    def test_run_deseq_tables(self):
+
+        counts, metadata = diffexp.pseudobulk(["primary_disease", "sex"], self.reads)
+
+        with warnings.catch_warnings(), mock.patch("builtins.print"):
+            warnings.simplefilter("ignore")
+            tables = diffexp.run_deseq(counts, "primary_disease", "Lung Cancer", "Breast Cancer", n_cpus=1,
+                                       metadata=metadata)
+            adata = diffexp.run_deseq(ad.AnnData(X=counts, obs=metadata), "primary_disease", "Lung Cancer",
+                                      "Breast Cancer", n_cpus=1)
+
+        self.assertEqual(list(tables.index), list(self.reads.index))
+        pd.testing.assert_frame_equal(tables, adata)
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from CanDI import candi
+from CanDI.structures import export
+
+
+class testExport(unittest.TestCase):
+
+    def setUp(self):
+
+        self.dir = tempfile.mkdtemp()
+        self.reads = pd.read_csv(candi.data.path("rnaseq_reads"), index_col="gene")
+
+    def tearDown(self):
+
+        shutil.rmtree(self.dir)
+        candi.data.mutations = None
+
+    def test_data_export(self):
+
+        path = os.path.join(self.dir, "reads.parquet")
+        lines = list(self.reads.columns[:3])
+        rows = candi.data.export("rnaseq_reads", path, columns=lines, chunk_size=7)
+
+        parquet = pq.ParquetFile(path)
+        self.assertEqual((rows, parquet.num_row_groups), (30, 5))
+        pd.testing.assert_frame_equal(pd.read_parquet(path), self.reads[lines])
+
+        metadata = export.read_metadata(path)
+        self.assertEqual((metadata["dataset"], metadata["columns"]), ("rnaseq_reads", lines))
+        self.assertEqual(metadata["config"], os.environ["CANDI_CONFIG"])
+
+    def test_entity_export(self):
+
+        path = os.path.join(self.dir, "gene.arrow")
+        candi.Gene("GENE4").export("rnaseq_reads", path, file_format="arrow", compression="lz4")
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all().to_pandas()
+        pd.testing.assert_frame_equal(table, self.reads.loc[["GENE4"]])
+        self.assertEqual(export.read_metadata(path)["entity"], {"class": "Gene", "type": "gene", "key": ["GENE4"]})
+
+        candi.data.mutations = pd.DataFrame({"gene": ["GENE1", "GENE4", "GENE4"], "DepMap_ID": ["A", "B", "C"],
+                                             "Protein_Change": ["p.A1B", "p.C2D", "p.E3F"]})
+        path = os.path.join(self.dir, "mutations.parquet")
+        candi.Gene("GENE4").export("mutations", path, columns=["DepMap_ID", "Protein_Change"], block_size=2)
+        self.assertEqual(pd.read_parquet(path).to_dict("list"),
+                         {"DepMap_ID": ["B", "C"], "Protein_Change": ["p.C2D", "p.E3F"]})
+
+    def test_empty_chunks(self):
+
+        path = os.path.join(self.dir, "empty.parquet")
+        chunks = [pd.DataFrame({"gene": pd.Series([], dtype=object)}), pd.DataFrame({"gene": ["GENE1"]})]
+        self.assertEqual(export.write(iter(chunks), path), 1)
+        self.assertEqual(export.write(iter(chunks[:1]), path), 0)
+        self.assertEqual(list(pd.read_parquet(path).columns), ["gene"])
+
+    def test_sparse_columns(self):
+
+        #COSMIC is empty and score holds integers in the first chunks of the file
+        mutations = pd.DataFrame({"gene": ["GENE{}".format(i % 5) for i in range(25)],
+                                  "DepMap_ID": ["ACH-{:06d}".format(i) for i in range(25)],
+                                  "COSMIC": [np.nan] * 20 + ["COSM{}".format(i) for i in range(5)],
+                                  "score": list(range(20)) + [3.5] * 5})
+        src = os.path.join(self.dir, "mutations.csv")
+        mutations.to_csv(src, index=False)
+        candi.data.mutations = Path(src)
+
+        path = os.path.join(self.dir, "mutations.parquet")
+        self.assertEqual(candi.data.export("mutations", path, chunk_size=10), 25)
+        out = pd.read_parquet(path)
+        self.assertEqual(list(out.COSMIC.dropna()), ["COSM{}".format(i) for i in range(5)])
+        np.testing.assert_allclose(out.score, mutations.score)
+
+        candi.Gene("GENE0").export("mutations", path, block_size=4)
+        out = pd.read_parquet(path)
+        self.assertEqual(list(out.COSMIC), [None] * 4 + ["COSM0"])
+
+        #without a schema, later chunks are cast to the types of the first one
+        chunks = [mutations.iloc[:10], mutations.iloc[20:].assign(score=7)]
+        export.write(iter(chunks), path)
+        self.assertEqual(list(pd.read_parquet(path).COSMIC.dropna()), ["COSM{}".format(i) for i in range(5)])
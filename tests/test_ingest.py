@@ -0,0 +1,147 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+import numpy as np
+from CanDI.setup import ingest, manager
+
+
+class testIngest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.path)
+
+    @staticmethod
+    def _stream(body, size=7):
+
+        return [body[i:i + size] for i in range(0, len(body), size)]
+
+    def test_records_keep_multibyte_characters(self):
+
+        body = 'gene,note\n"A,\nB",é\nC,ü\n'.encode("utf-8")
+        records = list(ingest.iter_records(self._stream(body, 1)))
+
+        self.assertEqual(records, ['gene,note\n', '"A,\nB",é\n', 'C,ü\n'])
+
+    def test_matrix_is_written_gene_indexed(self):
+
+        matrix = pd.DataFrame(np.random.rand(5, 4), index=["ACH-{:06d}".format(i) for i in range(5)],
+                              columns=["AAAS (8086)", "KRAS (3845)", "TP53 (7157)", "EGFR (1956)"])
+        path = ingest.ingest(self._stream(matrix.to_csv().encode()), os.path.join(self.path, "effect.parquet"),
+                             batch_size=2, block_size=3)
+        out = pd.read_parquet(path).set_index("gene")
+
+        self.assertEqual(list(out.index), ["AAAS", "KRAS", "TP53", "EGFR"])
+        np.testing.assert_allclose(out.to_numpy(), matrix.to_numpy().T)
+
+    def test_table_is_formatted(self):
+
+        fusions = pd.DataFrame({"LeftGene": ["KRAS (ENSG00000133703)", "A (ENSG1)", "B (ENSG2)"],
+                                "RightGene": ["C (ENSG3)", "D (ENSG4)", "E (ENSG5)"],
+                                "DepMap_ID": ["ACH-000001", "ACH-000002", "ACH-000003"]})
+        path = ingest.ingest(self._stream(fusions.to_csv(index=False, sep="\t").encode()),
+                             os.path.join(self.path, "fusions.parquet"), batch_size=2)
+        out = pd.read_parquet(path)
+
+        self.assertEqual(list(out.LeftGene), ["KRAS", "A", "B"])
+        self.assertEqual(out.LeftEnsemblID[0], "ENSG00000133703")
+
+    def test_transpose_matches_in_memory_format(self):
+
+        matrix = pd.DataFrame(np.random.rand(23, 37), index=["ACH-{:06d}".format(i) for i in range(23)],
+                              columns=["AAAS (8086)"] + ["GENE{0} ({0})".format(i) for i in range(36)])
+        src = os.path.join(self.path, "CRISPR_gene_effect.csv")
+        matrix.to_csv(src)
+
+        #a tiny ceiling forces several row blocks and column tiles
+        ingest.transpose_matrix_csv(src, src, memory_limit=8 * 37 * ingest.OVERHEAD * 5, progress=False)
+        out = pd.read_csv(src, index_col="gene")
+
+        self.assertEqual(list(out.columns), list(matrix.index))
+        self.assertEqual(out.index[0], "AAAS")
+        np.testing.assert_allclose(out.to_numpy(), matrix.to_numpy().T)
+
+
+class _Response(object):
+
+    def __init__(self, body):
+        self.body = body
+        self.status_code = 200
+        self.headers = {"Content-Length": str(len(body))}
+
+    def iter_content(self, chunk_size):
+        return [self.body[i:i + 1000] for i in range(0, len(self.body), 1000)]
+
+    def raise_for_status(self):
+        pass
+
+
+class testInstallMemoryLimit(unittest.TestCase):
+
+    def setUp(self):
+
+        self.path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.path, "data", "depmap"))
+        self.config = os.path.join(self.path, "data", "config.ini")
+        with open(self.config, "w") as f:
+            f.write("[defaults]\ndownloads = [\"depmap\"]\ndepmap = [\"gene_effect\"]\n\n"
+                    "[depmap_urls]\nCRISPR_gene_effect.csv = https://depmap.org/effect\n\n"
+                    "[depmap_files]\ngene_effect = CRISPR_gene_effect.csv\n\n"
+                    "[data_paths]\ndepmap = data/depmap/\n\n[downloads]\n\n[formatted]\n\n[autoload_info]\n")
+
+        self.matrix = pd.DataFrame(np.random.rand(40, 25), index=["ACH-{:06d}".format(i) for i in range(40)],
+                                   columns=["AAAS (8086)"] + ["GENE{0} ({0})".format(i) for i in range(24)])
+        self.appended, self.written = [], []
+        appended, written = self.appended, self.written
+
+        class Recording(ingest.TileStore):
+            def append(self, block):
+                appended.append(len(block))
+                super().append(block)
+
+            def blocks(self, width=None):
+                for start, block in super().blocks(width):
+                    written.append(block.shape[1])
+                    yield start, block
+
+        self.patches = [mock.patch.object(ingest, "TileStore", Recording),
+                        mock.patch.object(manager.requests, "get",
+                                          return_value=_Response(self.matrix.to_csv().encode()))]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.path)
+
+    def test_download_honours_limit(self):
+
+        m = manager.BroadDepMap(manager_path=self.path, cfig_path=self.config)
+        limit = 8 * 25 * ingest.OVERHEAD * 6 #6 cell lines or 3 genes of the 40 lines per block
+        m.download_defaults(memory_limit=4 * limit, progress=False) #shared by 4 download threads
+
+        self.assertEqual(self.appended, [6] * 6 + [4])
+        self.assertEqual(max(self.written), 3)
+        out = pd.read_parquet(m.parser["formatted"]["CRISPR_gene_effect.csv"]).set_index("gene")
+        self.assertEqual(list(out.columns), list(self.matrix.index))
+        np.testing.assert_allclose(out.to_numpy(), self.matrix.to_numpy().T)
+
+    def test_failed_download_is_raised(self):
+
+        m = manager.BroadDepMap(manager_path=self.path, cfig_path=self.config)
+        broken = _Response(self.matrix.to_csv().encode()[:-10] + b"x,y,z\n") #a truncated and malformed record
+        with mock.patch.object(manager.requests, "get", return_value=broken):
+            with self.assertRaisesRegex(RuntimeError, "Downloading CRISPR_gene_effect.csv failed"):
+                m.download_defaults(progress=False)
+
+        self.assertEqual(dict(m.parser["formatted"]), {})
+        self.assertEqual(os.listdir(os.path.join(self.path, "data", "depmap")), [])
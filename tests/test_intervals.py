@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from CanDI import candi
+from CanDI.structures import intervals
+
+
+class testIntervalIndex(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+        self.chrom = rng.choice(["1", "2", "X"], size=500)
+        self.starts = rng.integers(0, 10000, size=500)
+        self.ends = self.starts + rng.integers(0, 300, size=500)
+        self.index = intervals.IntervalIndex(self.chrom, self.starts, self.ends)
+
+    def test_overlap(self):
+
+        for chrom, start, end in [("2", 4000, 4100), ("X", 0, 10), ("1", 9990, 20000), ("2", 5000, 5000)]:
+            expected = np.flatnonzero((self.chrom == chrom) & (self.starts <= end) & (self.ends >= start))
+            np.testing.assert_array_equal(self.index.overlap("chr{0}:{1:,}-{2:,}".format(chrom, start, end)), expected)
+
+        self.assertEqual(len(self.index.overlap(("7", 0, 100))), 0)
+        queries, rows = self.index.overlap_many([("1", 100, 200), ("X", 300, 400)])
+        self.assertEqual(len(queries), len(self.index.overlap(("1", 100, 200))) + len(self.index.overlap(("X", 300, 400))))
+
+    def test_nearest(self):
+
+        rows, distance = self.index.nearest("chr1:5000", k=5)
+        on_chrom = np.flatnonzero(self.chrom == "1")
+        expected = np.maximum(np.maximum(self.starts[on_chrom] - 5000, 5000 - self.ends[on_chrom]), 0)
+        np.testing.assert_array_equal(distance, np.sort(expected)[:5])
+        self.assertTrue((self.chrom[rows] == "1").all())
+
+    def test_parse(self):
+
+        self.assertEqual(intervals.parse_region("chr17:7,660,000-7,690,000"), ("17", 7660000, 7690000))
+        self.assertEqual(intervals.parse_region((17.0, 5)), ("17", 5, 5))
+        with self.assertRaises(ValueError):
+            intervals.parse_region("chr17")
+
+
+class testRegionQueries(unittest.TestCase):
+
+    def setUp(self):
+
+        candi.data.mutations = pd.DataFrame({"gene": ["GENE1", "GENE1", "GENE2", "GENE3"],
+                                             "DepMap_ID": ["ACH-000000", "ACH-000001", "ACH-000001", "ACH-000002"],
+                                             "Chromosome": ["17", "17", "17", "X"],
+                                             "Start_position": [1000, 1500, 9000, 1200],
+                                             "End_position": [1000, 1502, 9000, 1200],
+                                             "Variant_Classification": "Missense_Mutation"})
+        candi.data.gene_cn = pd.DataFrame(np.ones((3, 3)), index=["GENE1", "GENE2", "GENE3"],
+                                          columns=["ACH-000000", "ACH-000001", "ACH-000002"])
+
+    def tearDown(self):
+
+        candi.data.mutations = None
+        candi.data.gene_cn = None
+        candi.data.gene_coordinates = None
+
+    def test_queries(self):
+
+        self.assertEqual(list(intervals.variants_in("chr17:900-1600").gene), ["GENE1", "GENE1"])
+        self.assertEqual(list(intervals.variants_in("chr17:900-1600", lines=["ACH-000001"]).Start_position), [1500])
+        self.assertEqual(list(candi.Gene("GENE2").variants_in("chr17:1-10000").Start_position), [9000])
+
+        nearest = intervals.nearest_variants("chr17:8000", k=2)
+        self.assertEqual(list(nearest.distance), [1000, 6498])
+
+    def test_gene_coordinates(self):
+
+        #gene_info of the test install has no coordinates
+        with self.assertRaisesRegex(ValueError, "coordinates"):
+            intervals.genes_in("chr17:1400-9500")
+
+        #genes without variants are placed by their coordinates
+        coordinates = pd.DataFrame({"chromosome": ["chr17", "17", "X"], "start": [900, 8000, 1000],
+                                    "end": [2000, 9500, 5000]}, index=["GENE1", "GENE4", "GENE3"])
+        self.assertEqual(intervals.genes_in("chr17:1400-9500", coordinates), ["GENE1", "GENE4"])
+
+        path = os.path.join(tempfile.mkdtemp(), "coordinates.csv")
+        coordinates.to_csv(path)
+        candi.data.gene_coordinates = path
+        self.assertEqual(intervals.genes_in("chrX:1-1100"), ["GENE3"])
+        self.assertEqual(list(intervals.copy_number_in("chr17:1400-9500", lines=["ACH-000002"]).index), ["GENE1"])
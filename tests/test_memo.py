@@ -0,0 +1,148 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+from CanDI.structures import memo as memo_module
+from CanDI.structures.memo import Memo
+
+
+_store = None
+
+
+def _slow_sum(directory, value):
+    #runs in forked workers, each call leaves a file behind so calls can be counted
+    with open(os.path.join(directory, "call-{}".format(os.getpid())), "w"):
+        pass
+    time.sleep(0.5)
+    return value + 1
+
+
+def _call_store(value):
+
+    return _store(os.path.dirname(_store.memo.directory), value)
+
+
+class testMemo(unittest.TestCase):
+
+    def setUp(self):
+
+        self.root = tempfile.mkdtemp()
+        self.memo = Memo(os.path.join(self.root, "memo"), enabled=True)
+        self.calls = []
+
+    def tearDown(self):
+
+        shutil.rmtree(self.root)
+
+    def test_memoize(self):
+
+        @self.memo.memoize(datasets=("df",), ignore=("n_jobs",))
+        def column_means(df, scale=1.0, n_jobs=1):
+            self.calls.append(scale)
+            return df.mean() * scale
+
+        df = pd.DataFrame(np.arange(12.0).reshape(4, 3), columns=list("abc"))
+        first = column_means(df)
+        pd.testing.assert_series_equal(column_means(df.copy(), n_jobs=8), first)
+        self.assertEqual(self.calls, [1.0])
+
+        column_means(df, scale=2.0)
+        changed = df.copy()
+        changed.iloc[0, 0] = -1.0
+        column_means(changed)
+        self.assertEqual(self.calls, [1.0, 2.0, 1.0])
+        self.assertEqual(self.memo.stats()["entries"], 3)
+
+    def test_evict(self):
+
+        @self.memo.memoize
+        def block(i):
+            return np.zeros(1000) + i
+
+        for i in range(3):
+            block(i)
+            time.sleep(0.01)
+        block(0) #0 becomes the most recently used
+
+        self.memo.max_bytes = 2 * 8500
+        self.memo.evict()
+        self.assertEqual(self.memo.stats()["entries"], 2)
+
+        self.calls = []
+        self.assertEqual(block(0)[0], 0)
+        self.assertEqual(self.memo.hits, 2)
+        #lock files of evicted results are removed with them
+        locks = [i.stem for i in (self.memo.directory / "locks").glob("*.lock")]
+        self.assertEqual(sorted(set(locks) - {"evict"}), sorted(i.stem for i in self.memo._objects.glob("*/*.pkl")))
+
+    def test_opt_in(self):
+
+        with mock.patch.dict(os.environ, {"CANDI_MEMO": ""}):
+            memo = Memo(os.path.join(self.root, "off"))
+        calls = memo.memoize(lambda x: self.calls.append(x))
+        calls(1)
+        calls(1)
+        self.assertEqual(self.calls, [1, 1])
+        self.assertFalse(memo.directory.exists())
+
+    def test_versions(self):
+
+        @self.memo.memoize(versions=("numpy",))
+        def value():
+            self.calls.append(1)
+            return 1
+
+        value()
+        with mock.patch.object(memo_module.metadata, "version", return_value="0.0"):
+            value()
+        value()
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_unsupported_parameters(self):
+
+        calls = self.memo.memoize(lambda x: self.calls.append(x))
+        with self.assertRaisesRegex(TypeError, "object parameters can not be part of a memo key"):
+            calls(object())
+
+        #large frames are keyed by content, not by their truncated repr
+        df = pd.DataFrame(np.zeros((100, 100)))
+        changed = df.copy()
+        changed.iloc[50, 50] = 1.0
+        self.assertEqual(repr(df), repr(changed))
+        self.assertNotEqual(self.memo.key("f", {"df": df}), self.memo.key("f", {"df": changed}))
+
+    def test_concurrent(self):
+
+        global _store
+        _store = self.memo.memoize(_slow_sum)
+        context = multiprocessing.get_context("fork")
+
+        with ProcessPoolExecutor(4, mp_context=context) as executor:
+            results = list(executor.map(_call_store, [1] * 4))
+
+        self.assertEqual(results, [2] * 4)
+        self.assertEqual(len([i for i in os.listdir(self.root) if i.startswith("call-")]), 1)
+
+    def test_checkpoints(self):
+
+        def stage(x):
+            self.calls.append(x)
+            return x * 2
+
+        with self.memo.checkpoints("run") as checkpoint:
+            self.assertEqual(checkpoint("double", stage, 2), 4)
+        with self.memo.checkpoints("run") as checkpoint:
+            self.assertEqual(checkpoint("double", stage, 2), 4)
+            self.assertEqual(checkpoint("double", stage, 3), 6)
+            self.assertEqual(checkpoint.stages(), ["double", "double"])
+
+        self.memo.clear()
+        with self.memo.checkpoints("run") as checkpoint:
+            checkpoint("double", stage, 2)
+        self.assertEqual(self.calls, [2, 3])
@@ -0,0 +1,71 @@
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from CanDI import candi
+from CanDI.pipelines import parallel
+
+
+def _mean(item, values):
+    return float(values.mean())
+
+
+def _difference(item, values):
+    return float(values[1].sum() - values["rnaseq_reads"].sum()), values[1].values.flags.writeable
+
+
+def _total(item, values):
+    return None if values is None else float(values.sum())
+
+
+def _fails(item, values):
+    if item == "GENE7":
+        raise ZeroDivisionError("bad gene")
+    return item
+
+
+class testParallelMap(unittest.TestCase):
+
+    def setUp(self):
+
+        self.reads = candi.data.load("rnaseq_reads")
+
+    def tearDown(self):
+
+        candi.data.unload("rnaseq_reads")
+
+    def test_map_genes(self):
+
+        genes = list(self.reads.index[::-1])
+        expected = list(self.reads.loc[genes].mean(axis=1))
+
+        self.assertEqual(candi.map_genes(_mean, genes, "rnaseq_reads", n_jobs=1), expected)
+        self.assertEqual(candi.map_genes(_mean, genes, "rnaseq_reads", n_jobs=2, chunk_size=4), expected)
+
+    def test_map_lines(self):
+
+        lines = list(self.reads.columns[:5]) + ["ACH-999999"]
+        results = candi.map_lines(_difference, lines[:5], ["rnaseq_reads", self.reads * 2], n_jobs=2)
+
+        #workers get read only views of the shared matrices
+        self.assertEqual(results, [(float(self.reads[i].sum()), False) for i in lines[:5]])
+        self.assertIsNone(candi.map_lines(lambda line, values: values, lines, "rnaseq_reads", n_jobs=1)[-1])
+
+    def test_only_mapped_rows_are_shared(self):
+
+        genes = ["GENE9", "NOTAGENE", "GENE2", "GENE9"]
+        shared = parallel.shared_memory.SharedMemory
+        with mock.patch.object(parallel.shared_memory, "SharedMemory", side_effect=shared) as create:
+            results = candi.map_genes(_total, genes, "rnaseq_reads", n_jobs=2, chunk_size=1)
+
+        self.assertEqual(create.call_args.kwargs["size"], 2 * self.reads.shape[1] * self.reads.values.itemsize)
+        total = self.reads.sum(axis=1)
+        self.assertEqual(results, [total["GENE9"], None, total["GENE2"], total["GENE9"]])
+
+    def test_errors(self):
+
+        with self.assertRaises(candi.MapError) as context:
+            candi.map_genes(_fails, list(self.reads.index), "rnaseq_reads", n_jobs=2, chunk_size=3)
+
+        self.assertEqual(context.exception.item, "GENE7")
+        self.assertIn("bad gene", str(context.exception))
@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+import pandas as pd
+from CanDI import candi
+from CanDI.structures import ranks
+
+
+class testSortedIndex(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+        values = rng.normal(size=(40, 15))
+        values[rng.random(values.shape) < 0.1] = np.nan
+        self.df = pd.DataFrame(values, index=["GENE{}".format(i) for i in range(40)],
+                               columns=["ACH-{:06d}".format(i) for i in range(15)])
+        self.index = ranks.SortedIndex(self.df)
+
+    def test_count(self):
+
+        for threshold in [-1.0, 0.0, 0.5, 3.0]:
+            pd.testing.assert_series_equal(self.index.count(threshold), (self.df < threshold).sum(axis=1),
+                                           check_names=False)
+            pd.testing.assert_series_equal(self.index.count(threshold, "over"), (self.df > threshold).sum(axis=1),
+                                           check_names=False)
+
+        sweep = self.index.sweep([-1.0, 0.0])
+        self.assertEqual(list(sweep.columns), [-1.0, 0.0])
+        with self.assertRaises(ValueError):
+            self.index.count(0.0, "sideways")
+
+    def test_quantile(self):
+
+        quantiles = self.index.quantile([0.1, 0.5])
+        np.testing.assert_allclose(quantiles[0.5], np.nanquantile(self.df, 0.5, axis=1))
+        np.testing.assert_allclose(quantiles[0.1], np.nanquantile(self.df, 0.1, axis=1))
+
+        by = pd.Series(["a", "b", "c"] * 5, index=self.df.columns, name="lineage")
+        grouped = self.index.quantile(0.5, by=by)
+        np.testing.assert_allclose(grouped[("b", 0.5)], self.df.loc[:, by == "b"].median(axis=1))
+
+    def test_top(self):
+
+        top = self.index.top(3, lines=["ACH-000002", "ACH-000005"])
+        expected = self.df["ACH-000005"].nsmallest(3)
+        self.assertEqual(list(top.loc["ACH-000005"].gene), list(expected.index))
+        np.testing.assert_allclose(top.loc["ACH-000005"].value, expected)
+
+        top = self.index.top(20, genes=["GENE3"], direction="over")
+        expected = self.df.loc["GENE3"].dropna().sort_values(ascending=False)
+        self.assertEqual(list(top.DepMap_ID), list(expected.index))
+        self.assertEqual(list(top.index.get_level_values("rank")), list(range(1, len(expected) + 1)))
+
+    def test_entity_top(self):
+
+        reads = candi.data.load("rnaseq_reads")
+        try:
+            top = candi.Gene("GENE2").top(2, "rnaseq_reads", "over")
+            self.assertEqual(list(top.DepMap_ID), list(reads.loc["GENE2"].nlargest(2).index))
+            self.assertIs(ranks.sorted_index("rnaseq_reads"), ranks.sorted_index("rnaseq_reads"))
+        finally:
+            candi.data.unload("rnaseq_reads")
+        self.assertNotIn("rnaseq_reads", ranks._indexes) #the sorted copies are freed with the dataset
@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+import pandas as pd
+from CanDI.pipelines import regression
+
+
+class testRegression(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+        genes = ["gene_{}".format(i) for i in range(20)]
+        lines = ["ACH-{:06d}".format(i) for i in range(40)]
+        self.cn = pd.DataFrame(rng.normal(1, 0.3, size=(20, 40)), index=genes, columns=lines)
+        self.expression = pd.DataFrame(rng.normal(size=(20, 40)), index=genes, columns=lines)
+        self.lineage = pd.Series(np.repeat(["a", "b", "c", "d"], 10), index=lines)
+        offsets = self.lineage.map({"a": 0, "b": 0.5, "c": -0.5, "d": 1}).to_numpy()
+        self.effect = -0.8 * self.cn + 0.2 * self.expression + offsets + rng.normal(0, 0.1, size=(20, 40))
+        self.effect.iloc[2, 5] = np.nan
+        self.cn.iloc[7, [0, 11]] = np.nan
+        self.lineage.iloc[3] = np.nan
+
+    def _lstsq(self, gene):
+
+        keep = self.effect.loc[gene].notna() & self.cn.loc[gene].notna() & self.lineage.notna()
+        dummies = pd.get_dummies(self.lineage[keep], drop_first=True, dtype=float)
+        design = np.column_stack([np.ones(keep.sum()), dummies, self.cn.loc[gene, keep], self.expression.loc[gene, keep]])
+        y = self.effect.loc[gene, keep].to_numpy()
+        beta = np.linalg.lstsq(design, y, rcond=None)[0]
+        residuals = y - design @ beta
+        sigma2 = residuals @ residuals / (len(y) - design.shape[1])
+        stderr = np.sqrt(sigma2 * np.diag(np.linalg.inv(design.T @ design)))
+        return beta[-2:], stderr[-2:], pd.Series(residuals, index=keep.index[keep])
+
+    def test_matches_lstsq(self):
+
+        fit = regression.regress(self.effect, {"cn": self.cn, "expression": self.expression}, lineage=self.lineage,
+                                 block_size=6)
+
+        for gene in ["gene_0", "gene_2", "gene_7"]:
+            beta, stderr, residuals = self._lstsq(gene)
+            np.testing.assert_allclose(fit.table.loc[gene, "coef"], beta)
+            np.testing.assert_allclose(fit.table.loc[gene, "stderr"], stderr)
+            np.testing.assert_allclose(fit.residuals.loc[gene, residuals.index], residuals, atol=1e-12)
+            self.assertEqual(fit.residuals.loc[gene].notna().sum(), len(residuals))
+
+        self.assertTrue((fit.table.xs("cn", level="covariate")["fdr"] < 1e-6).all())
+        self.assertEqual(fit.table.loc[("gene_7", "cn"), "n_lines"], 37)
+
+    def test_corrected(self):
+
+        fit = regression.regress(self.effect, [self.cn], genes=["gene_1", "gene_4"], min_lines=5)
+        gene = self.effect.loc["gene_1"]
+        cn = self.cn.loc["gene_1"]
+        slope = fit.table.loc[("gene_1", "covariate0"), "coef"]
+
+        self.assertEqual(list(fit.corrected.index), ["gene_1", "gene_4"])
+        np.testing.assert_allclose(fit.corrected.loc["gene_1"], gene - slope * (cn - cn.mean()))
+        np.testing.assert_allclose(slope, np.polyfit(cn, gene, 1)[0])
+
+    def test_too_few_lines(self):
+
+        fit = regression.regress(self.effect, [self.cn], lines=self.effect.columns[:5], min_lines=10)
+        self.assertTrue(fit.table["coef"].isna().all())
+        self.assertTrue(fit.corrected.isna().all().all())
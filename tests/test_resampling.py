@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import pandas as pd
+from CanDI.pipelines import resampling
+
+
+class testResampling(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = np.random.default_rng(0)
+        self.matrix = pd.DataFrame(rng.normal(size=(30, 50)),
+                                   index=["gene_{}".format(i) for i in range(30)],
+                                   columns=["ACH-{:06d}".format(i) for i in range(50)])
+        self.cohort = list(self.matrix.columns[:10])
+        self.matrix.loc["gene_0", self.cohort] -= 3 #selectively essential in the cohort
+        self.matrix.iloc[4, 2] = np.nan
+
+    def test_permutation_matches_loop(self):
+
+        res = resampling.permutation_test(self.cohort, self.matrix, alternative="less", n_resamples=50,
+                                          batch_size=50, n_jobs=1)
+
+        rng = np.random.default_rng(np.random.SeedSequence(0).spawn(1)[0])
+        draws = rng.permuted(np.tile(np.arange(50), (50, 1)), axis=1)[:, :10]
+        null = np.column_stack([self.matrix.iloc[:, i].mean(axis=1) for i in draws])
+        observed = self.matrix[self.cohort].mean(axis=1)
+
+        np.testing.assert_allclose(res["mean"], observed)
+        np.testing.assert_allclose(res["null_mean"], null.mean(axis=1))
+        np.testing.assert_allclose(res["pvalue"], ((null <= observed.to_numpy()[:, None]).sum(axis=1) + 1) / 51)
+
+    def test_permutation_is_seeded(self):
+
+        one = resampling.permutation_test(self.cohort, self.matrix, statistic="fraction", margin=-1.0,
+                                          n_resamples=300, batch_size=40, n_jobs=1)
+        many = resampling.permutation_test(self.cohort, self.matrix, statistic="fraction", margin=-1.0,
+                                           n_resamples=300, batch_size=40, n_jobs=3)
+
+        pd.testing.assert_frame_equal(one, many)
+        np.testing.assert_allclose(one["fraction"], (self.matrix[self.cohort] < -1.0).sum(axis=1)
+                                   / self.matrix[self.cohort].notna().sum(axis=1))
+        self.assertEqual(one["pvalue"].idxmin(), "gene_0")
+        self.assertAlmostEqual(one.loc["gene_0", "pvalue"], 2 / 301)
+
+    def test_bootstrap(self):
+
+        res = resampling.bootstrap(self.cohort, self.matrix, n_resamples=200, batch_size=64, n_jobs=2)
+
+        self.assertTrue((res["ci_low"] <= res["mean"]).all() and (res["mean"] <= res["ci_high"]).all())
+        pd.testing.assert_frame_equal(res, resampling.bootstrap(self.cohort, self.matrix, n_resamples=200,
+                                                                batch_size=64, n_jobs=1))
+        with self.assertRaises(ValueError):
+            resampling.bootstrap(self.cohort, self.matrix, statistic="fraction")
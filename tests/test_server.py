@@ -0,0 +1,108 @@
+import os
+import inspect
+import tempfile
+import http.client
+import threading
+import unittest
+import pandas as pd
+from CanDI import candi
+from CanDI.server import Client, ServerError
+from CanDI.server.server import Server, make_server
+
+
+class testServer(unittest.TestCase):
+
+    def setUp(self):
+
+        self.server = Server(["rnaseq_reads"], max_concurrency=2, queue_timeout=0.1)
+        self.reads = candi.data.rnaseq_reads
+        self.socket_path = os.path.join(tempfile.mkdtemp(), "candi.sock")
+        self.httpd = [make_server(self.server, port=0), make_server(self.server, socket_path=self.socket_path)]
+        for httpd in self.httpd:
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+
+        for httpd in self.httpd:
+            httpd.shutdown()
+            httpd.server_close()
+        candi.data.unload("rnaseq_reads")
+        candi.data.expression = None
+
+    def test_queries(self):
+
+        port = self.httpd[0].server_address[1]
+        for client in [Client("http://127.0.0.1:{}".format(port)), Client(self.socket_path)]:
+            gene = client.Gene("GENE3")
+            pd.testing.assert_series_equal(gene.rnaseq_reads, self.reads.loc["GENE3"])
+            self.assertEqual(gene.symbol, "GENE3")
+            self.assertIn("essential", dir(gene))
+
+            table = Client(client.address, as_arrow=True).Gene("GENE3").rnaseq_reads
+            self.assertEqual(table.num_rows, self.reads.shape[1])
+
+        #every query after the first of its kind is served from the response cache
+        self.assertEqual(client.stats()["responses"]["hits"], 4)
+
+    def test_errors(self):
+
+        client = Client(self.socket_path)
+        with self.assertRaises(AttributeError):
+            client.Gene("GENE3")._grabber
+        with self.assertRaises(KeyError):
+            client.query("Data", attr="genes")
+        with self.assertRaises(AttributeError):
+            client.Gene("GENE3").gene_effect #not installed
+
+        #requests waiting longer than queue_timeout for a free slot are rejected
+        for _ in range(2):
+            self.server._slots.acquire()
+        try:
+            with self.assertRaises(ServerError):
+                client.Gene("GENE4").rnaseq_reads
+        finally:
+            for _ in range(2):
+                self.server._slots.release()
+        self.assertEqual(client.stats()["rejected"], 1)
+
+    def test_unloaded_datasets(self):
+
+        client = Client(self.socket_path)
+        candi.data.expression = candi.data.path("rnaseq_reads") #installed but not loaded
+        with self.assertRaisesRegex(ValueError, "expression is not loaded on the server"):
+            client.Gene("GENE3").expressed()
+        with self.assertRaisesRegex(ValueError, "expression is not loaded on the server"):
+            client.Gene("GENE3").expression
+
+        candi.data.unload("rnaseq_reads")
+        with self.assertRaisesRegex(ValueError, "rnaseq_reads is not loaded on the server"):
+            client.Gene("GENE3").top(dataset="rnaseq_reads")
+        candi.data.load("rnaseq_reads")
+
+    def test_no_coroutines(self):
+
+        client = Client(self.socket_path)
+        for entity, methods in client._api.items():
+            cls = getattr(candi, entity)
+            self.assertFalse([i for i in methods if inspect.iscoroutinefunction(getattr(cls, i))])
+        self.assertNotIn("aexpressed", dir(client.Gene("GENE3")))
+        self.assertIn("expressed", dir(client.Gene("GENE3")))
+
+        status, _, _ = self.server.query({"entity": "Gene", "args": ["GENE3"], "method": "aexpressed"})
+        self.assertEqual(status, 400)
+
+    def test_read_only(self):
+
+        client = Client(self.socket_path)
+        path = os.path.join(tempfile.mkdtemp(), "x.parquet")
+        self.assertNotIn("export", client._api["Gene"])
+        with self.assertRaises(AttributeError):
+            client.query("Gene", ["GENE3"], method="export", method_args=["rnaseq_reads", path])
+        self.assertFalse(os.path.exists(path))
+
+        #only JSON posts are answered, browsers can not send them cross site without a preflight
+        connection = http.client.HTTPConnection("127.0.0.1", self.httpd[0].server_address[1])
+        connection.request("POST", "/query", body=b'{"entity": "Gene", "args": ["GENE3"], "attr": "symbol"}',
+                           headers={"Content-Type": "text/plain"})
+        self.assertEqual(connection.getresponse().status, 415)
+        connection.close()
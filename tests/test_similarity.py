@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from CanDI import candi
+from CanDI.pipelines import similarity
+
+
+class testSimilarity(unittest.TestCase):
+
+    def setUp(self):
+
+        #two groups of lines sharing a profile, plus noise
+        rng = np.random.default_rng(0)
+        lines = list(candi.data.cell_lines.index)
+        profiles = rng.normal(size=(2, 200))
+        values = profiles[np.arange(len(lines)) % 2].T + rng.normal(scale=0.3, size=(200, len(lines)))
+        candi.data.expression = pd.DataFrame(values, index=["GENE{}".format(i) for i in range(200)], columns=lines)
+        self.lines = lines
+
+    def tearDown(self):
+
+        candi.data.expression = None
+
+    def test_embedding(self):
+
+        values = candi.data.expression.to_numpy().T
+        values = values - values.mean(axis=0)
+        u, s, vt = similarity.randomized_svd(values, 5)
+        np.testing.assert_allclose(s, np.linalg.svd(values, compute_uv=False)[:5], rtol=1e-6)
+
+        coordinates = similarity.embedding("expression", n_components=5)
+        self.assertEqual(coordinates.shape, (len(self.lines), 5))
+
+    def test_similar(self):
+
+        index = similarity.similarity_index("expression", n_components=5)
+        self.assertIs(similarity.similarity_index("expression", n_components=5), index)
+
+        found = similarity.similar(self.lines[0], k=5)
+        self.assertEqual(len(found), 5)
+        self.assertNotIn(self.lines[0], found.index)
+        self.assertTrue(all(self.lines.index(i) % 2 == 0 for i in found.index))
+        self.assertTrue(found.is_monotonic_decreasing)
+
+        within = self.lines[1:4]
+        found = similarity.similar(self.lines[0], k=5, within=within, metric="euclidean")
+        self.assertEqual(found.index[0], self.lines[2]) #the only line of the same group
+        self.assertEqual(set(found.index), set(within))
+        self.assertTrue(found.is_monotonic_increasing)
+
+    def test_persisted(self):
+
+        candi.data.load("rnaseq_reads")
+        try:
+            index = similarity.similarity_index("rnaseq_reads", n_components=3)
+
+            #a new kernel reads the embedding written next to the dataset
+            similarity._indexes.clear()
+            with mock.patch.object(similarity, "embedding", side_effect=AssertionError("embedded again")):
+                again = similarity.similarity_index("rnaseq_reads", n_components=3)
+            self.assertIsNot(again, index)
+            np.testing.assert_array_equal(again.coordinates, index.coordinates)
+            self.assertEqual(list(again.lines), list(index.lines))
+        finally:
+            candi.data.unload("rnaseq_reads")
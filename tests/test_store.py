@@ -0,0 +1,98 @@
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from CanDI.setup import manager
+from CanDI.setup.store import ReleaseStore
+from CanDI.candi.data import Data
+from .conftest import make_install
+
+
+class testReleaseStore(unittest.TestCase):
+
+    def setUp(self):
+
+        self.root = tempfile.mkdtemp()
+        self.install = os.path.join(self.root, "install")
+        self.reads = make_install(self.install)
+        self.store = ReleaseStore(os.path.join(self.root, "store"))
+        self.store.import_release("21Q4", os.path.join(self.install, "data/config.ini"))
+
+    def tearDown(self):
+
+        shutil.rmtree(self.root)
+
+    def test_open_release(self):
+
+        os.environ["CANDI_STORE"] = str(self.store.root)
+        try:
+            data = Data(release="21Q4")
+        finally:
+            del os.environ["CANDI_STORE"]
+
+        self.assertEqual(data.release, "21Q4")
+        pd.testing.assert_frame_equal(data.load("rnaseq_reads"), self.reads)
+        self.assertIn("ACH-000000", data.cell_lines.index)
+
+    def test_identical_files_are_shared(self):
+
+        self.store.import_release("22Q1", os.path.join(self.install, "data/config.ini"))
+
+        old = self.store.depmap_path("21Q4") / "CCLE_RNAseq_reads.csv"
+        new = self.store.depmap_path("22Q1") / "CCLE_RNAseq_reads.csv"
+        self.assertEqual(self.store.releases(), ["21Q4", "22Q1"])
+        self.assertTrue(os.path.samefile(old, new))
+
+        self.store.remove("22Q1")
+        self.assertTrue(old.exists())
+
+    def test_sync_fetches_changed_files_only(self):
+
+        unchanged = self.store.manifest("21Q4")["CCLE_RNAseq_reads.csv"]["checksum"]
+        fetched = []
+
+        def fetch(name, directory):
+            fetched.append(name)
+            path = os.path.join(directory, name)
+            with open(path, "w") as f:
+                f.write("new content")
+            return path
+
+        self.store.sync("22Q1", {"CCLE_RNAseq_reads.csv": unchanged, "CCLE_expression.csv": None}, fetch)
+
+        self.assertEqual(fetched, ["CCLE_expression.csv"])
+        self.assertTrue((self.store.depmap_path("22Q1") / "CCLE_RNAseq_reads.csv").exists())
+
+    def test_reading_does_not_write(self):
+
+        store = ReleaseStore(os.path.join(self.root, "missing"))
+        self.assertEqual(store.releases(), [])
+        self.assertEqual(store.manifest("21Q4"), {})
+        self.assertFalse(os.path.exists(store.root))
+
+    def test_dataverse_only_hosts_21Q4(self):
+
+        with self.assertRaises(ValueError):
+            manager.DataverseDepMap(manager_path=self.install, release="22Q1")
+
+    def test_shared_files_are_not_rewritten(self):
+
+        self.store.import_release("22Q1", os.path.join(self.install, "data/config.ini"))
+        old = self.store.depmap_path("21Q4") / "CCLE_RNAseq_reads.csv"
+        new = self.store.depmap_path("22Q1") / "CCLE_RNAseq_reads.csv"
+        self.assertFalse(os.stat(old).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+        #formatting a file of one release replaces it there only
+        table = pd.DataFrame({"Hugo_Symbol": ["GENE1"], "DepMap_ID": ["ACH-000001"]})
+        manager.BroadDepMap(manager_path=self.install).format_depmap_data(table, str(new), "21Q4")
+
+        self.assertFalse(os.path.samefile(old, new))
+        pd.testing.assert_frame_equal(pd.read_csv(old, index_col=0), self.reads)
+        self.assertEqual(list(pd.read_csv(new).columns), ["gene", "DepMap_ID"])
+
+    def test_remove_unknown_release(self):
+
+        with self.assertRaisesRegex(ValueError, "Release 22Q1 is not in the store"):
+            self.store.remove("22Q1")
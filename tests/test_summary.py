@@ -0,0 +1,82 @@
+import os
+import unittest
+from unittest import mock
+import pandas as pd
+import numpy as np
+from CanDI import candi
+from CanDI.pipelines import summary
+from CanDI.structures.memo import memo
+
+
+class testSummary(unittest.TestCase):
+
+    def setUp(self):
+
+        self.reads = candi.data.load("rnaseq_reads")
+
+    def tearDown(self):
+
+        candi.data.unload("rnaseq_reads")
+
+    def test_cube(self):
+
+        cube = summary.summary_cube(datasets=["rnaseq_reads"], by=("primary_disease",), chunk_size=7)
+        labels = candi.data.cell_lines.primary_disease.reindex(self.reads.columns)
+        grouped = self.reads.T.groupby(labels)
+
+        lung = cube.xs(("primary_disease", "Lung Cancer"), level=("by", "group")).loc[self.reads.index]
+        np.testing.assert_allclose(lung.rnaseq_reads_mean, grouped.mean().loc["Lung Cancer"])
+        np.testing.assert_allclose(lung.rnaseq_reads_median, grouped.median().loc["Lung Cancer"])
+        np.testing.assert_allclose(lung.rnaseq_reads_sd, grouped.std().loc["Lung Cancer"])
+        self.assertTrue((lung.rnaseq_reads_n == 6).all())
+
+        #served from memory until the dataset is reloaded
+        self.assertIs(summary.summary_cube(datasets=["rnaseq_reads"], by=("primary_disease",)), cube)
+
+    @mock.patch.object(memo, "enabled", False) #the cube file is written whether or not the memo is on
+    def test_persisted(self):
+
+        cube = summary.summary_cube()
+        self.assertIn("rnaseq_reads_mean", cube.columns) #every installed matrix is summarized by default
+
+        #a new kernel reads the cube written next to the datasets instead of aggregating them again
+        summary._cubes.clear()
+        with mock.patch.object(summary, "_aggregate", side_effect=AssertionError("aggregated again")):
+            pd.testing.assert_frame_equal(summary.summary_cube(), cube)
+
+        #until a source file changes
+        summary._cubes.clear()
+        path = candi.data.path("rnaseq_reads")
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with mock.patch.object(summary, "_aggregate", side_effect=AssertionError("aggregated again")):
+            with self.assertRaises(AssertionError):
+                summary.summary_cube()
+
+    def test_unknown_group(self):
+
+        with self.assertRaisesRegex(ValueError, "Kidney Cancer is not a primary_disease"):
+            summary.group_summary("primary_disease", "Kidney Cancer")
+        with self.assertRaisesRegex(KeyError, "NOTAGENE"):
+            summary.gene_summary("NOTAGENE")
+
+    def test_cohort(self):
+
+        lines = list(self.reads.columns[:5])
+        out = summary.cohort_summary(lines, datasets=["rnaseq_reads"])
+
+        np.testing.assert_allclose(out.rnaseq_reads_mean, self.reads[lines].mean(axis=1))
+        self.assertEqual(list(out.index), list(self.reads.index))
+
+    def test_mutation_frequency(self):
+
+        mutations = pd.DataFrame({"gene": ["A", "A", "B", "A"],
+                                  "DepMap_ID": ["l1", "l2", "l1", "l3"],
+                                  "Variant_Classification": ["Missense_Mutation", "Nonsense_Mutation", "Silent",
+                                                             "Missense_Mutation"]})
+        labels = {"primary_disease": pd.Series({"l1": "x", "l2": "x", "l3": "y"})}
+
+        out = summary._mutation_frequency(mutations, labels).mutation_frequency
+        self.assertEqual(out.loc[("A", "primary_disease", "x")], 1.0)
+        self.assertEqual(out.loc[("A", "primary_disease", "y")], 1.0)
+        self.assertNotIn("B", out.index.get_level_values("gene"))
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import numpy as np
+from CanDI.candi.data import Data
+from CanDI.setup import synthetic, ingest
+from CanDI.structures import intervals
+
+
+class testSynthetic(unittest.TestCase):
+
+    def setUp(self):
+
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.root)
+
+    def test_make_release(self):
+
+        config_path = synthetic.make_release(self.root, n_genes=120, n_lines=16, block_size=50)
+        data = Data(config_path)
+
+        self.assertEqual(data.cell_lines.shape[0], 16)
+        for key in synthetic.MATRICES:
+            df = data.load(key)
+            self.assertEqual(df.shape, (120, 16))
+            self.assertEqual(list(df.columns), list(data.cell_lines.index))
+            self.assertTrue(df.index.isin(data.genes.index).all())
+
+        effect, dependency = data.gene_effect, data.gene_dependency
+        self.assertTrue(((dependency > 0.5) == (effect < -0.5)).all().all())
+        self.assertTrue(pd.api.types.is_integer_dtype(data.rnaseq_reads.dtypes.iloc[0]))
+
+        mutations = data.load("mutations")
+        self.assertTrue(mutations.DepMap_ID.isin(data.cell_lines.index).all())
+        #the synthetic tables already have the formatted schema
+        self.assertEqual(list(ingest.format_table(mutations).columns), list(mutations.columns))
+        self.assertTrue({"LeftGene", "RightGene", "LeftEnsemblID"} <= set(data.load("fusions").columns))
+
+    def test_locations_and_coordinates(self):
+
+        data = Data(synthetic.make_release(self.root, n_genes=200, n_lines=8))
+        self.assertFalse(data.locations.duplicated(["gene", "location"]).any())
+
+        #mutations of a gene fall inside the coordinates gene_info gives it
+        coordinates = intervals.gene_coordinates(data.genes)
+        mutations = data.load("mutations").join(coordinates, on="gene")
+        self.assertTrue((mutations.Chromosome == mutations.chromosome).all())
+        self.assertTrue(mutations.Start_position.between(mutations.start, mutations.end).all())
+
+    def test_reproducible(self):
+
+        first = synthetic.make_release(os.path.join(self.root, "a"), n_genes=40, n_lines=6)
+        second = synthetic.make_release(os.path.join(self.root, "b"), n_genes=40, n_lines=6,
+                                        file_format="parquet")
+
+        a, b = Data(first), Data(second)
+        pd.testing.assert_frame_equal(a.load("gene_effect"), b.load("gene_effect"), check_names=False)
+        columns = ["primary_disease", "lineage", "sex", "COSMICID"]
+        pd.testing.assert_frame_equal(a.cell_lines[columns], b.cell_lines[columns])
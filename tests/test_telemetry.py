@@ -0,0 +1,88 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import tracemalloc
+import numpy as np
+from CanDI.candi.data import Data
+from CanDI.structures import telemetry
+from .conftest import make_install
+
+
+class testTelemetry(unittest.TestCase):
+
+    def setUp(self):
+
+        self.root = tempfile.mkdtemp()
+        self.reads = make_install(self.root)
+        self.data = Data(os.path.join(self.root, "data/config.ini"))
+
+    def tearDown(self):
+
+        telemetry.disable()
+        telemetry.reset()
+        shutil.rmtree(self.root)
+
+    def test_disabled(self):
+
+        self.data.load("rnaseq_reads")
+        self.assertTrue(telemetry.stats().empty)
+
+    def test_profile(self):
+
+        with telemetry.profile(trace=True) as prof:
+            self.data.load("rnaseq_reads")
+        self.data.unload("rnaseq_reads")
+        self.data.load("rnaseq_reads") #outside of the scope
+
+        stats = prof.stats()
+        rec = stats.loc[("Data.load", "rnaseq_reads")]
+        self.assertEqual(rec.calls, 1)
+        self.assertEqual((rec.rows, rec.columns), self.reads.shape)
+        self.assertEqual(rec.bytes, self.reads.shape[0] * self.reads.shape[1] * 8)
+        self.assertGreater(rec.wall_s, 0)
+        self.assertFalse(telemetry._state.enabled)
+
+        path = prof.to_chrome_trace(os.path.join(self.root, "trace.json"))
+        with open(path) as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual([i["name"] for i in events], ["Data.load"])
+
+    def test_global(self):
+
+        telemetry.enable()
+        with telemetry.profile() as prof:
+            self.data.load("rnaseq_reads")
+        self.data.unload("rnaseq_reads")
+        self.data.load("rnaseq_reads")
+
+        self.assertEqual(prof.stats().calls.sum(), 1)
+        self.assertEqual(telemetry.stats().calls.sum(), 2)
+
+        metrics = telemetry.to_openmetrics()
+        self.assertIn('candi_calls_total{function="Data.load",dataset="rnaseq_reads"} 2', metrics)
+        self.assertTrue(metrics.endswith("# EOF\n"))
+
+    def test_memory(self):
+
+        @telemetry.instrument("temporary")
+        def temporary(): #frees everything it allocates
+            return float(np.ones(10**6).sum())
+
+        telemetry.enable(memory=True)
+        with telemetry.profile(memory=True) as prof:
+            telemetry.disable()
+            self.assertTrue(tracemalloc.is_tracing()) #still recorded by the open profile
+            temporary()
+        self.assertFalse(tracemalloc.is_tracing())
+
+        self.assertGreaterEqual(prof.stats().loc[("temporary", ""), "allocated"], 8 * 10**6)
+
+    def test_openmetrics_escapes_labels(self):
+
+        telemetry.enable()
+        telemetry.instrument("query", label=lambda args: args[0])(len)('Gene("TP53")\\\n')
+
+        self.assertIn('candi_calls_total{function="query",dataset="Gene(\\"TP53\\")\\\\\\n"} 1',
+                      telemetry.to_openmetrics())